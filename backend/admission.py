@@ -0,0 +1,552 @@
+# backend/admission.py
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+from . import metrics
+from . import resilience
+
+# --- Configuration ---
+ADMISSION_ENABLED = os.environ.get("RECETTE_ADMISSION", "1").lower() in ("1", "true", "yes")
+# "memory" (per instance) or "sqlite" (shared by every process using the same file).
+ADMISSION_BACKEND = os.environ.get("RECETTE_ADMISSION_BACKEND", "memory").lower()
+# Defaults to recette-admission.db in the temp directory (resolved on first use; probing it is slow).
+ADMISSION_DB_PATH = os.environ.get("RECETTE_ADMISSION_DB_PATH", "")
+# Requests allowed to hold each model at once, e.g. "pro=8,flash=16"; unlisted models use the default.
+MODEL_MAX_IN_FLIGHT = os.environ.get("RECETTE_MODEL_MAX_IN_FLIGHT", "pro=8,flash=16")
+DEFAULT_MAX_IN_FLIGHT = 8
+# Requests allowed to wait for a slot per model; beyond this they are shed.
+ADMISSION_MAX_QUEUE = int(os.environ.get("RECETTE_ADMISSION_MAX_QUEUE", "32"))
+# How long a queued request waits before it is shed (also capped by its deadline).
+ADMISSION_QUEUE_SECONDS = float(os.environ.get("RECETTE_ADMISSION_QUEUE_SECONDS", "2"))
+# Token bucket per client: sustained requests per minute and burst size. 0 disables it.
+CLIENT_RATE_PER_MINUTE = float(os.environ.get("RECETTE_CLIENT_RATE_PER_MINUTE", "60"))
+CLIENT_BURST = float(os.environ.get("RECETTE_CLIENT_BURST", "30"))
+# Slots held by a process that died are freed after this long (sqlite backend).
+SLOT_LEASE_SECONDS = 120.0
+# Proxies we trust to append the caller's address to X-Forwarded-For (Cloud
+# Functions' front end is one). 0 uses the socket address only.
+TRUSTED_PROXY_HOPS = int(os.environ.get("RECETTE_TRUSTED_PROXY_HOPS", "1"))
+# Idle buckets are full again and can be dropped; past this many, the least
+# recently used go too (at worst a client gets a fresh burst).
+MAX_CLIENT_BUCKETS = int(os.environ.get("RECETTE_MAX_CLIENT_BUCKETS", "10000"))
+# Clients may name themselves (e.g. an install ID). The name only labels the
+# caller within its address; it never gets a bucket of its own.
+CLIENT_HEADER = "X-Recette-Client"
+
+# Lower numbers are admitted first when a model is saturated.
+PRIORITY_CLASSES = {"interactive": 0, "standard": 1, "bulk": 2}
+HANDLER_PRIORITIES = {
+    "chat_request": "interactive",
+    "meal_suggestion_request": "interactive",
+    "healthify_recipe_request": "interactive",
+    "review_text": "interactive",
+    "recipe_analysis_request": "standard",
+    "find_similar_request": "standard",
+    "inventory_import_request": "bulk",
+    "find_duplicates_request": "bulk",
+    "batch_request": "bulk",
+    "bulk_import_request": "bulk",
+}
+# Handlers that never reach a model, so they skip the in-flight limit. Batches
+# and bulk imports take slots per item instead of for the whole request.
+MODEL_FREE_HANDLERS = {"nutrition_request", "cache_stats_request", "routing_stats_request", "admission_stats_request",
+                       "job_status_request", "batch_request", "bulk_import_request", "context_upload_request"}
+# Cheap reads that don't count against the client's rate limit (job polling, stats).
+UNMETERED_HANDLERS = {"job_status_request", "cache_stats_request", "routing_stats_request", "admission_stats_request"}
+
+
+class Rejected(Exception):
+    """A request shed with 429; retry_after is the suggested wait in whole seconds."""
+
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message, 429)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+def _parse_limits(text):
+    limits = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+# --- Backends ---
+# Both keep token buckets per client and slot leases per model. Queueing and
+# priorities are handled per instance by the Governor on top.
+
+class MemoryBackend:
+    def __init__(self, max_buckets=MAX_CLIENT_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._slots = {}
+
+    def _evict_buckets(self, rate, burst, now):
+        """Drops buckets that have refilled, then the least recently used if still over the cap."""
+        refill_seconds = burst / rate
+        for client in [c for c, (_, updated_at) in self._buckets.items() if now - updated_at >= refill_seconds]:
+            del self._buckets[client]
+        overflow = len(self._buckets) - self.max_buckets + 1
+        if overflow > 0:
+            oldest = sorted(self._buckets, key=lambda c: self._buckets[c][1])[:overflow]
+            for client in oldest:
+                del self._buckets[client]
+
+    def take_tokens(self, client, cost, rate, burst, now):
+        """Takes cost tokens if available. Returns 0, or the seconds until they will be."""
+        with self._lock:
+            if client not in self._buckets and len(self._buckets) >= self.max_buckets:
+                self._evict_buckets(rate, burst, now)
+            tokens, updated_at = self._buckets.get(client, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= cost:
+                self._buckets[client] = (tokens - cost, now)
+                return 0.0
+            self._buckets[client] = (tokens, now)
+            return (cost - tokens) / rate
+
+    def try_acquire(self, model, limit, lease_id, now):
+        with self._lock:
+            leases = self._slots.setdefault(model, set())
+            if len(leases) >= limit:
+                return False
+            leases.add(lease_id)
+            return True
+
+    def release(self, model, lease_id):
+        with self._lock:
+            self._slots.get(model, set()).discard(lease_id)
+
+    def in_flight(self):
+        with self._lock:
+            return {model: len(leases) for model, leases in self._slots.items()}
+
+
+class SqliteBackend:
+    """
+    A local stand-in for a shared store (Redis, Memorystore): every process
+    pointing at the same file shares the buckets and slots. Slot leases
+    expire, so a crashed process can't hold a model forever.
+    """
+
+    def __init__(self, path=ADMISSION_DB_PATH):
+        import sqlite3
+        import tempfile
+        path = path or os.path.join(tempfile.gettempdir(), "recette-admission.db")
+        self._lock = threading.Lock()
+        self._takes = 0
+        # Autocommit mode; each operation runs in its own BEGIN IMMEDIATE transaction.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS buckets (
+                    client TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS slots (
+                    lease_id TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def take_tokens(self, client, cost, rate, burst, now):
+        # Wall-clock time, since other processes share the rows.
+        now = time.time()
+
+        def take(conn):
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE client = ?", (client,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+            if not wait:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (client, tokens, updated_at) VALUES (?, ?, ?)", (client, tokens, now))
+            if self._takes % 1000 == 0:
+                # Refilled buckets carry no state.
+                conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - burst / rate,))
+            return wait
+
+        self._takes += 1
+        return self._transaction(take)
+
+    def try_acquire(self, model, limit, lease_id, now):
+        now = time.time()
+
+        def acquire(conn):
+            conn.execute("DELETE FROM slots WHERE expires_at < ?", (now,))
+            (held,) = conn.execute("SELECT COUNT(*) FROM slots WHERE model = ?", (model,)).fetchone()
+            if held >= limit:
+                return False
+            conn.execute("INSERT INTO slots (lease_id, model, expires_at) VALUES (?, ?, ?)", (lease_id, model, now + SLOT_LEASE_SECONDS))
+            return True
+
+        return self._transaction(acquire)
+
+    def release(self, model, lease_id):
+        self._transaction(lambda conn: conn.execute("DELETE FROM slots WHERE lease_id = ?", (lease_id,)))
+
+    def in_flight(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT model, COUNT(*) FROM slots WHERE expires_at >= ? GROUP BY model", (time.time(),)).fetchall()
+        return dict(rows)
+
+
+# --- Governor ---
+
+class Lease:
+    """
+    The model slots held by one request: one per model it actually calls,
+    taken on first use (a cascade that escalates also queues for the larger
+    model). release() frees them all and is idempotent.
+    """
+
+    def __init__(self, governor, priority_name, wait_seconds=None):
+        self._governor = governor
+        self.priority_name = priority_name
+        self.wait_seconds = wait_seconds
+        self._held = {}
+        self._lock = threading.Lock()
+        self._released = False
+        # Set by admit(): restores the context's previous lease on release.
+        self._context_token = None
+
+    @property
+    def model(self):
+        with self._lock:
+            return next(iter(self._held), None)
+
+    def hold(self, model):
+        """Takes a slot on model unless this request already holds one. Raises Rejected."""
+        with self._lock:
+            if self._released or model in self._held:
+                return
+        lease_id = self._governor.acquire(model, self.priority_name, self.wait_seconds)
+        acquired_at = time.monotonic()
+        with self._lock:
+            keep = not self._released and model not in self._held
+            if keep:
+                self._held[model] = (lease_id, acquired_at)
+        if not keep:
+            # Another thread of this request got there first (or the request ended).
+            self._governor.release(model, lease_id, acquired_at)
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+            held, self._held = self._held, {}
+            context_token, self._context_token = self._context_token, None
+        for model, (lease_id, acquired_at) in held.items():
+            self._governor.release(model, lease_id, acquired_at)
+        if context_token is not None:
+            try:
+                # A pooled thread must not keep a released lease as its current one.
+                _current_lease.reset(context_token)
+            except ValueError:
+                # Released from another context (e.g. a finished stream); admit's context ended with it.
+                pass
+
+    def hold_until_done(self, events):
+        """Wraps a streamed response so the slots are held until it finishes (or the client goes away)."""
+        try:
+            yield from events
+        finally:
+            self.release()
+
+
+class _NoLease:
+    model = None
+
+    def hold(self, model):
+        pass
+
+    def release(self):
+        pass
+
+    def hold_until_done(self, events):
+        return events
+
+
+NO_LEASE = _NoLease()
+# The lease of the request (or batch item, or bulk recipe) running in this context.
+_current_lease = contextvars.ContextVar("recette_lease", default=NO_LEASE)
+
+
+class Governor:
+    """
+    Per-model in-flight limits with a short priority queue in front.
+    A request that can't get a slot waits in the model's queue, ordered by
+    priority class and then arrival. When the queue is full, a newcomer
+    displaces the lowest-priority waiter if it outranks it, and is shed
+    with 429 otherwise. Waiters that time out are shed too.
+    """
+
+    def __init__(self, backend, limits=None, max_queue=ADMISSION_MAX_QUEUE, queue_seconds=ADMISSION_QUEUE_SECONDS):
+        self.backend = backend
+        self.limits = limits if limits is not None else _parse_limits(MODEL_MAX_IN_FLIGHT)
+        self.max_queue = max_queue
+        self.queue_seconds = queue_seconds
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._sequence = itertools.count()
+        # Smoothed slot hold time per model, for Retry-After estimates.
+        self._hold_seconds = {}
+        self.stats = {"admitted": 0, "queued": 0, "rejected": {}}
+
+    def _limit(self, model):
+        for name, limit in self.limits.items():
+            if name in model:
+                return limit
+        return DEFAULT_MAX_IN_FLIGHT
+
+    def _retry_after(self, model, queued):
+        hold = self._hold_seconds.get(model, 1.0)
+        return hold * (queued + 1) / self._limit(model)
+
+    def _reject(self, message, retry_after, reason, priority):
+        with self._cond:
+            self.stats["rejected"][reason] = self.stats["rejected"].get(reason, 0) + 1
+        metrics.observe_admission_rejected(reason, priority)
+        return Rejected(message, retry_after, reason)
+
+    def acquire(self, model, priority_name, wait_seconds=None):
+        """
+        Takes one of model's slots, waiting in its queue if need be
+        (queue_seconds unless wait_seconds is given), and returns its lease
+        ID for release(). Raises Rejected.
+        """
+        priority = PRIORITY_CLASSES[priority_name]
+        lease_id = os.urandom(16).hex()
+        limit = self._limit(model)
+        started = time.monotonic()
+        wait_seconds = resilience.wait_timeout(self.queue_seconds if wait_seconds is None else wait_seconds)
+
+        # The backend is only called with the condition released: a slow shared
+        # store (sqlite waits up to 5 s on a lock) must not stall every admit and release.
+        with self._cond:
+            queue = self._queues.setdefault(model, [])
+            uncontended = not queue
+        if uncontended and self.backend.try_acquire(model, limit, lease_id, time.monotonic()):
+            with self._cond:
+                self.stats["admitted"] += 1
+            return lease_id
+
+        with self._cond:
+            if wait_seconds <= 0:
+                raise self._reject(f"{model} is at capacity. Try again shortly.", self._retry_after(model, len(queue)), "capacity", priority_name)
+            if len(queue) >= self.max_queue:
+                lowest = max(queue)
+                if lowest[0] <= priority:
+                    raise self._reject(f"{model} is at capacity. Try again shortly.", self._retry_after(model, len(queue)), "queue_full", priority_name)
+                # Displace the lowest-priority waiter; it wakes up to find itself gone.
+                queue.remove(lowest)
+                heapq.heapify(queue)
+                self._cond.notify_all()
+            ticket = (priority, next(self._sequence), lease_id)
+            heapq.heappush(queue, ticket)
+            self.stats["queued"] += 1
+            deadline = started + wait_seconds
+
+        while True:
+            with self._cond:
+                if ticket not in queue:
+                    raise self._reject(f"{model} is at capacity; higher-priority requests came first.",
+                                       self._retry_after(model, len(queue)), "displaced", priority_name)
+                at_head = queue[0] is ticket
+            if at_head and self.backend.try_acquire(model, limit, lease_id, time.monotonic()):
+                with self._cond:
+                    # Someone may have queued ahead of (or displaced) us meanwhile; the slot is ours either way.
+                    if ticket in queue:
+                        queue.remove(ticket)
+                        heapq.heapify(queue)
+                    self.stats["admitted"] += 1
+                    # The next waiter may be able to go too.
+                    self._cond.notify_all()
+                break
+            with self._cond:
+                if ticket not in queue:
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.remove(ticket)
+                    heapq.heapify(queue)
+                    self._cond.notify_all()
+                    raise self._reject(f"{model} is at capacity. Try again shortly.", self._retry_after(model, len(queue)), "queue_timeout", priority_name)
+                # Slots freed by other processes (sqlite backend) aren't signalled, so poll too.
+                self._cond.wait(min(remaining, 0.05))
+
+        metrics.observe_admission_wait(model, priority_name, time.monotonic() - started)
+        return lease_id
+
+    def release(self, model, lease_id, acquired_at):
+        self.backend.release(model, lease_id)
+        held = time.monotonic() - acquired_at
+        with self._cond:
+            previous = self._hold_seconds.get(model, held)
+            self._hold_seconds[model] = 0.8 * previous + 0.2 * held
+            self._cond.notify_all()
+
+    def queue_depths(self):
+        with self._cond:
+            return {model: len(queue) for model, queue in self._queues.items()}
+
+    def get_stats(self):
+        with self._cond:
+            stats = {"admitted": self.stats["admitted"], "queued": self.stats["queued"], "rejected": dict(self.stats["rejected"])}
+            queue_depth = {model: len(queue) for model, queue in self._queues.items()}
+        return {**stats, "queue_depth": queue_depth, "in_flight": self.backend.in_flight(), "limits": dict(self.limits)}
+
+
+_default_governor = None
+_default_lock = threading.Lock()
+
+def get_governor():
+    """Returns the process-wide governor, opening its backend on first use."""
+    global _default_governor
+    with _default_lock:
+        if _default_governor is None:
+            backend = SqliteBackend() if ADMISSION_BACKEND == "sqlite" else MemoryBackend()
+            _default_governor = Governor(backend)
+            metrics.register(metrics.Gauge("recette_admission_queue_depth", "Requests waiting for a model slot.", ("model",),
+                                           lambda: {(m,): n for m, n in _default_governor.queue_depths().items()}))
+            metrics.register(metrics.Gauge("recette_admission_in_flight", "Requests holding a model slot.", ("model",),
+                                           lambda: {(m,): n for m, n in _default_governor.backend.in_flight().items()}))
+        return _default_governor
+
+
+# --- Entry Points ---
+
+def client_address(request):
+    """
+    The caller's address as our trusted proxies saw it: the entry they
+    appended to X-Forwarded-For, never one the caller could have written.
+    """
+    hops = [hop.strip() for hop in request.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    if TRUSTED_PROXY_HOPS > 0 and len(hops) >= TRUSTED_PROXY_HOPS:
+        return hops[-TRUSTED_PROXY_HOPS]
+    return request.remote_addr or "unknown"
+
+def client_id(request):
+    """The rate-limit key: the caller's address. Changing headers can't buy a new bucket."""
+    return "ip:" + client_address(request)
+
+def client_scope(request):
+    """
+    The caller's address plus its self-declared name, for per-client state
+    such as caches. Narrower than client_id, so never used for limits.
+    """
+    named = request.headers.get(CLIENT_HEADER)
+    return client_id(request) + (f"/client:{named[:128]}" if named else "")
+
+# The client_scope and client_id of the request running in this context,
+# for services that keep per-client state or meter items without seeing the HTTP request.
+_current_client = contextvars.ContextVar("recette_client", default=(None, None))
+
+def start_client(scope, rate_key=None):
+    """Sets the current client scope and rate-limit key. Returns a token for end_client."""
+    return _current_client.set((scope, rate_key))
+
+def end_client(token):
+    _current_client.reset(token)
+
+def current_client():
+    return _current_client.get()[0]
+
+def current_rate_key():
+    return _current_client.get()[1]
+
+def priority_for(handler_key, request_json):
+    """The handler's priority class; a request may lower its own priority (never raise it)."""
+    default = HANDLER_PRIORITIES.get(handler_key, "standard")
+    requested = request_json.get("priority")
+    if requested in PRIORITY_CLASSES and PRIORITY_CLASSES[requested] > PRIORITY_CLASSES[default]:
+        return requested
+    return default
+
+def request_cost(request_json):
+    """
+    Tokens a request takes from its client's bucket at the door: one, or none
+    for polling and stats. Batch and bulk items each take one more as they
+    are admitted (see meter_item), so a large import is paced, not refused.
+    """
+    if any(key in request_json for key in UNMETERED_HANDLERS):
+        return 0
+    return 1
+
+def check_rate(client, cost=1, priority="standard", wait_seconds=0.0):
+    """
+    Takes cost tokens from the client's bucket, waiting up to wait_seconds
+    (capped by the deadline) for them to refill. Raises Rejected with the
+    time until they would be.
+    """
+    if not ADMISSION_ENABLED or CLIENT_RATE_PER_MINUTE <= 0 or cost <= 0 or client is None:
+        return
+    governor = get_governor()
+    rate = CLIENT_RATE_PER_MINUTE / 60
+    if cost > CLIENT_BURST:
+        raise governor._reject("Request is larger than the rate limit allows at once. Split it up.", cost / rate, "rate_limited", priority)
+    give_up_at = time.monotonic() + resilience.wait_timeout(wait_seconds)
+    while True:
+        wait = governor.backend.take_tokens(client, cost, rate, CLIENT_BURST, time.monotonic())
+        if not wait:
+            return
+        if time.monotonic() + wait > give_up_at:
+            raise governor._reject("Rate limit exceeded. Slow down and try again.", wait, "rate_limited", priority)
+        # Other items of the same client may take the refill first; then we wait again.
+        time.sleep(wait)
+
+def meter_item(client, wait_seconds):
+    """Takes one token for a batch or bulk item, waiting for it within wait_seconds. Raises Rejected."""
+    check_rate(client, 1, "bulk", wait_seconds)
+
+def admit(handler_key, request_json, model, wait_seconds=None):
+    """
+    Returns a Lease holding a slot on the request's first model (release it
+    when the response is done), or a no-op lease when admission is off or no
+    model is involved. The lease becomes this context's until it is released,
+    so hold_slot() adds any other model the request goes on to call. Raises
+    Rejected when the model is saturated.
+    """
+    if not (ADMISSION_ENABLED and model is not None and handler_key not in MODEL_FREE_HANDLERS and not request_json.get("developer_mode")):
+        _current_lease.set(NO_LEASE)
+        return NO_LEASE
+    lease = Lease(get_governor(), priority_for(handler_key, request_json), wait_seconds)
+    with metrics.stage("admission"):
+        lease.hold(getattr(model, "_model_name", None) or type(model).__name__)
+    lease._context_token = _current_lease.set(lease)
+    return lease
+
+def hold_slot(model_name):
+    """Called before each model call: makes sure the current request holds a slot on model_name. Raises Rejected."""
+    lease = _current_lease.get()
+    if lease is not NO_LEASE:
+        with metrics.stage("admission"):
+            lease.hold(model_name)
+
+def get_stats():
+    if not ADMISSION_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, "backend": ADMISSION_BACKEND, **get_governor().get_stats()}
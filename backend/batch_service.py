@@ -0,0 +1,150 @@
+# backend/batch_service.py
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import admission
+from . import job_service
+from . import metrics
+from . import model_router
+from .model_registry import models
+
+# --- Configuration ---
+BATCH_MAX_CONCURRENCY = int(os.environ.get("RECETTE_BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.environ.get("RECETTE_BATCH_MAX_ITEMS", "25"))
+BATCH_ITEM_TIMEOUT_SECONDS = float(os.environ.get("RECETTE_BATCH_ITEM_TIMEOUT_SECONDS", "120"))
+# Items queue for model slots at bulk priority; waiting a while is expected.
+BATCH_ADMISSION_WAIT_SECONDS = 30.0
+
+# Envelope fields that sub-requests inherit unless they set their own.
+INHERITED_FIELDS = ("model_choice", "developer_mode", "use_cache")
+
+def handle_batch_request(request_json, dispatch, error_details, handler_for):
+    """
+    Orchestrates a batch of existing sub-requests in one HTTP call:
+    1. Validates the envelope and applies the concurrency/timeout limits.
+    2. Runs every sub-request through admission and the normal router on a
+       bounded pool.
+    3. Returns one result per sub-request, in order, each with its own status,
+       so a single failure or timeout never fails the whole batch.
+    """
+    batch_request = request_json['batch_request']
+    if isinstance(batch_request, list):
+        batch_request = {"requests": batch_request}
+
+    # 1. Extract and validate
+    sub_requests = batch_request.get('requests', [])
+    if not isinstance(sub_requests, list) or not sub_requests:
+        raise Exception("Invalid batch. 'requests' must be a non-empty list.", 400)
+    if len(sub_requests) > BATCH_MAX_ITEMS:
+        raise Exception(f"Invalid batch. At most {BATCH_MAX_ITEMS} requests are allowed.", 400)
+
+    try:
+        max_concurrency = max(1, min(int(batch_request.get('max_concurrency', BATCH_MAX_CONCURRENCY)), BATCH_MAX_CONCURRENCY))
+        item_timeout = float(batch_request.get('item_timeout_seconds', BATCH_ITEM_TIMEOUT_SECONDS))
+    except (TypeError, ValueError):
+        raise Exception("Invalid batch. 'max_concurrency' must be an integer and 'item_timeout_seconds' a number.", 400)
+    if not item_timeout > 0:
+        raise Exception("Invalid batch. 'item_timeout_seconds' must be positive.", 400)
+
+    payloads = []
+    for sub_request in sub_requests:
+        if isinstance(sub_request, dict):
+            inherited = {k: request_json[k] for k in INHERITED_FIELDS if k in request_json}
+            sub_request = {**inherited, **sub_request}
+        payloads.append(sub_request)
+
+    # 2. Run
+    rate_key = admission.current_rate_key()
+
+    def admitted_dispatch(payload):
+        # Each item takes its own rate-limit token and model slot, queued behind interactive traffic.
+        admission.meter_item(rate_key, BATCH_ADMISSION_WAIT_SECONDS)
+        handler_key = handler_for(payload)
+        model = model_router.select_model(handler_key, payload, models)
+        lease = admission.admit(handler_key, {**payload, "priority": "bulk"}, model, wait_seconds=BATCH_ADMISSION_WAIT_SECONDS)
+        try:
+            return dispatch(payload, None, model)
+        finally:
+            lease.release()
+
+    results = run_batch(payloads, admitted_dispatch, error_details, max_concurrency, item_timeout)
+
+    # 3. Report
+    return {
+        "result": results,
+        "error": None,
+        "summary": {
+            "total": len(results),
+            "succeeded": sum(1 for r in results if r["status"] == "ok"),
+            "failed": sum(1 for r in results if r["status"] == "error"),
+            "timed_out": sum(1 for r in results if r["status"] == "timeout"),
+        },
+    }
+
+def _validate_item(payload):
+    if not isinstance(payload, dict):
+        raise Exception("Invalid batch item. Each item must be a JSON object.", 400)
+    if 'batch_request' in payload:
+        raise Exception("Invalid batch item. Batches cannot be nested.", 400)
+
+def run_batch(payloads, dispatch, error_details, max_concurrency, item_timeout):
+    """
+    Dispatches payloads concurrently and collects ordered per-item results.
+    Each item's timeout starts when it begins running, not when it is queued.
+    Python threads can't be killed, so a timed-out item keeps its worker until
+    the handler returns; its late result is discarded.
+    """
+    started_at = {}
+    started_lock = threading.Lock()
+
+    def run_item(index, payload):
+        with started_lock:
+            started_at[index] = time.monotonic()
+        _validate_item(payload)
+        item_started = time.perf_counter()
+        response = dispatch(payload)
+        return response, round((time.perf_counter() - item_started) * 1000, 1)
+
+    results = [None] * len(payloads)
+    executor = ThreadPoolExecutor(max_workers=min(max_concurrency, len(payloads)), thread_name_prefix="batch")
+    try:
+        futures = {executor.submit(metrics.propagate(run_item), i, p): i for i, p in enumerate(payloads)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=_next_timeout(started_at, started_lock, futures, pending, item_timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    response, elapsed_ms = future.result()
+                    results[index] = {"status": "ok", "status_code": 200, "elapsed_ms": elapsed_ms, "response": response}
+                except Exception as e:
+                    message, status_code = error_details(e)
+                    results[index] = {"status": "error", "status_code": status_code, "error": message}
+
+            now = time.monotonic()
+            with started_lock:
+                expired = {f for f in pending if futures[f] in started_at and now - started_at[futures[f]] >= item_timeout}
+            for future in expired:
+                results[futures[future]] = {
+                    "status": "timeout",
+                    "status_code": 504,
+                    "error": f"Request did not finish within {item_timeout:g} seconds.",
+                }
+            pending -= expired
+            # Progress for batches running as an async job.
+            job_service.report_progress(len(results) - len(pending), len(results), f"{len(results) - len(pending)} of {len(results)} requests done")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def _next_timeout(started_at, started_lock, futures, pending, item_timeout):
+    """Seconds until the earliest running item would time out (None if none are running)."""
+    now = time.monotonic()
+    with started_lock:
+        deadlines = [started_at[futures[f]] + item_timeout - now for f in pending if futures[f] in started_at]
+    if not deadlines:
+        # Nothing has started yet; check back shortly for newly started items.
+        return 0.05
+    return max(0.0, min(deadlines))
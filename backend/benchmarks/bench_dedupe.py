@@ -0,0 +1,99 @@
+# backend/benchmarks/bench_dedupe.py
+"""
+Benchmarks library-wide duplicate clustering on synthetic recipe libraries.
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_dedupe
+    python -m backend.benchmarks.bench_dedupe --sizes 1000 10000 50000
+"""
+import argparse
+import json
+import random
+import time
+
+from .. import similarity
+
+BASE_INGREDIENTS = [
+    "flour", "sugar", "butter", "egg", "milk", "salt", "pepper", "chicken breast", "chicken thigh",
+    "garlic", "onion", "tomato", "basil", "olive oil", "rice", "soy sauce", "ginger", "ground beef",
+    "carrot", "potato", "cheddar", "spaghetti", "cream", "lemon", "parsley", "cumin", "black bean",
+    "corn", "spinach", "mushroom", "bacon", "honey", "vanilla", "baking soda", "cinnamon", "paprika",
+    "chili", "coconut milk", "lime", "cilantro", "shrimp", "salmon", "tofu", "broccoli", "bell pepper",
+    "zucchini", "oregano", "thyme", "rosemary", "yogurt", "oat", "almond", "walnut", "pecan", "apple",
+    "banana", "blueberry", "strawberry", "peach", "pork shoulder", "lamb", "turkey", "sausage", "ham",
+    "cabbage", "kale", "leek", "celery", "fennel", "eggplant", "squash", "pumpkin", "sweet potato",
+    "lentil", "chickpea", "quinoa", "couscous", "noodle", "tortilla", "pita", "feta", "mozzarella",
+    "parmesan", "ricotta", "goat cheese", "vinegar", "mustard", "mayonnaise", "ketchup", "sriracha",
+    "miso", "tahini", "peanut butter", "maple syrup", "molasses", "cocoa", "chocolate chip", "raisin",
+]
+VARIETIES = ["", "", "", "red ", "green ", "smoked ", "toasted ", "wild ", "brown ", "white ", "baby ", "roasted "]
+DISH_WORDS = [
+    "soup", "stew", "cake", "bread", "salad", "curry", "pie", "tacos", "stir fry", "roast", "casserole",
+    "pasta", "muffins", "skillet", "bake", "chili", "risotto", "burgers", "bowl", "wraps", "tart",
+    "gratin", "fritters", "dumplings", "noodles", "pancakes", "cookies", "brownies", "kebabs", "frittata",
+]
+STYLE_WORDS = [
+    "spicy", "creamy", "lemon", "garlic", "smoky", "classic", "weeknight", "crispy", "herbed", "honey",
+    "golden", "rustic", "summer", "winter", "thai", "mexican", "italian", "greek", "korean", "cajun",
+    "moroccan", "indian", "french", "southern", "sheet pan", "slow cooker", "one pot", "vegan",
+]
+DESCRIPTORS = ["", "", "fresh ", "chopped ", "large ", "diced "]
+
+
+def make_library(size, duplicate_rate=0.1, seed=7):
+    """
+    Builds a library where about duplicate_rate of the recipes are near-copies
+    of another one (reworded title, reordered or lightly edited ingredients).
+    Returns (recipes, planted_pairs) in the client's candidate recipe shape.
+    """
+    rng = random.Random(seed)
+    recipes, planted = [], set()
+    for recipe_id in range(size):
+        if recipes and rng.random() < duplicate_rate:
+            original = recipes[rng.randrange(len(recipes))]
+            names = [i["name"] for i in json.loads(original["ingredients"])]
+            rng.shuffle(names)
+            if len(names) > 6 and rng.random() < 0.5:
+                names.pop()
+            title = original["title"] if rng.random() < 0.5 else "Easy " + original["title"]
+            planted.add((original["id"], recipe_id))
+        else:
+            main = rng.choice(BASE_INGREDIENTS)
+            title = f"{rng.choice(STYLE_WORDS)} {main} {rng.choice(DISH_WORDS)}".title()
+            names = [main] + [rng.choice(VARIETIES) + n for n in rng.sample(BASE_INGREDIENTS, rng.randint(5, 11))]
+        ingredients = [{"quantity": "1", "quantityNumeric": 1, "unit": "", "name": rng.choice(DESCRIPTORS) + n, "notes": ""} for n in names]
+        recipes.append({"id": recipe_id, "title": title, "ingredients": json.dumps(ingredients)})
+    return recipes, planted
+
+
+def run(size):
+    recipes, planted = make_library(size)
+    started = time.perf_counter()
+    clusters = similarity.cluster_duplicates(recipes)
+    elapsed = time.perf_counter() - started
+
+    found = set()
+    for cluster in clusters:
+        members = cluster["members"]
+        found.update((a, b) for a in members for b in members if a < b)
+    recall = len(planted & found) / len(planted) if planted else 1.0
+    return {
+        "recipes": size,
+        "seconds": round(elapsed, 3),
+        "clusters": len(clusters),
+        "borderline_clusters": sum(1 for c in clusters if c["borderline"]),
+        "planted_pairs": len(planted),
+        "planted_recall": round(recall, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+    for size in args.sizes:
+        print(json.dumps(run(size)))
+
+
+if __name__ == "__main__":
+    main()
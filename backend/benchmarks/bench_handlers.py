@@ -0,0 +1,381 @@
+# backend/benchmarks/bench_handlers.py
+"""
+Benchmarks every router branch of the Cloud Function end to end, offline:
+models are FakeGenerativeModels that replay recorded replies (--recordings,
+written by fake_model.RecordingModel) or synthetic ones, URL imports read
+from a local fixture server, and the Vertex SDK is stubbed if absent.
+
+With the default zero model latency the numbers are the server-side
+overhead we own: prompt building, scraping, local engines, JSON handling.
+Each scenario reports latency percentiles, throughput and a per-stage
+breakdown taken from the Server-Timing header.
+
+Regression gates:
+    --thresholds FILE  absolute limits per scenario (p95_ms, min_rps)
+    --baseline FILE    a previous --output report; fails when a scenario's
+                       p95 grows by more than --max-regression
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_handlers
+    python -m backend.benchmarks.bench_handlers --scenarios chat_long_history --requests 200 --concurrency 8
+    python -m backend.benchmarks.bench_handlers --model-latency-ms 800 --latency-jitter-ms 400
+    RECETTE_MODEL_HEDGE=p95 python -m backend.benchmarks.bench_handlers --model-latency-ms 50 --slow-rate 0.03 --slow-delay-ms 2000 --error-rate 0.05
+    python -m backend.benchmarks.bench_handlers --output report.json --thresholds backend/benchmarks/thresholds.json
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Read at import time by the backend, so set before anything imports it:
+# stage timings on, one log line per request off, no on-disk page cache.
+os.environ.setdefault("RECETTE_METRICS", "1")
+os.environ.setdefault("RECETTE_METRICS_JSON_LOGS", "0")
+os.environ.setdefault("RECETTE_HTTP_CACHE_DIR", "")
+# Every benchmark request comes from one client; don't rate-limit it.
+os.environ.setdefault("RECETTE_CLIENT_RATE_PER_MINUTE", "0")
+
+from .. import fake_model
+from ..prompts import estimate_tokens
+from . import bench_dedupe
+from .fixture_server import FixtureServer, make_recipe
+
+SAMPLE_RECIPE = {
+    "title": "Weeknight Garlic Chicken",
+    "description": "A quick skillet dinner.",
+    "prep_time": "10 mins",
+    "cook_time": "20 mins",
+    "total_time": "30 mins",
+    "servings": "4",
+    "ingredients": [
+        {"quantity": "1.5", "quantityNumeric": 1.5, "unit": "lb", "name": "chicken thigh", "notes": "boneless"},
+        {"quantity": "4", "quantityNumeric": 4, "unit": "cloves", "name": "garlic", "notes": "minced"},
+        {"quantity": "2", "quantityNumeric": 2, "unit": "tbsp", "name": "olive oil", "notes": ""},
+        {"quantity": "1", "quantityNumeric": 1, "unit": "cup", "name": "rice", "notes": ""},
+    ],
+    "instructions": ["Brown the chicken.", "Add the garlic.", "Serve over rice."],
+    "other_timings": [],
+    "tags": ["dinner", "chicken", "quick"],
+    "health_analysis": {"rating": "GREEN", "summary": "Balanced.", "suggestions": []},
+    "nutritional_info": {"calories": "520", "protein_grams": "38"},
+}
+CHAT_REPLY = "You could make a quick frittata with the eggs and spinach you have. " * 12
+_LINE_RE = re.compile(r"^LINE (\d+) \(under: ([^)]*)\): (.*)$", re.M)
+
+
+def synthetic_reply(prompt_parts):
+    """Returns a plausible reply for whichever backend prompt this is."""
+    text = "".join(part for part in prompt_parts if isinstance(part, str))
+    if "'similar_recipe_ids'" in text:
+        candidates = text.split("--- CANDIDATE RECIPES ---", 1)[-1]
+        return json.dumps({"similar_recipe_ids": [int(i) for i in re.findall(r'"id": ?(\d+)', candidates)[:3]]})
+    if "'duplicate_groups'" in text:
+        return json.dumps({"duplicate_groups": []})
+    if "LINE " in text and "inventory parsing API" in text:
+        return json.dumps([
+            {"line_number": int(number), "name": line.split(",")[0].strip(), "quantity": "1", "unit": "",
+             "location_name": None if heading == "none" else heading}
+            for number, heading, line in _LINE_RE.findall(text)
+        ])
+    if "inventory parsing API" in text:
+        return json.dumps([{"name": "milk", "quantity": "1", "unit": "gallon", "location_name": None}])
+    if "meticulous nutritional analyst" in text:
+        return json.dumps({"calories": 120, "protein_grams": 3, "carbohydrates_grams": 20, "sugar_grams": 4, "fat_grams": 3,
+                           "saturated_fat_grams": 1, "sodium_milligrams": 180, "fiber_grams": 2, "cholesterol_milligrams": 0})
+    if "running memory of a conversation" in text:
+        return "The user is planning weeknight dinners and prefers vegetarian dishes."
+    if "Recette, a friendly" in text:
+        return CHAT_REPLY
+    if "refine it into two distinct" in text:
+        return json.dumps({"rules": "Low sodium.", "preferences": "Likes spicy food.", "suggestions": []})
+    return json.dumps(SAMPLE_RECIPE)
+
+
+# --- Scenarios ---
+# Each builder takes the fixture server and returns the request payload, or
+# (body, content_type, headers) for a non-JSON upload.
+# Responses are never served from the response cache, so every request
+# pays for its full path.
+
+def _analysis(recipe_data, execution_mode="single_shot"):
+    return {
+        "use_cache": False,
+        "recipe_analysis_request": {
+            "tasks": ["parse", "generateTags", "healthCheck", "estimateNutrition"],
+            "recipe_data": recipe_data,
+            "dietary_profile": "Low sodium. No shellfish.",
+            "execution_mode": execution_mode,
+        },
+    }
+
+def _recipe_text(number):
+    recipe = make_recipe(number)
+    return "\n".join([recipe["title"], "Ingredients:", *recipe["ingredients"], "Instructions:", *recipe["instructions"]])
+
+def _find_similar(size):
+    def build(server):
+        library, _ = bench_dedupe.make_library(size + 1, seed=size)
+        return {"use_cache": False, "find_similar_request": {"primary_recipe": library[0], "candidate_recipes": library[1:]}}
+    return build
+
+def _inventory_text():
+    rng = random.Random(5)
+    lines = []
+    for heading in ("--- FRIDGE ---", "Pantry:", "In the freezer", "Garage shelf"):
+        lines.append(heading)
+        for _ in range(50):
+            name = rng.choice(bench_dedupe.BASE_INGREDIENTS)
+            style = rng.randrange(4)
+            if style == 0:
+                lines.append(f"- {rng.randint(1, 5)} cans {name}")
+            elif style == 1:
+                lines.append(f"{name.title()} x{rng.randint(1, 3)}")
+            elif style == 2:
+                lines.append(f"* {name}, {rng.choice(bench_dedupe.BASE_INGREDIENTS)} and some {rng.choice(bench_dedupe.BASE_INGREDIENTS)}")
+            else:
+                lines.append(f"{rng.randint(1, 3)} lb {name}")
+    return "\n".join(lines)
+
+def _page_photo(width=4032, height=3024):
+    """A phone-sized JPEG of a printed page: lines of dark word blocks on off-white paper."""
+    import io
+    from PIL import Image, ImageDraw
+    rng = random.Random(4)
+    image = Image.new("RGB", (width, height), (250, 248, 240))
+    draw = ImageDraw.Draw(image)
+    for y in range(300, height - 300, 60):
+        x = 300
+        while x < width - 400:
+            word = rng.randint(40, 200)
+            draw.rectangle([x, y, x + word, y + 25], fill=(30, 30, 30))
+            x += word + 30
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=92)
+    return output.getvalue()
+
+def _chat_history(turns):
+    rng = random.Random(turns)
+    return [
+        {"role": "user" if i % 2 == 0 else "model", "text": " ".join(rng.choices(bench_dedupe.BASE_INGREDIENTS, k=40))}
+        for i in range(turns)
+    ]
+
+def _chat_request():
+    return {
+        "user_message": "What can I cook tonight?",
+        "profile_text": "Vegetarian.",
+        "inventory_text": ", ".join(bench_dedupe.BASE_INGREDIENTS),
+        "chat_history": _chat_history(200),
+    }
+
+SCENARIOS = {
+    "analysis_text": lambda server: _analysis({"text": _recipe_text(1)}),
+    "analysis_text_fan_out": lambda server: _analysis({"text": _recipe_text(1)}, "fan_out"),
+    "analysis_url_jsonld": lambda server: _analysis({"url": server.url("jsonld", 2)}),
+    "analysis_url_html": lambda server: _analysis({"url": server.url("plain", 3)}),
+    "analysis_image": lambda server: _analysis({"image": base64.b64encode(_page_photo()).decode("ascii")}),
+    "analysis_image_upload": lambda server: (
+        _page_photo(), "image/jpeg", {"X-Recette-Request": json.dumps(_analysis({}))},
+    ),
+    "healthify": lambda server: {
+        "healthify_recipe_request": {"recipe_data": SAMPLE_RECIPE, "dietary_profile": "Low sodium. No shellfish."},
+    },
+    "find_similar_100": _find_similar(100),
+    "find_similar_1000": _find_similar(1000),
+    "find_similar_10000": _find_similar(10000),
+    "inventory_import": lambda server: {
+        "use_cache": False,
+        "inventory_import_request": {"text": _inventory_text(), "locations": ["Fridge", "Freezer", "Pantry", "Spice Rack"]},
+    },
+    "meal_suggestion": lambda server: {
+        "meal_suggestion_request": {
+            "inventory": [f"{name} (Pantry)" for name in bench_dedupe.BASE_INGREDIENTS[:60]],
+            "dietary_profile": "Vegetarian. Low sodium.",
+            "user_intent": "Quick dinner for two.",
+        },
+    },
+    "chat_long_history": lambda server: {"chat_request": _chat_request()},
+    "chat_long_history_stream": lambda server: {"chat_request": {**_chat_request(), "stream": "ndjson"}},
+}
+# Scenarios too slow to run --requests times; they run at most this many.
+MAX_REQUESTS = {"find_similar_10000": 10}
+
+
+# --- Runner ---
+
+def install_fake_models(models, responder, latency, jitter, seed, error_rate=0.0, slow_rate=0.0, slow_delay=0.0):
+    """Replaces every registry model with a fake sharing one responder (and fault rates)."""
+    fakes = {}
+    for offset, (key, model) in enumerate(list(models.items())):
+        fakes[key] = models[key] = fake_model.FakeGenerativeModel(
+            response_text=responder,
+            model_name=getattr(model, "_model_name", key),
+            first_token_delay=latency,
+            latency_jitter=jitter,
+            seed=seed + offset,
+            error_rate=error_rate,
+            slow_rate=slow_rate,
+            slow_delay=slow_delay,
+        )
+    return fakes
+
+def _parse_server_timing(header):
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, duration = entry.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def run_scenario(name, payload, api, app, fakes, requests_count, concurrency, warmup):
+    """Sends payload requests_count times at the given concurrency and summarises the results."""
+    import flask
+
+    # Sent as raw JSON: Flask's json= argument sorts keys, which would change
+    # the prompts (and their recording keys) compared with the real client.
+    if isinstance(payload, dict):
+        body, content_type, headers = json.dumps(payload), "application/json", {}
+    else:
+        body, content_type, headers = payload
+
+    def send(_):
+        started = time.perf_counter()
+        with app.test_request_context("/", method="POST", data=body, content_type=content_type, headers=headers):
+            response = app.make_response(api(flask.request))
+            # Streaming bodies are produced lazily; consume them inside the timing.
+            response.get_data()
+        return (time.perf_counter() - started) * 1000, response.status_code, response.headers.get("Server-Timing")
+
+    for i in range(warmup):
+        send(i)
+    calls_before = {name: len(fake.calls) for name, fake in fakes.items()}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(requests_count)))
+    wall_seconds = time.perf_counter() - started
+
+    new_calls = [prompt_parts for name, fake in fakes.items() for prompt_parts in fake.calls[calls_before[name]:]]
+    prompt_tokens = sum(estimate_tokens("".join(part for part in parts if isinstance(part, str))) for parts in new_calls)
+    latencies = sorted(latency for latency, _, _ in results)
+    stage_totals = {}
+    for _, _, header in results:
+        for stage, duration in _parse_server_timing(header).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + duration
+    return {
+        "scenario": name,
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, status, _ in results if status >= 400),
+        "p50_ms": round(_percentile(latencies, 0.50), 2),
+        "p95_ms": round(_percentile(latencies, 0.95), 2),
+        "p99_ms": round(_percentile(latencies, 0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        "rps": round(requests_count / wall_seconds, 1),
+        "model_calls_per_request": round(len(new_calls) / requests_count, 2),
+        "prompt_tokens_per_request": round(prompt_tokens / requests_count, 1),
+        "stages_mean_ms": {stage: round(total / requests_count, 2) for stage, total in stage_totals.items()},
+    }
+
+
+# --- Regression Gates ---
+
+def check_thresholds(report, thresholds):
+    """Returns a message for every scenario outside its absolute limits."""
+    failures = []
+    defaults = thresholds.get("default", {})
+    for result in report:
+        limits = {**defaults, **thresholds.get("scenarios", {}).get(result["scenario"], {})}
+        if result["errors"]:
+            failures.append(f"{result['scenario']}: {result['errors']} request(s) failed")
+        if "p95_ms" in limits and result["p95_ms"] > limits["p95_ms"]:
+            failures.append(f"{result['scenario']}: p95 {result['p95_ms']} ms exceeds {limits['p95_ms']} ms")
+        if "min_rps" in limits and result["rps"] < limits["min_rps"]:
+            failures.append(f"{result['scenario']}: {result['rps']} req/s is below {limits['min_rps']} req/s")
+    return failures
+
+def check_baseline(report, baseline, max_regression):
+    """Returns a message for every scenario whose p95 regressed against the baseline report."""
+    previous = {result["scenario"]: result for result in baseline}
+    failures = []
+    for result in report:
+        before = previous.get(result["scenario"])
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            failures.append(
+                f"{result['scenario']}: p95 {result['p95_ms']} ms vs baseline {before['p95_ms']} ms "
+                f"(+{(result['p95_ms'] / before['p95_ms'] - 1) * 100:.0f}%, allowed +{max_regression * 100:.0f}%)"
+            )
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=50, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="fake model time to first token")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of model calls failing with a retryable 503")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of model calls taking --slow-delay-ms extra")
+    parser.add_argument("--slow-delay-ms", type=float, default=0.0)
+    parser.add_argument("--fetch-delay-ms", type=float, default=0.0, help="fixture server delay per page")
+    parser.add_argument("--recordings", help="JSON Lines file of recorded replies (fake_model.RecordingModel)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the full report here as JSON")
+    parser.add_argument("--thresholds", help="JSON file of absolute per-scenario limits")
+    parser.add_argument("--baseline", help="a previous --output report to compare p95 against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    fake_model.install_fake_vertexai()
+    import flask
+    from .. import main as api_module
+    from ..model_registry import models
+
+    if args.recordings:
+        responder = fake_model.ReplayResponder.load(args.recordings, fallback=synthetic_reply)
+    else:
+        responder = fake_model.ReplayResponder(fallback=synthetic_reply)
+    fakes = install_fake_models(models, responder, args.model_latency_ms / 1000, args.latency_jitter_ms / 1000, args.seed,
+                                args.error_rate, args.slow_rate, args.slow_delay_ms / 1000)
+    app = flask.Flask("bench")
+
+    report = []
+    with FixtureServer(delay=args.fetch_delay_ms / 1000) as server:
+        for name in args.scenarios:
+            payload = SCENARIOS[name](server)
+            result = run_scenario(name, payload, api_module.recipe_analyzer_api, app, fakes,
+                                  min(args.requests, MAX_REQUESTS.get(name, args.requests)), args.concurrency, args.warmup)
+            report.append(result)
+            print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.thresholds:
+        with open(args.thresholds, encoding="utf-8") as f:
+            failures += check_thresholds(report, json.load(f))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures += check_baseline(report, json.load(f), args.max_regression)
+    if args.recordings:
+        print(json.dumps({"recorded_replies": responder.hits, "synthetic_replies": responder.misses}))
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# backend/benchmarks/bench_startup.py
+"""
+Benchmarks cold start of the Cloud Function entry point against a stubbed
+Vertex SDK, comparing lazy startup with the old eager behaviour (importing
+every service and creating every model at import time).
+
+Each scenario runs in a fresh interpreter and reports:
+    import_ms         time to import backend.main
+    first_options_ms  first CORS preflight
+    first_preview_ms  first developer_mode prompt preview (no model call)
+    first_model_ms    first request that reaches a model
+    process_ms        wall time of the whole child process
+
+Run from the repository root:
+    python -m backend.benchmarks.bench_startup
+    python -m backend.benchmarks.bench_startup --runs 5 --sdk-import-ms 1500
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from ..fake_model import install_fake_vertexai
+
+SCENARIOS = ("lazy", "eager")
+SERVICES = (
+    "recipe_analysis_service", "recipe_tools_service", "inventory_service",
+    "profile_service", "healthify_service", "chat_service", "gemini_service", "batch_service",
+)
+
+
+def _call(api, method, payload=None):
+    import flask
+    app = flask.Flask("bench")
+    started = time.perf_counter()
+    with app.test_request_context("/", method=method, json=payload):
+        api(flask.request)
+    return round((time.perf_counter() - started) * 1000, 2)
+
+def run_child(scenario, sdk_import_ms):
+    """Runs one scenario in this (fresh) interpreter and prints its timings as JSON."""
+    # Always the stub, even if the real SDK is installed, so runs are comparable.
+    install_fake_vertexai(sdk_import_ms / 1000, force=True)
+
+    started = time.perf_counter()
+    from backend import main
+    if scenario == "eager":
+        for name in SERVICES:
+            main._service(name)
+        for model in main.models.values():
+            model.resolve()
+    import_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    recipe = {"tasks": ["parse"], "recipe_data": {"text": "1 cup flour\nMix."}}
+    print(json.dumps({
+        "import_ms": import_ms,
+        "first_options_ms": _call(main.recipe_analyzer_api, "OPTIONS"),
+        "first_preview_ms": _call(main.recipe_analyzer_api, "POST", {"developer_mode": True, "recipe_analysis_request": recipe}),
+        "first_model_ms": _call(main.recipe_analyzer_api, "POST", {"use_cache": False, "recipe_analysis_request": recipe}),
+    }))
+
+def run_scenario(scenario, sdk_import_ms):
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "backend.benchmarks.bench_startup", "--child", scenario, "--sdk-import-ms", str(sdk_import_ms)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--sdk-import-ms", type=float, default=800.0,
+                        help="simulated cost of importing the Vertex SDK (the real one is often 1-2 s)")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.sdk_import_ms)
+        return
+
+    for scenario in SCENARIOS:
+        runs = [run_scenario(scenario, args.sdk_import_ms) for _ in range(args.runs)]
+        summary = {key: round(statistics.median(run[key] for run in runs), 2) for key in runs[0]}
+        print(json.dumps({"scenario": scenario, "runs": args.runs, "median": summary}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# backend/benchmarks/fixture_server.py
+"""
+A local HTTP server of generated recipe pages, so URL imports can be
+benchmarked with no network.
+
+    /jsonld/<n>.html   a page publishing its recipe as schema.org JSON-LD
+    /plain/<n>.html    the same recipe as bare HTML, buried in navigation,
+                       comments and ads (exercises pruning and the model path)
+
+Pages are sent with Cache-Control: no-store so the fetcher's HTTP cache
+never hides the fetch.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import bench_dedupe
+
+FILLER_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua ut enim ad minim veniam quis nostrud exercitation ullamco laboris"
+).split()
+
+
+def make_recipe(number):
+    """Builds a deterministic recipe for page number."""
+    rng = random.Random(number)
+    main = rng.choice(bench_dedupe.BASE_INGREDIENTS)
+    others = rng.sample(bench_dedupe.BASE_INGREDIENTS, rng.randint(6, 12))
+    units = ["cup", "tbsp", "tsp", "g", "oz", "", "clove"]
+    return {
+        "title": f"{rng.choice(bench_dedupe.STYLE_WORDS)} {main} {rng.choice(bench_dedupe.DISH_WORDS)}".title(),
+        "description": " ".join(rng.choices(FILLER_WORDS, k=30)),
+        "servings": str(rng.randint(2, 8)),
+        "ingredients": [f"{rng.randint(1, 4)} {rng.choice(units)} {name}".replace("  ", " ") for name in [main] + others],
+        "instructions": [" ".join(rng.choices(FILLER_WORDS, k=20)).capitalize() + "." for _ in range(rng.randint(4, 9))],
+    }
+
+def _noise(rng, paragraphs):
+    return "".join(f"<p>{' '.join(rng.choices(FILLER_WORDS, k=60))}</p>" for _ in range(paragraphs))
+
+def render_page(kind, number):
+    """Returns the HTML for /<kind>/<number>.html."""
+    recipe = make_recipe(number)
+    rng = random.Random(number * 31)
+    nav = "<nav>" + "".join(f'<a href="/plain/{n}.html">Recipe {n}</a>' for n in range(40)) + "</nav>"
+    comments = '<section class="comments">' + _noise(rng, 25) + "</section>"
+    ads = '<div class="ad-slot">' + _noise(rng, 5) + "</div>"
+    body = (
+        f"<article><h1>{recipe['title']}</h1><p>{recipe['description']}</p>"
+        f"<p>Serves {recipe['servings']}</p>"
+        "<h2>Ingredients</h2><ul>" + "".join(f"<li>{i}</li>" for i in recipe["ingredients"]) + "</ul>"
+        "<h2>Instructions</h2><ol>" + "".join(f"<li>{s}</li>" for s in recipe["instructions"]) + "</ol></article>"
+    )
+    head = f"<title>{recipe['title']}</title>"
+    if kind == "jsonld":
+        structured = {
+            "@context": "https://schema.org",
+            "@type": "Recipe",
+            "name": recipe["title"],
+            "description": recipe["description"],
+            "recipeYield": recipe["servings"],
+            "recipeIngredient": recipe["ingredients"],
+            "recipeInstructions": [{"@type": "HowToStep", "text": s} for s in recipe["instructions"]],
+        }
+        head += f'<script type="application/ld+json">{json.dumps(structured)}</script>'
+    return f"<!DOCTYPE html><html><head>{head}</head><body>{nav}{ads}{body}{comments}</body></html>"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] not in ("jsonld", "plain") or not parts[1].endswith(".html"):
+            self.send_error(404)
+            return
+        try:
+            number = int(parts[1][:-len(".html")])
+        except ValueError:
+            self.send_error(404)
+            return
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = render_page(parts[0], number).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.requests_served += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """
+    Serves the fixture pages on 127.0.0.1 from a background thread.
+    Use as a context manager; url(kind, number) builds page URLs.
+    delay: seconds to wait before answering each request.
+    """
+
+    def __init__(self, delay=0.0):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.delay = delay
+        self._server.lock = threading.Lock()
+        self._server.requests_served = 0
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests_served(self):
+        return self._server.requests_served
+
+    def url(self, kind, number):
+        return f"{self.base_url}/{kind}/{number}.html"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,256 @@
+# backend/bulk_import_service.py
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from . import admission
+from . import metrics
+from . import model_router
+from . import recipe_analysis_service
+from . import resilience
+
+# --- Configuration ---
+BULK_MAX_ITEMS = int(os.environ.get("RECETTE_BULK_MAX_ITEMS", "500"))
+BULK_FETCH_CONCURRENCY = int(os.environ.get("RECETTE_BULK_FETCH_CONCURRENCY", "8"))
+BULK_MODEL_CONCURRENCY = int(os.environ.get("RECETTE_BULK_MODEL_CONCURRENCY", "4"))
+# Politeness: at most this many fetches per domain at once, starting at least this far apart.
+BULK_DOMAIN_CONCURRENCY = int(os.environ.get("RECETTE_BULK_DOMAIN_CONCURRENCY", "2"))
+BULK_DOMAIN_INTERVAL_SECONDS = float(os.environ.get("RECETTE_BULK_DOMAIN_INTERVAL_SECONDS", "0.5"))
+# Each recipe's model stage gets its own budget, so one slow recipe never eats the others'.
+BULK_ITEM_DEADLINE_SECONDS = float(os.environ.get("RECETTE_BULK_ITEM_DEADLINE_SECONDS", "120"))
+# Waiting for a model slot is expected in a bulk run.
+BULK_ADMISSION_WAIT_SECONDS = 60.0
+DEFAULT_TASKS = ["parse", "generateTags", "estimateNutrition"]
+
+# --- Bulk Import ---
+# bulk_import_request takes a list of URLs or text blobs and runs each one
+# through the recipe analysis pipeline as two stages on separate pools:
+#   fetch (URLs only): fetch, prune, structured-data fast path
+#   model: parse (unless structured data was found), tags, nutrition
+# Results are NDJSON records in completion order, then one summary record.
+# Long imports outlast a normal request timeout; deploy with a longer
+# --timeout or submit the import as an async job.
+
+
+class DomainLimiter:
+    """Per-domain concurrency and spacing, so a bulk import never hammers one site."""
+
+    def __init__(self, max_concurrent=BULK_DOMAIN_CONCURRENCY, interval=BULK_DOMAIN_INTERVAL_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._domains = {}
+
+    def acquire(self, domain):
+        with self._lock:
+            state = self._domains.setdefault(domain, {"slots": threading.Semaphore(self.max_concurrent), "next_at": 0.0})
+        state["slots"].acquire()
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, state["next_at"])
+            state["next_at"] = start_at + self.interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def release(self, domain):
+        self._domains[domain]["slots"].release()
+
+
+def _parse_items(bulk_request):
+    """Normalises items to dicts with an index, an optional client id, and a url or text."""
+    items = bulk_request.get("items")
+    if not isinstance(items, list) or not items:
+        raise Exception("Invalid bulk import. 'items' must be a non-empty list.", 400)
+    if len(items) > BULK_MAX_ITEMS:
+        raise Exception(f"Invalid bulk import. At most {BULK_MAX_ITEMS} items are allowed.", 400)
+    parsed = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"url": item} if item.startswith(("http://", "https://")) else {"text": item}
+        if not isinstance(item, dict) or not (item.get("url") or item.get("text")):
+            raise Exception(f"Invalid bulk import. Item {index} needs a 'url' or 'text'.", 400)
+        if item.get("url") and not _valid_url(item["url"]):
+            raise Exception(f"Invalid bulk import. Item {index}'s 'url' must be an http(s) URL with a host.", 400)
+        if not item.get("url") and not isinstance(item["text"], str):
+            raise Exception(f"Invalid bulk import. Item {index}'s 'text' must be a string.", 400)
+        parsed.append({"index": index, "id": item.get("id"), "url": item.get("url") or None, "text": item.get("text")})
+    return parsed
+
+def _valid_url(url):
+    """True for an http(s) URL urlsplit can parse and that names a host (checked up front; the pools can't report a 400)."""
+    if not isinstance(url, str):
+        return False
+    try:
+        parts = urlsplit(url)
+        # .port raises ValueError when it is out of range.
+        return parts.scheme in ("http", "https") and bool(parts.hostname) and (parts.port is None or parts.port > 0)
+    except ValueError:
+        return False
+
+def _interleave_by_domain(items):
+    """Orders URL items round-robin across domains, so a long run of one site doesn't hold up the rest."""
+    by_domain = OrderedDict()
+    for item in items:
+        by_domain.setdefault(urlsplit(item["url"]).hostname or "", []).append(item)
+    ordered = []
+    while by_domain:
+        for domain in list(by_domain):
+            ordered.append(by_domain[domain].pop(0))
+            if not by_domain[domain]:
+                del by_domain[domain]
+    return ordered
+
+def _limit(bulk_request, key, default):
+    try:
+        return max(1, min(int(bulk_request.get(key, default)), default))
+    except (TypeError, ValueError):
+        raise Exception(f"Invalid bulk import. '{key}' must be an integer.", 400)
+
+def stream_bulk_import(request_json, models, error_details):
+    """
+    Validates a bulk import and returns a generator that runs it, yielding
+    one dict per item as it finishes and then a summary:
+    1. Validates the items (here, so errors can still be a 400) and splits
+       URLs (fetch stage first) from texts.
+    2. Fetches URLs on the fetch pool, politely per domain, in domain-interleaved order.
+    3. Runs each recipe's analysis on the model pool, each with its own
+       deadline, rate-limit token and model slot.
+    If the consumer stops early (the client disconnected), queued work is cancelled.
+    """
+    bulk_request = request_json["bulk_import_request"]
+    # 1. Validate
+    items = _parse_items(bulk_request)
+    tasks = bulk_request.get("tasks", DEFAULT_TASKS)
+    if "parse" not in tasks:
+        raise Exception("Invalid bulk import. 'tasks' must include 'parse'.", 400)
+    analysis_request = {
+        "tasks": tasks,
+        "dietary_profile": bulk_request.get("dietary_profile", ""),
+        "execution_mode": bulk_request.get("execution_mode", recipe_analysis_service.SINGLE_SHOT),
+    }
+    if analysis_request["execution_mode"] not in (recipe_analysis_service.SINGLE_SHOT, recipe_analysis_service.FAN_OUT):
+        raise Exception(f"Invalid execution_mode: {analysis_request['execution_mode']}", 400)
+    inherited = {k: request_json[k] for k in ("model_choice", "use_cache", "developer_mode") if k in request_json}
+    fetch_concurrency = _limit(bulk_request, "fetch_concurrency", BULK_FETCH_CONCURRENCY)
+    model_concurrency = _limit(bulk_request, "model_concurrency", BULK_MODEL_CONCURRENCY)
+    # Captured now: a streamed import runs after the request's context is gone.
+    rate_key = admission.current_rate_key()
+    return _run(items, analysis_request, inherited, fetch_concurrency, model_concurrency, models, error_details, rate_key)
+
+def _run(items, analysis_request, inherited, fetch_concurrency, model_concurrency, models, error_details, rate_key=None):
+    from . import utils
+
+    domains = DomainLimiter()
+
+    results = queue.Queue()
+    cancelled = threading.Event()
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_concurrency, thread_name_prefix="bulk-fetch")
+    model_pool = ThreadPoolExecutor(max_workers=model_concurrency, thread_name_prefix="bulk-model")
+
+    def record(item, status_code, started, **fields):
+        base = {"type": "item", "index": item["index"], "id": item["id"], "url": item["url"],
+                "status": "ok" if status_code == 200 else "error", "status_code": status_code,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+        results.put({**base, **fields})
+
+    def run_model(item, scraped, started, fetch_ms):
+        # 3. Model stage
+        if cancelled.is_set():
+            return
+        sub_request = {
+            **inherited,
+            "priority": "bulk",
+            "recipe_analysis_request": {**analysis_request, "recipe_data": {"url": item["url"]} if item["url"] else {"text": item["text"]}},
+        }
+        # Never past the whole import's own deadline, if it has one (async jobs).
+        left = resilience.remaining()
+        deadline_token = resilience.start_deadline(None if left is None else max(0.0, left * 1000), budget_seconds=BULK_ITEM_DEADLINE_SECONDS)
+        lease = admission.NO_LEASE
+        try:
+            admission.meter_item(rate_key, BULK_ADMISSION_WAIT_SECONDS)
+            model = model_router.select_model("recipe_analysis_request", sub_request, models)
+            lease = admission.admit("recipe_analysis_request", sub_request, model, wait_seconds=BULK_ADMISSION_WAIT_SECONDS)
+            response = recipe_analysis_service.handle_recipe_analysis(sub_request, model, models, scraped=scraped)
+            if not sub_request.get("developer_mode"):
+                # Hundreds of prompts would dwarf the results.
+                response.pop("prompt_text", None)
+                response.pop("raw_response_text", None)
+            record(item, 200, started, fetch_ms=fetch_ms, source=response.get("source", "model"), response=response)
+        except Exception as e:
+            message, status_code = error_details(e)
+            record(item, status_code, started, fetch_ms=fetch_ms, stage="model", error=message)
+        finally:
+            lease.release()
+            resilience.end_deadline(deadline_token)
+
+    def run_fetch(item):
+        # 2. Fetch stage
+        if cancelled.is_set():
+            return
+        started = time.perf_counter()
+        domain = urlsplit(item["url"]).hostname or ""
+        try:
+            domains.acquire(domain)
+            try:
+                scraped = utils.scrape_recipe_from_url(item["url"])
+            finally:
+                domains.release(domain)
+        except Exception as e:
+            message, status_code = error_details(e)
+            # The site failed, not us.
+            record(item, 502 if status_code == 500 else status_code, started, stage="fetch", error=message)
+            return
+        fetch_ms = round((time.perf_counter() - started) * 1000, 1)
+        model_pool.submit(metrics.propagate(run_model), item, scraped, started, fetch_ms)
+
+    run_started = time.perf_counter()
+    url_items = _interleave_by_domain([item for item in items if item["url"]])
+    text_items = [item for item in items if not item["url"]]
+    try:
+        for item in text_items:
+            model_pool.submit(metrics.propagate(run_model), item, None, time.perf_counter(), None)
+        for item in url_items:
+            fetch_pool.submit(metrics.propagate(run_fetch), item)
+
+        summary = {"type": "summary", "total": len(items), "ok": 0, "failed": 0, "structured_data": 0,
+                   "failed_fetch": 0, "domains": len({urlsplit(item["url"]).hostname for item in url_items})}
+        for _ in items:
+            result = results.get()
+            if result["status"] == "ok":
+                summary["ok"] += 1
+                summary["structured_data"] += result.get("source") == "structured_data"
+            else:
+                summary["failed"] += 1
+                summary["failed_fetch"] += result.get("stage") == "fetch"
+            yield result
+        summary["elapsed_ms"] = round((time.perf_counter() - run_started) * 1000, 1)
+        yield summary
+    finally:
+        cancelled.set()
+        fetch_pool.shutdown(wait=False, cancel_futures=True)
+        model_pool.shutdown(wait=False, cancel_futures=True)
+
+def stream_ndjson(request_json, models, error_details):
+    """The bulk import as NDJSON lines, for streaming (validated before the first line)."""
+    records = stream_bulk_import(request_json, models, error_details)
+    return (json.dumps(record) + "\n" for record in records)
+
+def handle_bulk_import(request_json, models, error_details):
+    """
+    Runs a bulk import to completion and returns every record at once
+    (for async jobs and "stream": false), with progress reported per item.
+    """
+    from . import job_service
+    records = []
+    for record in stream_bulk_import(request_json, models, error_details):
+        records.append(record)
+        if record["type"] == "item":
+            job_service.report_progress(len(records), len(request_json["bulk_import_request"]["items"]))
+    summary = records.pop()
+    records.sort(key=lambda r: r["index"])
+    return {"result": records, "summary": summary, "error": None}
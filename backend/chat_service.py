@@ -1,40 +1,233 @@
 # backend/chat_service.py
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import admission
 from . import prompts
 from . import gemini_service
+from . import chat_session_store
+from . import metrics
+from . import resilience
 
-def handle_chat_request(request_json, model):
+STREAM_FORMATS = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# --- History Window & Rolling Summary ---
+# Only the most recent turns that fit this budget are sent verbatim; older
+# turns are folded into a per-session summary in the background.
+HISTORY_TOKEN_BUDGET = int(os.environ.get("RECETTE_CHAT_HISTORY_TOKENS", "1500"))
+# How many turns must fall out of the window before a summary refresh is scheduled.
+SUMMARY_MIN_TURNS = 4
+# A refresh runs after its request has ended, so it gets a budget of its own
+# and waits for a model slot behind live traffic.
+SUMMARY_DEADLINE_SECONDS = 60.0
+SUMMARY_ADMISSION_WAIT_SECONDS = 30.0
+
+logger = logging.getLogger(__name__)
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+_pending_summaries = set()
+_pending_lock = threading.Lock()
+
+def select_history_window(messages, max_tokens=HISTORY_TOKEN_BUDGET):
     """
-    Orchestrates the conversational chat process.
+    Returns the index of the oldest message that still fits the token budget
+    when walking back from the newest one. The newest message always fits.
     """
-    chat_request = request_json['chat_request']
-    developer_mode = request_json.get("developer_mode", False)
+    used = 0
+    start = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        cost = prompts.estimate_tokens(f"{messages[index]['role']}: {messages[index]['text']}\n")
+        if used + cost > max_tokens and start < len(messages):
+            break
+        used += cost
+        start = index
+    return start
 
-    # 1. Extract data from the request
+def _prepare_turn(chat_request):
+    """
+    Resolves the context for one chat turn and builds the prompt.
+    With a session_id (or use_session), history, profile and inventory come
+    from the server-side session store; otherwise from the request itself.
+    Returns (prompt_parts, turn) where turn describes what to persist later.
+    """
     user_message = chat_request.get('user_message', '')
-    profile_text = chat_request.get('profile_text', '')
-    inventory_text = chat_request.get('inventory_text', '')
-    chat_history = chat_request.get('chat_history', [])
+    turn = {"session_id": None, "user_message": user_message, "messages": [], "summary": "", "summarized": 0}
+
+    session_id = chat_request.get('session_id')
+    if session_id or chat_request.get('use_session'):
+        store = chat_session_store.get_default_store()
+        session_id = session_id or store.new_session_id()
+        if store.get_session(session_id) is None:
+            # Unknown or expired: whatever is left of it goes, and it starts over.
+            store.delete_session(session_id)
+        store.save_context(session_id, chat_request.get('profile_text'), chat_request.get('inventory_text'))
+        session = store.get_session(session_id)
+        if session is None:
+            raise Exception("Chat session could not be opened. Please start a new one.", 410)
+        if not session['messages'] and chat_request.get('chat_history'):
+            # A client switching to sessions mid-conversation seeds it once.
+            store.append_messages(session_id, chat_request['chat_history'])
+            session = store.get_session(session_id)
+        profile_text, inventory_text = session['profile_text'], session['inventory_text']
+        turn.update(session_id=session_id, messages=session['messages'],
+                    summary=session['summary'], summarized=session['summarized_turns'])
+    else:
+        profile_text = chat_request.get('profile_text', '')
+        inventory_text = chat_request.get('inventory_text', '')
+        turn["messages"] = chat_request.get('chat_history', [])
+
+    unsummarized = turn["messages"][turn["summarized"]:]
+    window_start = select_history_window(unsummarized)
+    turn["window_start"] = turn["summarized"] + window_start
 
-    # 2. Build the prompt using the prompts module
     prompt_parts = prompts.build_chat_prompt(
         user_message,
         profile_text,
         inventory_text,
-        chat_history
+        unsummarized[window_start:],
+        turn["summary"]
     )
-    
+    return prompt_parts, turn
+
+def _finish_turn(turn, reply, model):
+    """Persists the exchange and schedules a summary refresh once turns have aged out."""
+    session_id = turn["session_id"]
+    if not session_id:
+        return
+    store = chat_session_store.get_default_store()
+    store.append_messages(session_id, [
+        {"role": "user", "text": turn["user_message"]},
+        {"role": "model", "text": reply},
+    ])
+
+    aged_out = turn["messages"][turn["summarized"]:turn["window_start"]]
+    if len(aged_out) < SUMMARY_MIN_TURNS:
+        return
+    with _pending_lock:
+        if session_id in _pending_summaries:
+            return
+        _pending_summaries.add(session_id)
+    _summary_executor.submit(_refresh_summary, session_id, turn["summary"], aged_out, turn["window_start"], model)
+
+def _refresh_summary(session_id, previous_summary, turns, summarized_turns, model):
+    """
+    Background job: folds aged-out turns into the session's rolling summary.
+    Like any model call it runs under a deadline (its own, enforced, since no
+    request stands behind it), with retries, the breaker and a bulk-priority model slot.
+    """
+    deadline_token = resilience.start_deadline(budget_seconds=SUMMARY_DEADLINE_SECONDS, enforce=True)
+    lease = admission.NO_LEASE
+    try:
+        prompt_parts = prompts.build_chat_summary_prompt(previous_summary, turns)
+        lease = admission.admit("chat_request", {"priority": "bulk"}, model, wait_seconds=SUMMARY_ADMISSION_WAIT_SECONDS)
+        response = resilience.call_model(gemini_service._model_name(model), lambda: model.generate_content(prompt_parts))
+        summary = gemini_service.response_text(response).strip()
+        if summary:
+            chat_session_store.get_default_store().save_summary(session_id, summary, summarized_turns)
+    except Exception as e:
+        # The next turn will try again; a stale summary only costs a little context.
+        logger.warning("Chat summary refresh failed for session %s: %s", session_id, e)
+    finally:
+        lease.release()
+        resilience.end_deadline(deadline_token)
+        with _pending_lock:
+            _pending_summaries.discard(session_id)
+
+def handle_chat_request(request_json, model):
+    """
+    Orchestrates the conversational chat process.
+    """
+    chat_request = request_json['chat_request']
+    developer_mode = request_json.get("developer_mode", False)
+
+    # 1. Resolve the conversation context and 2. build the prompt
+    with metrics.stage("build_prompt"):
+        prompt_parts, turn = _prepare_turn(chat_request)
+
     # 3. Call the central Gemini service
     # Note: Chat responses are not expected to be JSON, so we handle them differently.
     # We can enhance gemini_service later if needed, but for now, a direct call is fine.
-    
+
     if developer_mode:
         return {"prompt_text": "".join(prompt_parts)}
 
-    response = model.generate_content(prompt_parts)
-    
+    with metrics.stage("model"):
+        # Same deadline, retries and breaker as call_gemini.
+        response = resilience.call_model(gemini_service._model_name(model), lambda: model.generate_content(prompt_parts))
+    _finish_turn(turn, response.text, model)
+
     # For chat, we often want the direct text response
-    return {
+    response_data = {
         "prompt_text": "".join(prompt_parts),
         "result": response.text, # Return the raw text response
         "error": None
-    }
\ No newline at end of file
+    }
+    if turn["session_id"]:
+        response_data["session_id"] = turn["session_id"]
+    return response_data
+
+def _format_event(stream_format, event_type, payload):
+    """Serialises one stream event as a server-sent event or an NDJSON line."""
+    if stream_format == "sse":
+        return f"event: {event_type}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps({"type": event_type, **payload}) + "\n"
+
+def stream_chat_request(request_json, model, stream_format="sse"):
+    """
+    Streaming variant of handle_chat_request. Returns a generator that yields
+    the reply as it is generated, as "chunk" events, followed by a single
+    "done" event carrying the full text and the time-to-first-token and
+    total latency in ms. The context is resolved and the model stream set up
+    here, under the request's deadline; errors after the stream has started
+    are reported as an "error" event, since the HTTP status has already been sent.
+    """
+    chat_request = request_json['chat_request']
+    developer_mode = request_json.get("developer_mode", False)
+    started = time.perf_counter()
+
+    prompt_parts, turn = _prepare_turn(chat_request)
+    # Same deadline, retries and breaker as call_model; retried only until the first chunk.
+    chunks = None if developer_mode else resilience.stream_model(
+        gemini_service._model_name(model), lambda: model.generate_content(prompt_parts, stream=True))
+    return _stream_events(prompt_parts, turn, chunks, model, stream_format, started)
+
+def _stream_events(prompt_parts, turn, chunks, model, stream_format, started):
+    prompt_text = "".join(prompt_parts)
+    if chunks is None:
+        yield _format_event(stream_format, "done", {"prompt_text": prompt_text, "result": None, "error": None})
+        return
+
+    replies = []
+    first_token_ms = None
+    try:
+        for response in chunks:
+            text = gemini_service.response_text(response)
+            if not text:
+                continue
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+            replies.append(text)
+            yield _format_event(stream_format, "chunk", {"text": text})
+    except Exception as e:
+        yield _format_event(stream_format, "error", {"error": f"An unexpected error occurred: {e}"})
+        return
+
+    reply = "".join(replies)
+    _finish_turn(turn, reply, model)
+    done = {
+        "prompt_text": prompt_text,
+        "result": reply,
+        "error": None,
+        "time_to_first_token_ms": first_token_ms,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    if turn["session_id"]:
+        done["session_id"] = turn["session_id"]
+    yield _format_event(stream_format, "done", done)
@@ -0,0 +1,141 @@
+# backend/chat_session_store.py
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+# --- Configuration ---
+CHAT_DB_PATH = os.environ.get("RECETTE_CHAT_DB_PATH", os.path.join(tempfile.gettempdir(), "recette-chat.db"))
+CHAT_SESSION_TTL_SECONDS = float(os.environ.get("RECETTE_CHAT_SESSION_TTL_SECONDS", str(24 * 60 * 60)))
+# Expired sessions are deleted on access, at most this often.
+CHAT_PURGE_INTERVAL_SECONDS = 300.0
+
+
+class ChatSessionStore:
+    """
+    Server-side chat sessions, so the client only sends the new message.
+    Each session keeps the profile and inventory text it was opened with, the
+    full message log, and a rolling summary covering the oldest turns.
+    """
+
+    def __init__(self, path=CHAT_DB_PATH, ttl_seconds=CHAT_SESSION_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    profile_text TEXT NOT NULL DEFAULT '',
+                    inventory_text TEXT NOT NULL DEFAULT '',
+                    summary TEXT NOT NULL DEFAULT '',
+                    summarized_turns INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    PRIMARY KEY (session_id, seq)
+                );
+                """
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex
+
+    def _maybe_purge(self):
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + CHAT_PURGE_INTERVAL_SECONDS
+            self.purge_expired()
+
+    def get_session(self, session_id):
+        """Returns the session as a dict (with its messages), or None if unknown or expired."""
+        self._maybe_purge()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT profile_text, inventory_text, summary, summarized_turns, updated_at FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None or row[4] + self.ttl_seconds < time.time():
+                return None
+            messages = self._conn.execute(
+                "SELECT role, text FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return {
+            "session_id": session_id,
+            "profile_text": row[0],
+            "inventory_text": row[1],
+            "summary": row[2],
+            "summarized_turns": row[3],
+            "messages": [{"role": role, "text": text} for role, text in messages],
+        }
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def save_context(self, session_id, profile_text=None, inventory_text=None):
+        """Creates the session if needed and updates whichever context fields were sent."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, updated_at) VALUES (?, ?)", (session_id, now)
+            )
+            if profile_text is not None:
+                self._conn.execute("UPDATE sessions SET profile_text = ? WHERE session_id = ?", (profile_text, session_id))
+            if inventory_text is not None:
+                self._conn.execute("UPDATE sessions SET inventory_text = ? WHERE session_id = ?", (inventory_text, session_id))
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (now, session_id))
+            self._conn.commit()
+
+    def append_messages(self, session_id, messages):
+        with self._lock:
+            next_seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, seq, role, text) VALUES (?, ?, ?, ?)",
+                [(session_id, next_seq + i, m["role"], m["text"]) for i, m in enumerate(messages)],
+            )
+            self._conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+            self._conn.commit()
+
+    def save_summary(self, session_id, summary, summarized_turns):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET summary = ?, summarized_turns = ? WHERE session_id = ? AND summarized_turns < ?",
+                (summary, summarized_turns, session_id, summarized_turns),
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,)
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+            self._conn.commit()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Returns the process-wide store, opening the database on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ChatSessionStore()
+        return _default_store
@@ -0,0 +1,170 @@
+# backend/content_pruner.py
+import os
+import re
+
+from .ingredient_parser import parse_quantity, parse_unit
+
+# --- Configuration ---
+# Rough rule of thumb for Gemini tokenisation of English text.
+CHARS_PER_TOKEN = 4
+SCRAPE_MAX_CHARS = int(os.environ.get("RECETTE_SCRAPE_MAX_CHARS", "12000"))
+
+# Elements that never carry recipe content.
+NOISE_TAGS = ["script", "style", "noscript", "template", "nav", "aside", "footer", "form", "iframe", "svg", "button", "select"]
+# Class/id fragments for comment threads, share bars, ads and the like.
+NOISE_HINTS = re.compile(
+    r"comment|share|social|advert|\bads?\b|sponsor|newsletter|subscribe|related|sidebar|cookie|popup|modal|promo|breadcrumb|menu|rating",
+    re.IGNORECASE,
+)
+RECIPE_HINTS = re.compile(r"recipe|ingredient|instruction|direction|method|step", re.IGNORECASE)
+RECIPE_HEADINGS = re.compile(r"^\s*(ingredients?|instructions?|directions?|method|preparation|steps?)\b", re.IGNORECASE)
+CANDIDATE_TAGS = ["article", "main", "section", "div", "ul", "ol", "table"]
+
+# Every character of a candidate block costs this much score, so the tightest
+# block that still holds the whole recipe wins over its page-sized ancestors.
+LENGTH_PENALTY = 0.002
+MIN_RECIPE_SCORE = 10
+
+
+def estimate_tokens(text):
+    """A cheap, model-agnostic token estimate used for prompt budgets."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _element_hints(element):
+    classes = element.get("class") or []
+    if isinstance(classes, str):
+        classes = [classes]
+    return " ".join(classes) + " " + (element.get("id") or "")
+
+
+def drop_noise(soup):
+    """Removes boilerplate elements (scripts, navigation, comments, ads) in place."""
+    for element in soup.find_all(NOISE_TAGS):
+        element.decompose()
+    for element in soup.find_all(attrs={"class": True}) + soup.find_all(attrs={"id": True}):
+        if element.decomposed:
+            continue
+        hints = _element_hints(element)
+        if NOISE_HINTS.search(hints) and not RECIPE_HINTS.search(hints):
+            element.decompose()
+    return soup
+
+
+def _looks_like_ingredient(line):
+    quantity, _, remainder = parse_quantity(line)
+    if not quantity or not remainder:
+        return False
+    unit, _, _ = parse_unit(remainder)
+    return bool(unit) or len(remainder.split()) <= 5
+
+
+def _string_stats(string):
+    """Counts one text node's ingredient lines and recipe headings, as they appear in get_text()."""
+    stripped = string.strip()
+    lines = [line for line in stripped.split("\n") if line.strip()]
+    ingredient_lines = sum(1 for line in lines if len(line) < 120 and _looks_like_ingredient(line))
+    headings = sum(1 for line in lines if len(line) < 40 and RECIPE_HEADINGS.match(line))
+    return len(stripped), ingredient_lines, headings
+
+
+def measure_blocks(root):
+    """
+    Measures every tag under root (and root itself) in one bottom-up pass:
+    the length of its get_text("\n", strip=True), its ingredient lines and
+    recipe headings, and the steps of the ordered lists inside it. Each text
+    node is parsed once, however deeply it is nested.
+    Returns {id(tag): stats}.
+    """
+    from bs4.element import CData, NavigableString, Tag
+    stats = {}
+    # Reversed document order visits every tag after all of its descendants.
+    tags = root.find_all(True)
+    tags.reverse()
+    if isinstance(root, Tag):
+        tags.append(root)
+    for tag in tags:
+        block = {"chars": 0, "strings": 0, "ingredient_lines": 0, "headings": 0, "ordered_steps": 0, "own_steps": 0}
+        for child in tag.children:
+            if isinstance(child, Tag):
+                inner = stats[id(child)]
+                for key in ("chars", "strings", "ingredient_lines", "headings"):
+                    block[key] += inner[key]
+                block["ordered_steps"] += inner["ordered_steps"] + inner["own_steps"]
+                if tag.name == "ol" and child.name == "li":
+                    block["own_steps"] += 1
+            elif type(child) in (NavigableString, CData) and child.strip():
+                chars, ingredient_lines, headings = _string_stats(child)
+                block["chars"] += chars
+                block["strings"] += 1
+                block["ingredient_lines"] += ingredient_lines
+                block["headings"] += headings
+        stats[id(tag)] = block
+    for block in stats.values():
+        # get_text joins the stripped strings with one newline each.
+        block["text_length"] = block["chars"] + max(0, block["strings"] - 1)
+    return stats
+
+
+def score_block(element, stats=None):
+    """
+    Scores an element for recipe-likeness: quantity-led ingredient lines,
+    ordered-list steps, recipe section headings and recipe class hints.
+    Longer blocks pay a small per-character penalty. stats is the element's
+    entry from measure_blocks, measured here when not given.
+    """
+    if stats is None:
+        stats = measure_blocks(element)[id(element)]
+    hinted = 1 if RECIPE_HINTS.search(_element_hints(element)) else 0
+    score = 3 * stats["ingredient_lines"] + 2 * stats["ordered_steps"] + 10 * min(stats["headings"], 3) + 15 * hinted
+    return score - LENGTH_PENALTY * stats["text_length"]
+
+
+def _page_title(soup):
+    meta = soup.find("meta", attrs={"property": "og:title"})
+    if meta and meta.get("content"):
+        return meta["content"].strip()
+    heading = soup.find("h1")
+    if heading:
+        return heading.get_text(" ", strip=True)
+    return soup.title.get_text(" ", strip=True) if soup.title else ""
+
+
+def truncate_to_budget(text, max_chars=SCRAPE_MAX_CHARS):
+    """Cuts text down to max_chars, ending on a whole line where possible."""
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    last_break = cut.rfind("\n")
+    if last_break > max_chars // 2:
+        cut = cut[:last_break]
+    return cut.rstrip()
+
+
+def extract_recipe_text(soup, max_chars=SCRAPE_MAX_CHARS):
+    """
+    Reduces a parsed page to the text the model actually needs:
+    1. Strips boilerplate elements.
+    2. Picks the most recipe-like block on the page (or the whole body if no
+       block looks like a recipe).
+    3. Enforces the character budget.
+    The soup is modified in place, so run structured-data extraction first.
+    """
+    title = _page_title(soup)
+    drop_noise(soup)
+
+    # Every candidate is scored from one bottom-up pass; only the winner's text is built.
+    stats = measure_blocks(soup)
+    best, best_score = None, MIN_RECIPE_SCORE
+    for element in soup.find_all(CANDIDATE_TAGS):
+        block = stats[id(element)]
+        if not block["text_length"]:
+            continue
+        score = score_block(element, block)
+        if score > best_score:
+            best, best_score = element, score
+
+    best_text = (best or soup.body or soup).get_text("\n", strip=True)
+
+    if title and title not in best_text[:500]:
+        best_text = f"{title}\n{best_text}"
+    return truncate_to_budget(best_text, max_chars)
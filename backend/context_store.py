@@ -0,0 +1,249 @@
+# backend/context_store.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+# "memory" keeps contexts in this instance; "sqlite" shares them through a file
+# (all workers on an instance, or a local test database).
+CONTEXT_BACKEND = os.environ.get("RECETTE_CONTEXT_BACKEND", "memory").lower()
+# Defaults to recette-context.db in the temp directory (resolved on first use).
+CONTEXT_DB_PATH = os.environ.get("RECETTE_CONTEXT_DB_PATH", "")
+CONTEXT_MAX_ENTRIES = int(os.environ.get("RECETTE_CONTEXT_MAX_ENTRIES", "2048"))
+# Counted from last use, so a context referenced every day never expires.
+CONTEXT_TTL_SECONDS = float(os.environ.get("RECETTE_CONTEXT_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+CONTEXT_MAX_VALUE_BYTES = int(os.environ.get("RECETTE_CONTEXT_MAX_VALUE_BYTES", str(256 * 1024)))
+
+# Request fields a client can send by reference as "<field>_ref".
+CONTEXT_FIELDS = ("dietary_profile", "profile_text", "inventory_text", "inventory")
+
+# --- Content-Addressed Context ---
+# The profile and inventory ride along with almost every request. A client
+# uploads each once with context_upload_request and gets its hash back, then
+# sends e.g. "dietary_profile_ref": "<hash>" instead of the text. The hash is
+# the SHA-256 of the value's canonical JSON (sorted keys, no whitespace), so
+# clients can also compute it themselves. A reference this instance no longer
+# holds is a 409 listing the missing fields; the client resends the values
+# (inline, or with a new upload) and carries on. Resolved values are the
+# exact stored ones, so prompts built from them are byte-for-byte stable.
+
+
+class ContextMissing(Exception):
+    """One or more *_ref fields point at contexts this instance doesn't hold."""
+
+    def __init__(self, missing):
+        fields = ", ".join(sorted({entry["field"] for entry in missing}))
+        super().__init__(f"Unknown or expired context for {fields}. Please resend it.", 409)
+        self.missing = missing
+
+
+def canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def content_hash(value):
+    return hashlib.sha256(canonical_json(value).encode("utf-8")).hexdigest()
+
+
+# --- Backends ---
+# Both hold values as received and hand back the same object on every hit;
+# callers treat resolved contexts as read-only.
+
+class MemoryBackend:
+    """An in-process LRU with a TTL counted from last use."""
+
+    def __init__(self, max_entries=CONTEXT_MAX_ENTRIES, ttl_seconds=CONTEXT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, last_used = entry
+            if last_used + self.ttl_seconds <= now:
+                del self._entries[key]
+                return None
+            self._entries[key] = (value, now)
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteBackend:
+    """Contexts in a SQLite file, evicted least recently used first."""
+
+    def __init__(self, path=CONTEXT_DB_PATH, max_entries=CONTEXT_MAX_ENTRIES, ttl_seconds=CONTEXT_TTL_SECONDS):
+        import sqlite3
+        import tempfile
+        path = path or os.path.join(tempfile.gettempdir(), "recette-context.db")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS contexts (
+                    hash TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS contexts_last_used ON contexts (last_used);
+                """
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, last_used FROM contexts WHERE hash = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl_seconds <= now:
+                self._conn.execute("DELETE FROM contexts WHERE hash = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE contexts SET last_used = ? WHERE hash = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contexts (hash, value, last_used) VALUES (?, ?, ?)", (key, canonical_json(value), time.time())
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM contexts WHERE hash IN (SELECT hash FROM contexts ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+            self._conn.commit()
+            self.evictions += max(0, evicted)
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM contexts").fetchone()[0]
+
+
+class ContextStore:
+    """Stores contexts by content hash and resolves *_ref fields in requests."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def put(self, value):
+        """Stores a value and returns its hash."""
+        if _too_large(value):
+            raise Exception(f"Context too large. At most {CONTEXT_MAX_VALUE_BYTES} bytes are allowed.", 413)
+        key = content_hash(value)
+        self.backend.put(key, value)
+        self._count("stores")
+        return key
+
+    def get(self, key):
+        value = self.backend.get(str(key))
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def resolve_refs(self, request_json):
+        """
+        Replaces every "<field>_ref" in the request's handler sections (and
+        batch items') with the stored value. A section that sends the value
+        inline as well wins, and its value is stored for later references
+        (unless it is too large to store; it is still used inline).
+        Raises ContextMissing (409) listing every reference it couldn't resolve.
+        """
+        missing = []
+        for section in _sections(request_json):
+            for field in CONTEXT_FIELDS:
+                ref = section.pop(f"{field}_ref", None)
+                if ref is None:
+                    continue
+                if field in section:
+                    if not _too_large(section[field]):
+                        self.put(section[field])
+                    continue
+                value = self.get(ref)
+                if value is None:
+                    missing.append({"field": field, "ref": ref})
+                else:
+                    section[field] = value
+        if missing:
+            raise ContextMissing(missing)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        return {"backend": type(self.backend).__name__, "entries": self.backend.size(), "evictions": self.backend.evictions, **stats}
+
+
+def _too_large(value):
+    return len(canonical_json(value).encode("utf-8")) > CONTEXT_MAX_VALUE_BYTES
+
+def _sections(request_json):
+    """The handler sections of a request, including each batch item's."""
+    sections = [value for value in request_json.values() if isinstance(value, dict)]
+    batch = request_json.get("batch_request")
+    if isinstance(batch, dict):
+        batch = batch.get("requests")
+    if isinstance(batch, list):
+        sections.extend(value for item in batch if isinstance(item, dict) for value in item.values() if isinstance(value, dict))
+    return sections
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Returns the process-wide store, on the configured backend."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ContextStore(SqliteBackend() if CONTEXT_BACKEND == "sqlite" else MemoryBackend())
+        return _default_store
+
+def resolve_refs(request_json):
+    get_default_store().resolve_refs(request_json)
+
+def handle_context_upload(request_json):
+    """
+    Stores each context value sent (dietary_profile, profile_text,
+    inventory_text, inventory) and returns the "<field>_ref" to send instead.
+    """
+    upload_request = request_json.get("context_upload_request")
+    if not isinstance(upload_request, dict) or not upload_request:
+        raise Exception("Invalid request. context_upload_request needs at least one context field.", 400)
+    unknown = sorted(set(upload_request) - set(CONTEXT_FIELDS))
+    if unknown:
+        raise Exception(f"Invalid request. Unknown context fields: {', '.join(unknown)}.", 400)
+    store = get_default_store()
+    return {"result": {f"{field}_ref": store.put(value) for field, value in upload_request.items()}, "error": None}
+
+def get_stats():
+    return get_default_store().get_stats()
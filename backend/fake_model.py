@@ -0,0 +1,246 @@
+# backend/fake_model.py
+import hashlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import json
+import random
+import sys
+import threading
+import time
+import types
+
+# --- Offline Stand-in for vertexai.generative_models.GenerativeModel ---
+# Lets handlers (including streaming chat) run with no Vertex project, no
+# network and fully predictable timings.
+
+
+class FakePart:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    """Mimics the .text / .parts surface of a GenerationResponse."""
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = [FakePart(text)] if text else []
+
+
+class FakeServiceUnavailable(Exception):
+    """Stands in for google.api_core.exceptions.ServiceUnavailable (retryable)."""
+    code = 503
+
+
+class FakeGenerativeModel:
+    """
+    A drop-in for GenerativeModel.generate_content.
+
+    response_text: the reply, or a callable taking the prompt parts and
+        returning the reply.
+    first_token_delay: seconds before the first chunk (or the whole reply).
+    chunk_delay: seconds between streamed chunks.
+    chunk_size: characters per streamed chunk.
+    latency_jitter: up to this many extra seconds, drawn uniformly per call
+        (seeded by seed), added to first_token_delay.
+    error_rate: the chance (0-1) that a call raises error instead of replying.
+    error: the exception (class or instance) raised by injected failures.
+    slow_rate: the chance (0-1) that a call takes slow_delay extra seconds.
+    faults: a script of per-call faults, consumed one per call before the
+        rates apply: an exception to raise, a number of extra seconds to
+        wait, or None for a normal call.
+    """
+
+    def __init__(self, response_text="{}", model_name="fake-model", first_token_delay=0.0,
+                 chunk_delay=0.0, chunk_size=16, latency_jitter=0.0, seed=None,
+                 error_rate=0.0, error=FakeServiceUnavailable, slow_rate=0.0, slow_delay=0.0, faults=()):
+        self._model_name = model_name
+        self.response_text = response_text
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error = error
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.faults = list(faults)
+        self.calls = []
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def _first_token_delay(self):
+        if not self.latency_jitter:
+            return self.first_token_delay
+        with self._lock:
+            return self.first_token_delay + self._rng.uniform(0, self.latency_jitter)
+
+    def _inject_faults(self):
+        """Raises or sleeps per the fault script and rates; otherwise returns at once."""
+        with self._lock:
+            if self.faults:
+                fault = self.faults.pop(0)
+            elif self.error_rate and self._rng.random() < self.error_rate:
+                fault = self.error
+            elif self.slow_rate and self._rng.random() < self.slow_rate:
+                fault = self.slow_delay
+            else:
+                fault = None
+            is_error = isinstance(fault, BaseException) or (isinstance(fault, type) and issubclass(fault, BaseException))
+            if is_error:
+                self.failures += 1
+        if is_error:
+            raise fault(f"{self._model_name} is unavailable (injected)") if isinstance(fault, type) else fault
+        if fault:
+            time.sleep(fault)
+
+    def _reply_for(self, prompt_parts):
+        with self._lock:
+            self.calls.append(prompt_parts)
+        self._inject_faults()
+        if callable(self.response_text):
+            return self.response_text(prompt_parts)
+        return self.response_text
+
+    def generate_content(self, prompt_parts, stream=False, **kwargs):
+        text = self._reply_for(prompt_parts)
+        if stream:
+            return self._stream(text)
+        time.sleep(self._first_token_delay() + self.chunk_delay * max(0, len(text) // self.chunk_size - 1))
+        return FakeResponse(text)
+
+    def _stream(self, text):
+        time.sleep(self._first_token_delay())
+        for start in range(0, len(text), self.chunk_size):
+            if start:
+                time.sleep(self.chunk_delay)
+            yield FakeResponse(text[start:start + self.chunk_size])
+
+
+# --- Recorded Responses ---
+
+def prompt_key(prompt_parts):
+    """A stable key for a prompt. Non-text parts (images) count by type and size."""
+    if isinstance(prompt_parts, str):
+        prompt_parts = [prompt_parts]
+    digest = hashlib.sha256()
+    for part in prompt_parts:
+        if isinstance(part, str):
+            digest.update(part.encode("utf-8"))
+        else:
+            data = getattr(part, "data", b"")
+            digest.update(f"<{type(part).__name__}:{len(data)}>".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ReplayResponder:
+    """
+    A response_text callable that replays recorded replies by prompt_key and
+    falls back to fallback (a string, or a callable taking the prompt parts)
+    for prompts that were never recorded.
+    """
+
+    def __init__(self, recordings=None, fallback="{}"):
+        self.recordings = dict(recordings or {})
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path, fallback="{}"):
+        """Loads a JSON Lines file written by RecordingModel."""
+        recordings = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["prompt_key"]] = entry["response_text"]
+        return cls(recordings, fallback)
+
+    def __call__(self, prompt_parts):
+        text = self.recordings.get(prompt_key(prompt_parts))
+        if text is not None:
+            self.hits += 1
+            return text
+        self.misses += 1
+        return self.fallback(prompt_parts) if callable(self.fallback) else self.fallback
+
+
+class RecordingModel:
+    """
+    Wraps a real model and appends each prompt's reply to a JSON Lines file,
+    so a live session can later be replayed offline with ReplayResponder.
+    """
+
+    def __init__(self, model, path):
+        self._model = model
+        self._model_name = getattr(model, "_model_name", "recorded-model")
+        self.path = path
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt_parts, stream=False, **kwargs):
+        response = self._model.generate_content(prompt_parts, **kwargs)
+        entry = {"prompt_key": prompt_key(prompt_parts), "model": self._model_name, "response_text": response.text}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        return self._replay(response.text) if stream else response
+
+    def _replay(self, text):
+        yield FakeResponse(text)
+
+
+# --- Offline Vertex SDK ---
+
+class FakeVertexFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Serves offline vertexai and vertexai.generative_models modules, charging
+    import_delay seconds on the first import to mimic the real SDK's cost.
+    """
+
+    def __init__(self, import_delay=0.0, response_text='{"title": "Stub"}'):
+        self.import_delay = import_delay
+        self.response_text = response_text
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname in ("vertexai", "vertexai.generative_models"):
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=fullname == "vertexai")
+        return None
+
+    def create_module(self, spec):
+        return types.ModuleType(spec.name)
+
+    def exec_module(self, module):
+        if module.__name__ == "vertexai":
+            time.sleep(self.import_delay)
+            module.init = lambda **kwargs: None
+            return
+        response_text = self.response_text
+
+        class GenerativeModel(FakeGenerativeModel):
+            def __init__(self, model_name):
+                super().__init__(response_text=response_text, model_name=model_name)
+
+        class Part:
+            def __init__(self, data, mime_type):
+                self.data = data
+                self.mime_type = mime_type
+
+            @staticmethod
+            def from_data(data, mime_type):
+                return Part(data, mime_type)
+
+        module.GenerativeModel = GenerativeModel
+        module.Part = Part
+
+
+def install_fake_vertexai(import_delay=0.0, force=False):
+    """
+    Makes `import vertexai` resolve to the offline stub. Unless force is set,
+    a real installed SDK is left alone (models are replaced separately).
+    """
+    if not force and importlib.util.find_spec("vertexai") is not None:
+        return False
+    sys.meta_path.insert(0, FakeVertexFinder(import_delay))
+    return True
@@ -1,40 +1,138 @@
 # backend/gemini_service.py
+import copy
 import json
-from vertexai.generative_models import GenerativeModel
+import time
+from typing import TYPE_CHECKING
 
-def call_gemini(model: GenerativeModel, prompt_parts: list, developer_mode: bool = False):
+from . import admission
+from . import metrics
+from . import model_router
+from . import resilience
+from . import response_cache
+from . import single_flight
+from .prompts import estimate_tokens
+
+if TYPE_CHECKING:
+    # Annotation only; importing the Vertex SDK here would slow every cold start.
+    from vertexai.generative_models import GenerativeModel
+
+def _model_name(model):
+    """Returns the resource name of a model, used to namespace cache keys."""
+    return getattr(model, "_model_name", None) or getattr(model, "model_name", None) or type(model).__name__
+
+def response_text(response):
+    """Returns the full text of a (possibly streamed) model response."""
+    # --- THIS IS THE FIX ---
+    # The 'response.text' property can be unreliable. The robust way to get the
+    # full text content is to iterate through the response 'parts' and join them.
+    # This handles all cases and ensures a string is always produced.
+    return "".join([part.text for part in response.parts]) if hasattr(response, 'parts') and response.parts else response.text
+
+# A leader that runs out of its own deadline doesn't fail callers with more time left.
+_model_calls = single_flight.group("model_calls", private_errors=(resilience.DeadlineExceeded,))
+
+def _generate_text(model, prompt_parts, full_prompt_text):
+    """
+    Runs one model call and returns its raw text. The call is bounded by the
+    request deadline, retried on transient errors and guarded by the model's
+    circuit breaker (see resilience.call_model).
+    """
+    model_started = time.perf_counter()
+    response = resilience.call_model(_model_name(model), lambda: model.generate_content(prompt_parts))
+    raw_response_text = response_text(response)
+    if metrics.ENABLED:
+        prompt_tokens = estimate_tokens(full_prompt_text)
+        metrics.count("prompt_tokens", prompt_tokens)
+        metrics.count("response_chars", len(raw_response_text))
+        metrics.observe_model_call(_model_name(model), time.perf_counter() - model_started, prompt_tokens, len(raw_response_text))
+    return raw_response_text
+
+def call_gemini(model: "GenerativeModel", prompt_parts: list, developer_mode: bool = False, use_cache: bool = True):
     """
     Handles the interaction with the Gemini model, including prompt execution,
     response parsing, and error handling.
+
+    Successful responses are stored in the shared response cache, keyed on the
+    model name and the content of every prompt part, so identical requests are
+    answered without another round trip. Pass use_cache=False to opt out.
+
+    Cacheable calls are also coalesced while in flight: concurrent callers
+    with the same key share one model call instead of each making their own.
+    Only the raw text is shared; each caller parses its own copy.
+
+    A model_router.Cascade is run step by step: each model in turn until one
+    returns output that passes the handler's policy.
     """
+    if model_router.is_cascade(model):
+        return model.run(lambda step_model: call_gemini(step_model, prompt_parts, developer_mode, use_cache))
+
     full_prompt_text = "".join([p for p in prompt_parts if isinstance(p, str)])
+    metrics.count("prompt_chars", len(full_prompt_text))
 
     if developer_mode:
         return {"prompt_text": full_prompt_text, "raw_response_text": None, "result": None, "error": None}
 
-    try:
-        response = model.generate_content(prompt_parts)
+    cache_key = None
+    if use_cache:
+        with metrics.stage("cache_lookup"):
+            cache_key = response_cache.make_cache_key(_model_name(model), prompt_parts)
+            cached = response_cache.default_cache.get(cache_key)
+        if cached is not None:
+            metrics.count("cache_hits")
+            metrics.observe_cache_hit(_model_name(model))
+            return {**copy.deepcopy(cached), "prompt_text": full_prompt_text, "cache_hit": True}
 
-        # --- THIS IS THE FIX ---
-        # The 'response.text' property can be unreliable. The robust way to get the
-        # full text content is to iterate through the response 'parts' and join them.
-        # This handles all cases and ensures a string is always produced.
-        raw_response_text = "".join([part.text for part in response.parts]) if hasattr(response, 'parts') and response.parts else response.text
+    # A slot on this model, if the request doesn't hold one yet (e.g. a cascade escalating).
+    admission.hold_slot(_model_name(model))
 
-        json_string = raw_response_text.strip().replace("```json", "").replace("```", "").strip()
-        ai_result = json.loads(json_string)
+    raw_response_text = None
+    coalesced = False
+    try:
+        with metrics.stage("model"):
+            if cache_key is not None and single_flight.SINGLE_FLIGHT_ENABLED:
+                raw_response_text, coalesced = _model_calls.do(
+                    cache_key, lambda: _generate_text(model, prompt_parts, full_prompt_text),
+                    timeout=resilience.wait_timeout(single_flight.SINGLE_FLIGHT_WAIT_SECONDS),
+                )
+            else:
+                raw_response_text = _generate_text(model, prompt_parts, full_prompt_text)
+        if coalesced:
+            metrics.count("coalesced_model_calls")
+
+        with metrics.stage("parse_json"):
+            json_string = raw_response_text.strip().replace("```json", "").replace("```", "").strip()
+            ai_result = json.loads(json_string)
         error_message = None
 
     except json.JSONDecodeError as e:
         ai_result = None
         error_message = f"Failed to parse AI response as JSON: {e}. Raw response: {raw_response_text}"
+    except (resilience.DeadlineExceeded, resilience.CircuitOpen) as e:
+        ai_result = None
+        error_message = str(e)
     except Exception as e:
         ai_result = None
         error_message = f"An unexpected error occurred: {e}"
 
+    # Only cache clean results; errors should always get a fresh attempt.
+    # A coalesced caller's leader has already stored this one.
+    if cache_key is not None and error_message is None and not coalesced:
+        # A copy: callers add to their result (e.g. local nutrition) after this.
+        response_cache.default_cache.set(cache_key, {
+            "raw_response_text": raw_response_text,
+            "result": copy.deepcopy(ai_result),
+            "error": None
+        })
+
     return {
         "prompt_text": full_prompt_text,
         "raw_response_text": raw_response_text,
         "result": ai_result,
-        "error": error_message
-    }
\ No newline at end of file
+        "error": error_message,
+        "cache_hit": False,
+        "coalesced": coalesced
+    }
+
+def get_cache_stats():
+    """Returns hit/miss counters for the shared response cache, plus in-flight coalescing counters."""
+    return {**response_cache.default_cache.get_stats(), "single_flight": single_flight.get_stats()}
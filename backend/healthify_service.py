@@ -11,6 +11,8 @@ def handle_healthify_recipe(request_json, model):
     """
     healthify_request = request_json['healthify_recipe_request']
     developer_mode = request_json.get("developer_mode", False)
+    # Healthify is a creative task, so users expect a fresh take unless they opt in.
+    use_cache = request_json.get("use_cache", False)
 
     # 1. Extract data
     recipe_data = healthify_request.get('recipe_data', {})
@@ -20,6 +22,6 @@ def handle_healthify_recipe(request_json, model):
     prompt_parts = prompts.build_healthify_recipe_prompt(recipe_data, dietary_profile)
     
     # 3. Call the central Gemini service
-    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode)
+    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
 
     return response_data
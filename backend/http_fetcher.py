@@ -0,0 +1,236 @@
+# backend/http_fetcher.py
+import email.utils
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# --- Configuration ---
+FETCH_TIMEOUT_SECONDS = float(os.environ.get("RECETTE_FETCH_TIMEOUT_SECONDS", "10"))
+FETCH_MAX_BYTES = int(os.environ.get("RECETTE_FETCH_MAX_BYTES", str(3 * 1024 * 1024)))
+FETCH_POOL_SIZE = int(os.environ.get("RECETTE_FETCH_POOL_SIZE", "16"))
+# Set RECETTE_HTTP_CACHE_DIR to an empty string to disable the on-disk cache.
+HTTP_CACHE_DIR = os.environ.get("RECETTE_HTTP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "recette-http-cache"))
+HTTP_CACHE_MAX_ENTRIES = int(os.environ.get("RECETTE_HTTP_CACHE_MAX_ENTRIES", "2000"))
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+# urllib3 only decodes brotli when the brotli package is importable.
+ACCEPT_ENCODING = "gzip, deflate, br" if importlib.util.find_spec("brotli") else "gzip, deflate"
+
+# Heuristic freshness for responses with Last-Modified but no explicit lifetime (RFC 9111 4.2.2).
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_SECONDS = 24 * 60 * 60
+
+# Response headers kept with a cached body (lowercased), for freshness after a 304.
+STORED_HEADERS = ("cache-control", "expires", "date", "last-modified", "etag")
+
+_MAX_AGE_RE = re.compile(r"(?:^|,)\s*(s-maxage|max-age)\s*=\s*\"?(\d+)\"?", re.IGNORECASE)
+
+
+def _cache_control(headers):
+    return {d.strip().split("=", 1)[0].lower() for d in headers.get("Cache-Control", "").split(",") if d.strip()}
+
+
+def freshness_lifetime(headers, now):
+    """
+    Returns how many seconds a response may be served without revalidation.
+    headers must look names up case-insensitively (e.g. response.headers).
+    """
+    directives = _cache_control(headers)
+    if "no-cache" in directives or "no-store" in directives:
+        return 0
+    ages = dict((name.lower(), int(value)) for name, value in _MAX_AGE_RE.findall(headers.get("Cache-Control", "")))
+    if "s-maxage" in ages:
+        return ages["s-maxage"]
+    if "max-age" in ages:
+        return ages["max-age"]
+
+    expires = _parse_http_date(headers.get("Expires"))
+    if expires is not None:
+        date = _parse_http_date(headers.get("Date")) or now
+        return max(0, expires - date)
+
+    last_modified = _parse_http_date(headers.get("Last-Modified"))
+    if last_modified is not None:
+        return min(HEURISTIC_MAX_SECONDS, max(0, (now - last_modified) * HEURISTIC_FRACTION))
+    return 0
+
+
+def _parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class _DiskCache:
+    """
+    Stores one metadata file and one body file per URL. The directory is
+    created on the first store, so importing the fetcher touches no disk.
+    """
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".body"
+
+    def load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+
+    def store(self, url, meta, body=None):
+        meta_path, body_path = self._paths(url)
+        os.makedirs(self.directory, exist_ok=True)
+        if body is not None:
+            self._atomic_write(body_path, body)
+        self._atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+        self._evict()
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        with self._lock:
+            try:
+                metas = [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+            except OSError:
+                return
+            if len(metas) <= self.max_entries:
+                return
+            metas.sort(key=lambda e: e.stat().st_mtime)
+            for entry in metas[: len(metas) - self.max_entries]:
+                for path in (entry.path, entry.path[: -len(".json")] + ".body"):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+
+class HttpFetcher:
+    """
+    A shared page fetcher for every scraping path:
+    1. One pooled keep-alive session, so repeat hosts skip DNS/TCP/TLS setup.
+    2. Compressed transfer (gzip, deflate and brotli when available).
+    3. Streaming reads capped at max_bytes.
+    4. An on-disk HTTP cache honouring Cache-Control, Expires, ETag and Last-Modified.
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, max_bytes=FETCH_MAX_BYTES,
+                 timeout=FETCH_TIMEOUT_SECONDS, pool_size=FETCH_POOL_SIZE):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING})
+        self.cache = _DiskCache(cache_dir, HTTP_CACHE_MAX_ENTRIES) if cache_dir else None
+        self.stats = {"fetches": 0, "cache_hits": 0, "revalidated": 0, "truncated": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def fetch(self, url):
+        """
+        Returns the body of a URL as bytes, from cache when it is still fresh.
+        Raises requests.exceptions.RequestException on network or HTTP errors.
+        """
+        now = time.time()
+        cached = self.cache.load(url) if self.cache else None
+        request_headers = {}
+        if cached:
+            meta, body = cached
+            if meta["expires_at"] > now:
+                self._count("cache_hits")
+                return body
+            if meta.get("etag"):
+                request_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                request_headers["If-Modified-Since"] = meta["last_modified"]
+
+        self._count("fetches")
+        with self.session.get(url, headers=request_headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304 and cached:
+                self._count("revalidated")
+                meta, body = cached
+                # Servers may send any case; entries written before keys were lowercased still load.
+                merged_headers = CaseInsensitiveDict(meta.get("headers", {}))
+                merged_headers.update(response.headers)
+                meta["expires_at"] = now + freshness_lifetime(merged_headers, now)
+                meta["headers"] = _stored_headers(merged_headers)
+                self.cache.store(url, meta)
+                return body
+
+            response.raise_for_status()
+            body, truncated = self._read_capped(response)
+            if not truncated:
+                # A cut-off page is still worth parsing once, but never worth
+                # serving (or revalidating) as if it were the whole body.
+                self._maybe_store(url, response, body, now)
+            return body
+
+    def _read_capped(self, response):
+        """Returns (body, truncated), reading at most one chunk past max_bytes."""
+        chunks, size = [], 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_bytes:
+                # Recipe content (and its JSON-LD) sits near the top of the page;
+                # stop reading rather than buffering an unbounded body.
+                self._count("truncated")
+                return b"".join(chunks)[: self.max_bytes], True
+        return b"".join(chunks), False
+
+    def _maybe_store(self, url, response, body, now):
+        if self.cache is None or "no-store" in _cache_control(response.headers):
+            return
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        lifetime = freshness_lifetime(response.headers, now)
+        if lifetime <= 0 and not etag and not last_modified:
+            return  # Nothing to serve from cache and nothing to revalidate with.
+        meta = {
+            "url": url,
+            "stored_at": now,
+            "expires_at": now + lifetime,
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": _stored_headers(response.headers),
+        }
+        self.cache.store(url, meta, body)
+
+
+def _stored_headers(headers):
+    return {k.lower(): v for k, v in headers.items() if k.lower() in STORED_HEADERS}
+
+
+# The shared, process-wide fetcher used by utils.
+default_fetcher = HttpFetcher()
@@ -0,0 +1,244 @@
+# backend/image_preprocessor.py
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+# 1600px on the long side keeps cookbook body text legible to the model while
+# cutting a typical 12MP phone photo to a few hundred KB.
+IMAGE_MAX_DIMENSION = int(os.environ.get("RECETTE_IMAGE_MAX_DIMENSION", "1600"))
+IMAGE_QUALITY = int(os.environ.get("RECETTE_IMAGE_QUALITY", "80"))
+IMAGE_GRAYSCALE = os.environ.get("RECETTE_IMAGE_GRAYSCALE", "").lower() in ("1", "true", "yes")
+IMAGE_CROP_MARGINS = os.environ.get("RECETTE_IMAGE_CROP_MARGINS", "").lower() in ("1", "true", "yes")
+# Perceptual hashes are HASH_SIZE x HASH_SIZE bits. Text pages look alike at
+# low resolution, so the hash is large and the allowed distance small.
+HASH_SIZE = 16
+# Re-encoded or resized copies of one photo land within a few bits. Re-shot
+# pages can reach ~10 bits, but so can two similar layouts, so those aren't matched.
+IMAGE_HASH_MAX_DISTANCE = int(os.environ.get("RECETTE_IMAGE_HASH_DISTANCE", "4"))
+IMAGE_HASH_CACHE_SIZE = int(os.environ.get("RECETTE_IMAGE_HASH_CACHE_SIZE", "256"))
+
+# Accepted image types, by leading bytes. GIFs are always re-encoded, since Gemini doesn't take them.
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+_HEIF_BRANDS = {b"heic": "image/heic", b"heix": "image/heic", b"mif1": "image/heif", b"msf1": "image/heif", b"heif": "image/heif"}
+# Pixels darker than this (0-255, after inversion brighter) count as page content when cropping.
+_CONTENT_THRESHOLD = 48
+
+
+def sniff_mime_type(data):
+    """Returns the MIME type of an image from its leading bytes, or None if it isn't a supported image."""
+    head = bytes(data[:32])
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return _HEIF_BRANDS.get(head[8:12])
+    return None
+
+def resolve_options(overrides=None):
+    """Merges a request's image_options over the deployment defaults."""
+    overrides = overrides or {}
+    return {
+        "max_dimension": int(overrides.get("max_dimension", IMAGE_MAX_DIMENSION)),
+        "quality": int(overrides.get("quality", IMAGE_QUALITY)),
+        "grayscale": bool(overrides.get("grayscale", IMAGE_GRAYSCALE)),
+        "crop_margins": bool(overrides.get("crop_margins", IMAGE_CROP_MARGINS)),
+    }
+
+
+# --- Perceptual Hash Cache ---
+
+def perceptual_hash(image):
+    """A difference hash: one bit per horizontally adjacent pixel pair of a small grayscale copy."""
+    from PIL import Image
+    small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for column in range(HASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + column] < pixels[offset + column + 1])
+    return bits
+
+
+class PerceptualHashCache:
+    """
+    Remembers prepared images by perceptual hash, so a re-submitted photo
+    (re-compressed, resized) reuses the first result. Identical prepared
+    bytes also mean the response cache can answer it. Entries are scoped to
+    the client that uploaded them (see admission.client_scope): one client's
+    photo is never served for another's, and a hit reveals nothing about
+    what anyone else uploaded.
+    """
+
+    def __init__(self, max_entries=IMAGE_HASH_CACHE_SIZE, max_distance=IMAGE_HASH_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def find(self, image_hash, aspect, options_key, scope=None):
+        """Returns (entry, distance) for the scope's closest match within max_distance, or (None, None)."""
+        best, best_distance = None, None
+        with self._lock:
+            for key, entry in self._entries.items():
+                if key[0] != scope or entry["options_key"] != options_key or abs(entry["aspect"] - aspect) > 0.05:
+                    continue
+                distance = (key[1] ^ image_hash).bit_count()
+                if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                    best, best_distance = key, distance
+            if best is None:
+                self.stats["misses"] += 1
+                return None, None
+            self._entries.move_to_end(best)
+            self.stats["hits"] += 1
+            return self._entries[best], best_distance
+
+    def find_exact(self, digest, options_key, scope=None):
+        """Returns the scope's entry for byte-identical input, which needs no decoding to recognise."""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if key[0] == scope and entry["digest"] == digest and entry["options_key"] == options_key:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry
+        return None
+
+    def put(self, image_hash, entry, scope=None):
+        key = (scope, image_hash)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "size": len(self._entries)}
+
+
+default_hash_cache = PerceptualHashCache()
+
+
+# --- Pipeline ---
+
+def _crop_margins(image):
+    """Crops plain page margins around the content, leaving a little padding."""
+    from PIL import ImageOps
+    content = ImageOps.invert(ImageOps.autocontrast(image.convert("L"))).point(lambda v: 255 if v > _CONTENT_THRESHOLD else 0)
+    box = content.getbbox()
+    if not box:
+        return image
+    left, top, right, bottom = box
+    # A tiny box means the threshold caught a smudge, not the page.
+    if (right - left) * (bottom - top) < 0.2 * image.width * image.height:
+        return image
+    pad_x, pad_y = int(image.width * 0.02), int(image.height * 0.02)
+    return image.crop((max(0, left - pad_x), max(0, top - pad_y), min(image.width, right + pad_x), min(image.height, bottom + pad_y)))
+
+def _flatten(image, grayscale):
+    if grayscale:
+        return image.convert("L")
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        from PIL import Image
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+def _passthrough(data, mime_type, report, reason):
+    report.update(bytes_after=len(data), mime_type=mime_type, processed=False, reason=reason)
+    return {"data": data, "mime_type": mime_type, "report": report}
+
+def _hex(image_hash):
+    return f"{image_hash:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+def _reuse(cached, report, distance, started):
+    report.update(bytes_after=len(cached["data"]), mime_type=cached["mime_type"], width=cached["width"],
+                  height=cached["height"], perceptual_hash=_hex(cached["perceptual_hash"]), processed=True,
+                  reused=True, hash_distance=distance, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+    return {"data": cached["data"], "mime_type": cached["mime_type"], "report": report}
+
+def prepare_image(data, options=None, scope=None):
+    """
+    Prepares an uploaded recipe photo for the model:
+    1. Detects the real image type (raises a 400 for anything else).
+    2. Reuses the result for the same bytes, or a perceptually identical photo,
+       sent earlier by the same client (scope).
+    3. Applies EXIF orientation, optionally crops margins and converts to grayscale.
+    4. Downscales to max_dimension and re-encodes as JPEG at the target quality,
+       keeping the original when that wouldn't make it smaller.
+    Returns {data, mime_type, report}; report carries the byte counts before
+    and after. Without Pillow (or for formats it can't decode, such as HEIC)
+    the image is passed through with its detected type.
+    """
+    started = time.perf_counter()
+    options = resolve_options(options)
+    mime_type = sniff_mime_type(data)
+    if mime_type is None:
+        raise Exception("Unsupported image type. Send a JPEG, PNG, WebP, GIF or HEIC image.", 400)
+    report = {"bytes_before": len(data), "mime_type_in": mime_type}
+    options_key = tuple(sorted(options.items()))
+    digest = hashlib.sha256(data).hexdigest()
+    cached = default_hash_cache.find_exact(digest, options_key, scope)
+    if cached:
+        return _reuse(cached, report, 0, started)
+
+    try:
+        from PIL import Image, ImageOps, UnidentifiedImageError
+    except ImportError:
+        return _passthrough(data, mime_type, report, "pillow_unavailable")
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_size = image.size
+        rotated = image.getexif().get(0x0112, 1) != 1
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale directly, which is far
+        # faster and lighter than decoding every pixel and then shrinking.
+        # draft() never goes below the requested size, so ask for the final one.
+        scale = min(1.0, options["max_dimension"] / max(source_size))
+        image.draft("RGB", (max(1, int(source_size[0] * scale)), max(1, int(source_size[1] * scale))))
+        image = ImageOps.exif_transpose(image)
+    except Image.DecompressionBombError:
+        raise Exception("Image is too large to process.", 400)
+    except (UnidentifiedImageError, OSError):
+        return _passthrough(data, mime_type, report, "undecodable")
+
+    image_hash = perceptual_hash(image)
+    cached, distance = default_hash_cache.find(image_hash, image.width / image.height, options_key, scope)
+    if cached:
+        return _reuse(cached, report, distance, started)
+
+    aspect = image.width / image.height
+    if options["crop_margins"]:
+        image = _crop_margins(image)
+    image = _flatten(image, options["grayscale"])
+    image.thumbnail((options["max_dimension"], options["max_dimension"]), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=options["quality"], optimize=True)
+    prepared, prepared_type = output.getvalue(), "image/jpeg"
+    unchanged = image.size == source_size and not rotated and not options["grayscale"]
+    if unchanged and len(prepared) >= len(data) and mime_type != "image/gif":
+        # Already small (e.g. a screenshot); re-encoding would only lose detail.
+        prepared, prepared_type = data, mime_type
+
+    default_hash_cache.put(image_hash, {
+        "data": prepared, "mime_type": prepared_type, "width": image.width, "height": image.height,
+        "aspect": aspect, "options_key": options_key, "digest": digest, "perceptual_hash": image_hash,
+    }, scope)
+    report.update(bytes_after=len(prepared), mime_type=prepared_type, width=image.width, height=image.height,
+                  perceptual_hash=_hex(image_hash), processed=True, reused=False, elapsed_ms=round((time.perf_counter() - started) * 1000, 1))
+    return {"data": prepared, "mime_type": prepared_type, "report": report}
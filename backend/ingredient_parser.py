@@ -0,0 +1,173 @@
+# backend/ingredient_parser.py
+import json
+import re
+
+# --- Quantity & Unit Vocabulary ---
+
+UNICODE_FRACTIONS = {
+    "½": 0.5, "⅓": 1 / 3, "⅔": 2 / 3, "¼": 0.25, "¾": 0.75, "⅕": 0.2, "⅖": 0.4,
+    "⅗": 0.6, "⅘": 0.8, "⅙": 1 / 6, "⅚": 5 / 6, "⅛": 0.125, "⅜": 0.375,
+    "⅝": 0.625, "⅞": 0.875,
+}
+
+# Maps every spelling we accept to the canonical unit we emit.
+UNIT_ALIASES = {
+    "cup": "cup", "cups": "cup", "c": "cup",
+    "tablespoon": "tbsp", "tablespoons": "tbsp", "tbsp": "tbsp", "tbs": "tbsp", "tbl": "tbsp", "T": "tbsp",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tsp": "tsp", "t": "tsp",
+    "gram": "g", "grams": "g", "g": "g", "gr": "g",
+    "kilogram": "kg", "kilograms": "kg", "kg": "kg",
+    "milligram": "mg", "milligrams": "mg", "mg": "mg",
+    "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml", "ml": "ml",
+    "liter": "l", "liters": "l", "litre": "l", "litres": "l", "l": "l",
+    "ounce": "oz", "ounces": "oz", "oz": "oz",
+    "fluid ounce": "fl oz", "fluid ounces": "fl oz", "fl oz": "fl oz",
+    "pound": "lb", "pounds": "lb", "lb": "lb", "lbs": "lb",
+    "pint": "pint", "pints": "pint", "pt": "pint",
+    "quart": "quart", "quarts": "quart", "qt": "quart",
+    "gallon": "gallon", "gallons": "gallon", "gal": "gallon",
+    "can": "can", "cans": "can", "tin": "can", "tins": "can",
+    "jar": "jar", "jars": "jar",
+    "bottle": "bottle", "bottles": "bottle",
+    "box": "box", "boxes": "box",
+    "bag": "bag", "bags": "bag",
+    "package": "package", "packages": "package", "pkg": "package", "packet": "package", "packets": "package",
+    "carton": "carton", "cartons": "carton",
+    "clove": "clove", "cloves": "clove",
+    "slice": "slice", "slices": "slice",
+    "stick": "stick", "sticks": "stick",
+    "bunch": "bunch", "bunches": "bunch",
+    "head": "head", "heads": "head",
+    "sprig": "sprig", "sprigs": "sprig",
+    "pinch": "pinch", "pinches": "pinch",
+    "dash": "dash", "dashes": "dash",
+    "handful": "handful", "handfuls": "handful",
+    "loaf": "loaf", "loaves": "loaf",
+    "dozen": "dozen",
+}
+
+_NUMBER = r"(?:\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?\s*[½⅓⅔¼¾⅕⅖⅗⅘⅙⅚⅛⅜⅝⅞]|\d+(?:[.,]\d+)?|[½⅓⅔¼¾⅕⅖⅗⅘⅙⅚⅛⅜⅝⅞])"
+_QUANTITY_RE = re.compile(
+    rf"^\s*(?P<quantity>{_NUMBER}(?:\s*(?:-|–|to|or)\s*{_NUMBER})?)\s*"
+)
+# Longest aliases first so "fluid ounces" wins over "fl" and "tablespoons" over "t".
+_UNIT_RE = re.compile(
+    r"^(?P<unit>" + "|".join(re.escape(u) for u in sorted(UNIT_ALIASES, key=len, reverse=True)) + r")\.?(?=\s|$|\))",
+)
+_PAREN_RE = re.compile(r"\(([^)]*)\)")
+
+
+def _number_value(token):
+    """Converts a single quantity token ('1 1/2', '¾', '2,5') into a float."""
+    token = token.strip().replace(",", ".")
+    total = 0.0
+    for char, value in UNICODE_FRACTIONS.items():
+        if char in token:
+            total += value
+            token = token.replace(char, "").strip()
+    if not token:
+        return total
+    if " " in token:
+        whole, fraction = token.split(None, 1)
+        return total + float(whole) + _number_value(fraction)
+    if "/" in token:
+        numerator, denominator = token.split("/", 1)
+        return total + float(numerator) / float(denominator)
+    return total + float(token)
+
+
+def parse_quantity(text):
+    """
+    Splits a leading quantity off a line of text.
+    Returns (quantity_display, quantity_numeric, remainder). Ranges such as
+    '2-3' or '2 or 3' are averaged, matching the contract in JSON_STRUCTURE_PROMPT.
+    """
+    match = _QUANTITY_RE.match(text)
+    if not match:
+        return "", None, text.strip()
+
+    display = match.group("quantity").strip()
+    values = [_number_value(v) for v in re.split(r"\s*(?:-|–|to|or)\s*", display) if v.strip()]
+    numeric = sum(values) / len(values) if values else None
+    if numeric is not None:
+        numeric = round(numeric, 3)
+    return display, numeric, text[match.end():].strip()
+
+
+def parse_unit(text):
+    """Splits a leading unit off a line. Returns (canonical_unit, remainder, size_note)."""
+    # A parenthetical size ("1 (14 oz) can tomatoes") belongs to the notes, not the unit.
+    size_note = ""
+    if text.startswith("("):
+        closing = text.find(")")
+        if closing != -1:
+            size_note, text = text[1:closing].strip(), text[closing + 1:].strip()
+
+    match = _UNIT_RE.match(text)
+    if not match:
+        lowered = text.lower()
+        match = _UNIT_RE.match(lowered)
+        if not match or match.group("unit") in ("t", "c"):
+            # Single-letter units are only trusted in their exact case.
+            return "", text, size_note
+    unit = UNIT_ALIASES[match.group("unit")]
+    remainder = text[match.end():].strip()
+    if remainder.lower().startswith("of "):
+        remainder = remainder[3:].strip()
+    return unit, remainder, size_note
+
+
+def parse_ingredient_line(line):
+    """
+    Parses a free-text ingredient line into the ingredient shape defined in
+    JSON_STRUCTURE_PROMPT: quantity_display, quantity_numeric, unit, name, notes.
+    """
+    text = " ".join(str(line).split())
+    quantity_display, quantity_numeric, remainder = parse_quantity(text)
+    unit, remainder, size_note = parse_unit(remainder)
+
+    notes = [size_note] if size_note else []
+    notes.extend(n.strip() for n in _PAREN_RE.findall(remainder) if n.strip())
+    remainder = _PAREN_RE.sub("", remainder).strip()
+    if "," in remainder:
+        remainder, trailing = remainder.split(",", 1)
+        if trailing.strip():
+            notes.append(trailing.strip())
+
+    return {
+        "quantity_display": quantity_display,
+        "quantity_numeric": quantity_numeric,
+        "unit": unit,
+        "name": " ".join(remainder.split()).strip(" ,;:-"),
+        "notes": ", ".join(notes),
+    }
+
+
+# --- Client Recipe Helpers ---
+
+def load_ingredients(recipe):
+    """
+    Returns a recipe's ingredients as a list, whatever form the client sent.
+    Recipes from the app's database carry them as a JSON-encoded string; recipes
+    straight from the AI carry them as a list of dicts or plain strings.
+    """
+    ingredients = recipe.get("ingredients") or []
+    if isinstance(ingredients, str):
+        try:
+            ingredients = json.loads(ingredients)
+        except json.JSONDecodeError:
+            ingredients = [line for line in ingredients.splitlines() if line.strip()]
+    return ingredients if isinstance(ingredients, list) else []
+
+
+def ingredient_names(recipe):
+    """Returns the bare ingredient names of a client recipe dict."""
+    names = []
+    for ingredient in load_ingredients(recipe):
+        if isinstance(ingredient, dict):
+            name = ingredient.get("name") or ""
+        else:
+            name = parse_ingredient_line(ingredient)["name"]
+        if name:
+            names.append(str(name))
+    return names
@@ -0,0 +1,122 @@
+# backend/inventory_parser.py
+import re
+
+from .ingredient_parser import parse_quantity, parse_unit
+
+# --- Local Inventory Parser ---
+# Parses pasted pantry lists ("--- FRIDGE ---", "2 cans tomatoes") into the
+# item shape of get_inventory_parse_prompt. Lines it isn't confident about
+# are returned separately so only those need a model call.
+
+# Common ways people name the default locations; matched after the user's own names.
+LOCATION_SYNONYMS = {
+    "fridge": ("refrigerator", "refrigerated", "refridgerator", "chiller", "cooler"),
+    "freezer": ("deep freeze", "deep freezer", "frozen"),
+    "pantry": ("cupboard", "cupboards", "larder", "cabinet", "dry goods", "shelf", "shelves"),
+    "spice rack": ("spices", "spice cabinet", "spice drawer", "herbs and spices"),
+}
+NUMBER_WORDS = {
+    "a": "1", "an": "1", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+    "seven": "7", "eight": "8", "nine": "9", "ten": "10", "eleven": "11", "twelve": "12", "half": "1/2",
+}
+# Longer than this, a "name" is more likely a sentence than an item.
+MAX_NAME_WORDS = 6
+
+_BULLET_RE = re.compile(r"^\s*(?:[-*•·+>]|\d+[.)]|\[[ xX]?\])\s+")
+_DECORATION = r"\s\-=#*_\[\]<>|~"
+_DECORATION_RE = re.compile(rf"^[{_DECORATION}]+|[{_DECORATION}:]+$")
+_HEADING_LEAD_RE = re.compile(r"^(?:(?:in|on|from|at|inside)\s+)?(?:(?:the|my|our)\s+)?", re.I)
+# "Milk x2", "Eggs (12)", "Butter - 2 sticks", "Milk: 1 gallon"
+_TRAILING_QUANTITY_RE = re.compile(
+    r"^(?P<name>[^\d]+?)\s*(?:[x×]\s*(?P<times>\d+)|\((?P<count>\d+)\)|[-–:]\s*(?P<amount>\d.*))$", re.I
+)
+# "half an onion", "a bag of rice", "2 cans of tomatoes"
+_LEADING_FILLER_RE = re.compile(r"^(?:(?:a|an|of)\s+)+", re.I)
+_UNCERTAIN_RE = re.compile(r",|;|/|\band\b|\bor\b|\bof\b|\bsome\b|\bfew\b|\bleft\b|\?", re.I)
+
+
+def _location_key(text):
+    words = re.findall(r"[a-z]+", text.lower())
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+def build_location_index(locations):
+    """Maps normalised names (and synonyms of the default ones) to the user's location names."""
+    index = {}
+    for location in locations:
+        index.setdefault(_location_key(location), location)
+    for location in locations:
+        for synonym in LOCATION_SYNONYMS.get(_location_key(location), ()):
+            index.setdefault(_location_key(synonym), location)
+    return index
+
+def parse_heading(line, location_index):
+    """
+    Returns (is_heading, location_name). location_name is None for a heading
+    that doesn't name a known location.
+    """
+    stripped = _DECORATION_RE.sub("", line.strip()).strip()
+    decorated = stripped != line.strip()
+    candidate = _HEADING_LEAD_RE.sub("", stripped)
+    location = location_index.get(_location_key(candidate)) if candidate else None
+    if location:
+        return True, location
+    looks_like_heading = decorated and stripped and not any(c.isdigit() for c in stripped) and len(stripped.split()) <= 4
+    return bool(looks_like_heading), None
+
+def _expand_number_word(text):
+    """'two onions' -> '2 onions', 'half an onion' -> '1/2 onion'."""
+    first, _, rest = text.partition(" ")
+    number = NUMBER_WORDS.get(first.lower())
+    if not number or not rest:
+        return text
+    rest = _LEADING_FILLER_RE.sub("", rest) or rest
+    return f"{number} {rest}"
+
+def parse_item(line):
+    """
+    Parses one item line into {name, quantity, unit}, or returns None when the
+    line isn't simple enough to trust (several items, prose, odd amounts).
+    """
+    text = " ".join(_BULLET_RE.sub("", line).split())
+    trailing = _TRAILING_QUANTITY_RE.match(text)
+    if trailing:
+        amount = trailing.group("times") or trailing.group("count") or trailing.group("amount")
+        text = f"{amount} {trailing.group('name')}"
+
+    quantity, _, remainder = parse_quantity(_expand_number_word(text))
+    unit, remainder, _ = parse_unit(remainder)
+    if unit:
+        remainder = _LEADING_FILLER_RE.sub("", remainder.lstrip())
+    name = " ".join(re.sub(r"\([^)]*\)", "", remainder).split()).strip(" .:-")
+    if (not name or _UNCERTAIN_RE.search(name) or any(c.isdigit() for c in name)
+            or len(name.split()) > MAX_NAME_WORDS):
+        return None
+    return {"name": name, "quantity": quantity, "unit": unit}
+
+def parse_inventory_text(text, locations):
+    """
+    Parses a pasted inventory list.
+    Returns (items, unresolved): items in the get_inventory_parse_prompt shape,
+    each with its line number, and the lines that need the model, as
+    {line_number, text, heading} (heading is the text of an unrecognised
+    heading above the line, or the location it sits under).
+    """
+    location_index = build_location_index(locations)
+    items, unresolved = [], []
+    location, unknown_heading = None, None
+    for line_number, line in enumerate(str(text or "").splitlines()):
+        if not line.strip():
+            continue
+        # A bulleted line is always an item, even one that shares a location's name.
+        is_heading, heading_location = (False, None) if _BULLET_RE.match(line) else parse_heading(line, location_index)
+        if is_heading:
+            location = heading_location
+            unknown_heading = None if heading_location else _DECORATION_RE.sub("", line.strip()).strip()
+            continue
+
+        item = None if unknown_heading else parse_item(line)
+        if item is None:
+            unresolved.append({"line_number": line_number, "text": line.strip(), "heading": unknown_heading or location})
+            continue
+        items.append({**item, "location_name": location, "line_number": line_number})
+    return items, unresolved
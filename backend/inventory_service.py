@@ -1,28 +1,62 @@
 from . import prompts
 from . import gemini_service
+from . import inventory_parser
+from . import metrics
+
+LOCAL_PARSE = "local"
 
 def handle_inventory_import(request_json, model):
     """
     Orchestrates the inventory import process:
     1. Extracts data from the request.
-    2. Builds the prompt using the prompts module.
-    3. Calls the Gemini service to get the result.
+    2. Parses every simple line locally (headings, quantities, units).
+    3. Builds one small prompt for the lines the parser couldn't handle.
+    4. Calls the Gemini service for those lines only and merges them back in order.
+    "parse_mode": "model" sends the whole text to the model as before.
     """
     inventory_import_request = request_json['inventory_import_request']
     developer_mode = request_json.get("developer_mode", False)
+    use_cache = request_json.get("use_cache", True)
 
     # 1. Extract data
-    inventory_text = inventory_import_request.get('inventory_import_request', {}).get('text', '')
+    # The app sends the text directly; older payloads nested it one level deeper.
+    inventory_text = inventory_import_request.get('text')
+    if inventory_text is None:
+        inventory_text = inventory_import_request.get('inventory_import_request', {}).get('text', '')
     locations = inventory_import_request.get('locations', [])
 
-    # 2. Build the prompt
-    prompt_parts = prompts.get_inventory_parse_prompt(inventory_text, locations)
-    
-    # 3. Call the central Gemini service
-    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode)
+    if inventory_import_request.get('parse_mode', LOCAL_PARSE) != LOCAL_PARSE:
+        prompt_parts = prompts.get_inventory_parse_prompt(inventory_text, locations)
+        return gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
+
+    # 2. Parse locally
+    with metrics.stage("local_parse"):
+        items, unresolved = inventory_parser.parse_inventory_text(inventory_text, locations)
+    response_data = {"prompt_text": "", "raw_response_text": None, "result": items, "error": None}
 
+    # 3. and 4. Ask the model about the rest
+    if unresolved:
+        prompt_parts = prompts.build_inventory_lines_prompt(unresolved, locations)
+        response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
+        model_items = response_data["result"] if isinstance(response_data.get("result"), list) else []
+        response_data["result"] = None if developer_mode else items + [item for item in model_items if isinstance(item, dict)]
+        if response_data.get("error") and not developer_mode:
+            # Keep what was parsed locally; report the lines that were lost.
+            response_data["error"] = f"{len(unresolved)} line(s) could not be parsed: {response_data['error']}"
+
+    if response_data["result"] is not None:
+        response_data["result"].sort(key=_line_number)
+        for item in response_data["result"]:
+            item.pop("line_number", None)
+    response_data["parser"] = {"local_items": len(items), "model_lines": len(unresolved)}
     return response_data
 
+def _line_number(item):
+    try:
+        return int(item.get("line_number"))
+    except (TypeError, ValueError):
+        return -1
+
 def handle_meal_suggestion(request_json, model):
     """
     Orchestrates the meal suggestion process:
@@ -32,6 +66,8 @@ def handle_meal_suggestion(request_json, model):
     """
     meal_suggestion_request = request_json['meal_suggestion_request']
     developer_mode = request_json.get("developer_mode", False)
+    # Meal ideas are creative, so users expect a fresh suggestion unless they opt in.
+    use_cache = request_json.get("use_cache", False)
 
     # 1. Extract data
     inventory = meal_suggestion_request.get('inventory', [])
@@ -42,6 +78,6 @@ def handle_meal_suggestion(request_json, model):
     prompt_parts = prompts.get_meal_ideas_prompt(inventory, profile, intent)
     
     # 3. Call the central Gemini service
-    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode)
+    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
 
     return response_data
\ No newline at end of file
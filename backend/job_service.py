@@ -0,0 +1,198 @@
+# backend/job_service.py
+import contextvars
+import ipaddress
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from . import admission
+from . import job_store
+from . import metrics
+from . import model_router
+from . import resilience
+from .model_registry import models
+
+# --- Configuration ---
+JOB_WORKERS = int(os.environ.get("RECETTE_JOB_WORKERS", "4"))
+# Jobs accepted but not yet finished, per instance; beyond this, submissions get a 429.
+JOB_MAX_PENDING = int(os.environ.get("RECETTE_JOB_MAX_PENDING", "100"))
+# A job's whole budget, queueing included, counted from submission.
+JOB_DEADLINE_SECONDS = float(os.environ.get("RECETTE_JOB_DEADLINE_SECONDS", "600"))
+# How long a job waits for a model slot; jobs can wait far longer than a live request.
+JOB_ADMISSION_WAIT_SECONDS = 60.0
+CALLBACK_TIMEOUT_SECONDS = 10.0
+# Comma-separated hosts callbacks may go to (a host also allows its
+# subdomains). When empty, any host resolving only to public addresses is allowed.
+JOB_CALLBACK_HOSTS = [h.strip().lower() for h in os.environ.get("RECETTE_JOB_CALLBACK_HOSTS", "").split(",") if h.strip()]
+# Request keys that make no sense as jobs.
+SYNC_ONLY_HANDLERS = {"job_status_request", "cache_stats_request", "routing_stats_request", "admission_stats_request",
+                      "context_upload_request"}
+
+# --- Asynchronous Jobs ---
+# A request with "async": true is stored as a job and answered at once with
+# its job_id; a worker pool runs it through the normal router, and the
+# client polls job_status_request (or gets a POST to callback_url).
+# Workers keep running after the response is sent, so the function needs
+# CPU allocated outside requests (Cloud Run "CPU always allocated").
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_pending = 0
+_pending_lock = threading.Lock()
+_current_job = contextvars.ContextVar("recette_job_id", default=None)
+
+
+def report_progress(done, total, detail=""):
+    """Records progress for the job running in this context (a no-op outside jobs)."""
+    job_id = _current_job.get()
+    if job_id is not None and total:
+        job_store.get_default_store().set_progress(job_id, round(done / total, 4), detail)
+
+def check_callback_url(callback_url):
+    """
+    Raises a 400 unless callback_url is an https URL we may POST to: on the
+    allowlist if one is set, and never resolving to a private, loopback,
+    link-local or otherwise internal address (such as the metadata server).
+    Returns the addresses it resolved to, all of them checked.
+    """
+    parts = urlsplit(str(callback_url))
+    host = (parts.hostname or "").lower()
+    if parts.scheme != "https" or not host:
+        raise Exception("Invalid request. callback_url must be an https:// URL.", 400)
+    if JOB_CALLBACK_HOSTS and not any(host == allowed or host.endswith("." + allowed) for allowed in JOB_CALLBACK_HOSTS):
+        raise Exception("Invalid request. callback_url's host is not allowed.", 400)
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        raise Exception("Invalid request. callback_url's host does not resolve.", 400)
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise Exception("Invalid request. callback_url must point to a public host.", 400)
+    return sorted(addresses)
+
+def submit(request_json, images, handler_key, dispatch, error_details):
+    """
+    Stores a new job for the request and schedules it.
+    Returns the response for the client: the job_id and how to poll it.
+    """
+    if handler_key in SYNC_ONLY_HANDLERS or handler_key == "unknown":
+        raise Exception(f"Invalid request. {handler_key} can't run as a job.", 400)
+    callback_url = request_json.get("callback_url")
+    if callback_url is not None:
+        check_callback_url(callback_url)
+
+    global _pending
+    with _pending_lock:
+        if _pending >= JOB_MAX_PENDING:
+            raise admission.Rejected("Too many jobs are pending. Try again later.", 30, "jobs_full")
+        _pending += 1
+
+    try:
+        store = job_store.get_default_store()
+        store.fail_stale(JOB_DEADLINE_SECONDS + 60, "The job was interrupted by a server restart. Please submit it again.")
+        job_id = os.urandom(16).hex()
+        store.create(job_id, handler_key)
+        job_request = {k: v for k, v in request_json.items() if k not in ("async", "callback_url")}
+        submitted_at = time.monotonic()
+        _executor.submit(_run_job, job_id, job_request, images, handler_key, callback_url, submitted_at, dispatch, error_details,
+                         (admission.current_client(), admission.current_rate_key()))
+    except Exception:
+        # The job never reached a worker, so nothing else will count it down.
+        with _pending_lock:
+            _pending -= 1
+        raise
+    return {
+        "job_id": job_id,
+        "status": job_store.QUEUED,
+        "poll": {"job_status_request": {"job_id": job_id}},
+        "error": None,
+    }
+
+def _run_job(job_id, request_json, images, handler_key, callback_url, submitted_at, dispatch, error_details, client=(None, None)):
+    """
+    Runs one job on a worker thread:
+    1. Starts the job's deadline (counted from submission) and request metrics.
+    2. Waits for a model slot, like a live request but for longer.
+    3. Runs the normal handler and stores its response or error.
+    4. Notifies the callback URL, if one was given.
+    """
+    global _pending
+    store = job_store.get_default_store()
+    job_token = _current_job.set(job_id)
+    # Per-client caches and item metering still see the job's submitter.
+    client_token = admission.start_client(*client)
+    # 1. Budget and metrics
+    left_ms = (submitted_at + JOB_DEADLINE_SECONDS - time.monotonic()) * 1000
+    # No platform timeout stands behind a worker thread, so calls race the deadline.
+    deadline_token = resilience.start_deadline(max(0.0, left_ms), budget_seconds=JOB_DEADLINE_SECONDS, enforce=True)
+    metrics_token = metrics.start_request()
+    metrics.set_handler(handler_key)
+    lease = admission.NO_LEASE
+    status_code = 200
+    try:
+        store.mark_started(job_id)
+        # 2. Admission
+        model = model_router.select_model(handler_key, request_json, models)
+        lease = admission.admit(handler_key, request_json, model, wait_seconds=JOB_ADMISSION_WAIT_SECONDS)
+        # 3. Run
+        response_data = dispatch(request_json, images, model)
+        store.finish(job_id, response=response_data)
+    except Exception as e:
+        error_message, status_code = error_details(e)
+        store.finish(job_id, error=error_message, status_code=status_code)
+    finally:
+        lease.release()
+        metrics.finish_request(metrics_token, status_code)
+        resilience.end_deadline(deadline_token)
+        admission.end_client(client_token)
+        _current_job.reset(job_token)
+        with _pending_lock:
+            _pending -= 1
+
+    # 4. Callback
+    if callback_url:
+        _notify(callback_url, store.get(job_id))
+
+def _notify(callback_url, job):
+    """
+    POSTs the finished job to the client's callback URL. The URL is checked
+    again (its DNS may have changed since submission) and the POST connects
+    to an address that check vetted, never resolving the host a second time,
+    so DNS rebinding can't turn it toward an internal host. TLS is still
+    verified against the URL's host name. Redirects are not followed.
+    Best effort: failures are only logged.
+    """
+    import urllib3
+    from requests.certs import where
+    try:
+        address = check_callback_url(callback_url)[0]
+        parts = urlsplit(callback_url)
+        pool = urllib3.HTTPSConnectionPool(address, port=parts.port or 443, timeout=CALLBACK_TIMEOUT_SECONDS, retries=False,
+                                           cert_reqs="CERT_REQUIRED", ca_certs=where(),
+                                           server_hostname=parts.hostname, assert_hostname=parts.hostname)
+        with pool:
+            pool.urlopen("POST", (parts.path or "/") + (f"?{parts.query}" if parts.query else ""),
+                         body=json.dumps(job).encode("utf-8"), redirect=False,
+                         headers={"Host": parts.netloc.rpartition("@")[2], "Content-Type": "application/json"})
+    except Exception as e:
+        logger.warning("Job callback to %s failed: %s", callback_url, e)
+
+def handle_job_status(request_json):
+    """
+    Returns a job's status, progress and (once finished) the handler's
+    response or error, in the same shape as the synchronous response.
+    """
+    job_id = (request_json.get("job_status_request") or {}).get("job_id")
+    if not job_id:
+        raise Exception("Invalid request. job_status_request needs a job_id.", 400)
+    job = job_store.get_default_store().get(str(job_id))
+    if job is None:
+        raise Exception("Job not found. It may have expired.", 404)
+    return {"result": job, "error": None}
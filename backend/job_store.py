@@ -0,0 +1,151 @@
+# backend/job_store.py
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# --- Configuration ---
+# Local to the instance unless pointed at a shared volume.
+JOB_DB_PATH = os.environ.get("RECETTE_JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "recette-jobs.db"))
+JOB_TTL_SECONDS = float(os.environ.get("RECETTE_JOB_TTL_SECONDS", str(24 * 60 * 60)))
+# Expired jobs are deleted on access, at most this often.
+JOB_PURGE_INTERVAL_SECONDS = 300.0
+
+# Named like the app's JobStatus values.
+QUEUED, IN_PROGRESS, COMPLETE, FAILED = "queued", "in_progress", "complete", "failed"
+
+
+class JobStore:
+    """
+    Asynchronous jobs and their results. A job expires JOB_TTL_SECONDS after
+    it was last updated, whatever its state.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, ttl_seconds=JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    handler TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    progress_detail TEXT NOT NULL DEFAULT '',
+                    response TEXT,
+                    error TEXT,
+                    status_code INTEGER,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    updated_at REAL NOT NULL
+                );
+                """
+            )
+            self._conn.commit()
+
+    def _maybe_purge(self):
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + JOB_PURGE_INTERVAL_SECONDS
+            self.purge_expired()
+
+    def create(self, job_id, handler):
+        self._maybe_purge()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, handler, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, handler, QUEUED, now, now),
+            )
+            self._conn.commit()
+
+    def mark_started(self, job_id):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, updated_at = ? WHERE job_id = ?", (IN_PROGRESS, now, now, job_id)
+            )
+            self._conn.commit()
+
+    def set_progress(self, job_id, progress, detail=""):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, progress_detail = ?, updated_at = ? WHERE job_id = ?",
+                (progress, detail, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def finish(self, job_id, response=None, error=None, status_code=200):
+        """Stores the handler's response (complete) or its error (failed)."""
+        now = time.time()
+        status = FAILED if error else COMPLETE
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = CASE WHEN ? THEN 1 ELSE progress END, response = ?, error = ?, "
+                "status_code = ?, finished_at = ?, updated_at = ? WHERE job_id = ?",
+                (status, status == COMPLETE, None if response is None else json.dumps(response), error, status_code, now, now, job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if unknown or expired."""
+        self._maybe_purge()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT handler, status, progress, progress_detail, response, error, status_code, created_at, started_at, "
+                "finished_at, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None or row[10] + self.ttl_seconds < time.time():
+            return None
+        return {
+            "job_id": job_id,
+            "handler": row[0],
+            "status": row[1],
+            "progress": row[2],
+            "progress_detail": row[3] or None,
+            "response": None if row[4] is None else json.loads(row[4]),
+            "error": row[5],
+            "status_code": row[6],
+            "created_at": row[7],
+            "started_at": row[8],
+            "finished_at": row[9],
+        }
+
+    def fail_stale(self, max_age_seconds, error):
+        """
+        Fails queued or running jobs created more than max_age_seconds ago:
+        a live worker would have finished or timed out by now, so theirs is
+        gone (the process restarted).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, status_code = 500, finished_at = ?, updated_at = ? "
+                "WHERE status IN (?, ?) AND created_at < ?",
+                (FAILED, error, now, now, QUEUED, IN_PROGRESS, now - max_age_seconds),
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Returns the process-wide store, opening the database on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = JobStore()
+        return _default_store
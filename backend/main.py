@@ -1,30 +1,41 @@
 # This is the implementation for the Google Cloud function
 # It runs on the back-end to accept requests for AI analysis# main.py
 
+import time
+_import_started = time.perf_counter()
+
 import functions_framework
-from flask import jsonify
-import vertexai
-from vertexai.generative_models import GenerativeModel
+from flask import Response, jsonify, stream_with_context
+import importlib
 import json
+import sys
 
-from . import recipe_analysis_service
-from . import recipe_tools_service
-from . import inventory_service
-from . import profile_service
-# from prompts import get_conversational_chat_prompt
-from . import healthify_service
-from . import chat_service
-
-# --- Initialization ---
-PROJECT_ID = "recette-fdf64"
-GCP_REGION = "us-central1"
+# Service modules (and the Vertex SDK, BeautifulSoup, requests and numpy they
+# pull in) are imported on first use by _service(), and models are created
+# on first use by the registry, so cold starts only pay for what a request needs.
+from . import admission
+from . import context_store
+from . import metrics
+from . import model_router
+from . import resilience
+from . import startup_profile
+from .model_registry import models
 
-vertexai.init(project=PROJECT_ID, location=GCP_REGION)
+# Request keys, in routing order; also used to label metrics.
+HANDLER_KEYS = (
+    "recipe_analysis_request", "healthify_recipe_request", "find_similar_request", "find_duplicates_request",
+    "nutrition_request", "meal_suggestion_request", "inventory_import_request", "review_text", "chat_request",
+    "batch_request", "bulk_import_request", "context_upload_request", "job_status_request", "cache_stats_request", "routing_stats_request", "admission_stats_request",
+)
 
-models = {
-    "pro": GenerativeModel("gemini-2.5-pro"),
-    "flash": GenerativeModel("gemini-2.5-flash")
-}
+# --- Lazy Service Loading ---
+def _service(name):
+    """Imports a backend service module on first use. Imports are thread-safe and cached."""
+    module = f"{__package__}.{name}"
+    if module in sys.modules:
+        return sys.modules[module]
+    with startup_profile.timed(f"import:{name}"):
+        return importlib.import_module(module)
 
 # --- Main Cloud Function ---
 @functions_framework.http
@@ -38,7 +49,7 @@ def recipe_analyzer_api(request):
         headers = {
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "POST",
-            "Access-Control-Allow-Headers": "Content-Type",
+            "Access-Control-Allow-Headers": "Content-Type, X-Recette-Request, X-Recette-Deadline-Ms, X-Recette-Client",
             "Access-Control-Max-Age": "3600",
         }
         return ("", 204, headers)
@@ -46,40 +57,172 @@ def recipe_analyzer_api(request):
     # --- 2. Set CORS headers for the main request ---
     headers = {"Access-Control-Allow-Origin": "*"}
 
+    if request.method == "GET" and metrics.ENABLED and request.path.rstrip("/").endswith("/metrics"):
+        return (metrics.render_prometheus(), 200, {**headers, "Content-Type": "text/plain; version=0.0.4"})
+
+    metrics_token = metrics.start_request()
+    deadline_token = None
+    client_token = admission.start_client(admission.client_scope(request), admission.client_id(request))
+    lease = admission.NO_LEASE
+    status_code = 200
     try:
-        # --- 3. Parse Request and Select Model ---
-        request_json = request.get_json(silent=True)
+        # Model calls below share this budget (see resilience).
+        deadline_token = resilience.start_deadline(request.headers.get(resilience.DEADLINE_HEADER))
+
+        # --- 3. Parse Request ---
+        # Image uploads (multipart or a raw body) carry their JSON alongside the bytes.
+        images = None
+        uploads = _service("uploads")
+        if uploads.is_upload(request):
+            request_json, images = uploads.read_upload(request)
+        else:
+            request_json = request.get_json(silent=True)
         if not request_json:
             raise Exception("Invalid request. JSON body is required.", 400)
+        # Profile and inventory sent by reference (see context_store).
+        context_store.resolve_refs(request_json)
 
-        model_choice_key = request_json.get("model_choice", "gemini-2.5-pro")
-        model = models.get("flash" if "flash" in model_choice_key else "pro")
-
-        response_data = {}
-
-        # --- The Router ---
-        if 'recipe_analysis_request' in request_json:
-            response_data = recipe_analysis_service.handle_recipe_analysis(request_json, model)
-        elif 'healthify_recipe_request' in request_json:
-            response_data = healthify_service.handle_healthify_recipe(request_json, model)
-        elif 'find_similar_request' in request_json:
-            response_data = recipe_tools_service.handle_find_similar(request_json, model)
-        elif 'meal_suggestion_request' in request_json:
-            response_data = inventory_service.handle_meal_suggestion(request_json, models.get("pro"))
-        elif 'inventory_import_request' in request_json:
-            response_data = inventory_service.handle_inventory_import(request_json, model)
-        elif 'review_text' in request_json:
-            response_data = profile_service.handle_profile_review(request_json, model)
-        elif 'chat_request' in request_json: # <-- Now points to the new service
-            response_data = chat_service.handle_chat_request(request_json, model)
-        else:
-            raise Exception("Invalid request. Could not determine the correct handler.", 400)
+        # --- 4. Admission Control ---
+        # Per-client token bucket, then a slot on the model the request will use.
+        handler_key = handler_for(request_json)
+        admission.check_rate(admission.client_id(request), admission.request_cost(request_json), admission.priority_for(handler_key, request_json))
 
-        return (json.dumps(response_data), 200, headers)
+        # Jobs get their model slot when a worker picks them up.
+        if request_json.get("async"):
+            response_data = _service("job_service").submit(request_json, images, handler_key, dispatch_request, error_details)
+            status_code = 202
+            return (json.dumps(response_data), 202, headers)
+
+        model = model_router.select_model(handler_key, request_json, models)
+        lease = admission.admit(handler_key, request_json, model)
+
+        bulk_import_request = request_json.get('bulk_import_request')
+        if isinstance(bulk_import_request, dict) and bulk_import_request.get('stream', True):
+            return _stream_bulk_import(request_json, headers)
+
+        chat_request = request_json.get('chat_request')
+        if isinstance(chat_request, dict) and chat_request.get('stream'):
+            response = _stream_chat(request_json, model, chat_request['stream'], headers, lease)
+            # The stream releases the slot when it finishes.
+            lease = admission.NO_LEASE
+            return response
+
+        response_data = dispatch_request(request_json, images, model)
+        with metrics.stage("serialize"):
+            body = json.dumps(response_data)
+        return (body, 200, headers)
     
     except Exception as e:
-        status_code = 500
-        if len(e.args) > 1 and isinstance(e.args[1], int):
-            status_code = e.args[1]
-        error_message = str(e.args[0])
-        return (jsonify({"error": error_message}), status_code, headers)
\ No newline at end of file
+        error_message, status_code = error_details(e)
+        if isinstance(e, admission.Rejected):
+            headers["Retry-After"] = str(e.retry_after)
+        if isinstance(e, context_store.ContextMissing):
+            return (jsonify({"error": error_message, "missing_context": e.missing}), status_code, headers)
+        return (jsonify({"error": error_message}), status_code, headers)
+
+    finally:
+        lease.release()
+        admission.end_client(client_token)
+        if deadline_token is not None:
+            resilience.end_deadline(deadline_token)
+        # The returned tuple shares this dict, so the header still goes out.
+        server_timing = metrics.finish_request(metrics_token, status_code)
+        if server_timing:
+            headers["Server-Timing"] = server_timing
+            headers["Timing-Allow-Origin"] = "*"
+
+def error_details(e):
+    """Unpacks the (message, status_code) convention used by handler exceptions."""
+    status_code = 500
+    if len(e.args) > 1 and isinstance(e.args[1], int):
+        status_code = e.args[1]
+    error_message = str(e.args[0]) if e.args else str(e)
+    return error_message, status_code
+
+def handler_for(request_json):
+    """Returns the request key that selects the handler, or "unknown"."""
+    return next((key for key in HANDLER_KEYS if key in request_json), "unknown")
+
+def dispatch_request(request_json, images=None, model=None):
+    """
+    Routes a single request payload to its handler and returns the response data.
+    images holds the raw bytes of uploaded images, if any. model is the one
+    already selected for admission; it is selected here when not given.
+    """
+    handler_key = handler_for(request_json)
+    metrics.set_handler(handler_key)
+    if model is None:
+        # A plain model, or a cascade that gemini_service escalates through (see model_router).
+        model = model_router.select_model(handler_key, request_json, models)
+    if images and 'recipe_analysis_request' not in request_json:
+        raise Exception("Image uploads are only supported for recipe_analysis_request.", 400)
+
+    # --- The Router ---
+    if 'recipe_analysis_request' in request_json:
+        return _service("recipe_analysis_service").handle_recipe_analysis(request_json, model, models, images)
+    elif 'healthify_recipe_request' in request_json:
+        return _service("healthify_service").handle_healthify_recipe(request_json, model)
+    elif 'find_similar_request' in request_json:
+        return _service("recipe_tools_service").handle_find_similar(request_json, model)
+    elif 'find_duplicates_request' in request_json:
+        return _service("recipe_tools_service").handle_find_duplicates(request_json, model)
+    elif 'nutrition_request' in request_json:
+        return _service("recipe_tools_service").handle_nutrition_batch(request_json)
+    elif 'meal_suggestion_request' in request_json:
+        return _service("inventory_service").handle_meal_suggestion(request_json, model)
+    elif 'inventory_import_request' in request_json:
+        return _service("inventory_service").handle_inventory_import(request_json, model)
+    elif 'review_text' in request_json:
+        return _service("profile_service").handle_profile_review(request_json, model)
+    elif 'chat_request' in request_json: # <-- Now points to the new service
+        return _service("chat_service").handle_chat_request(request_json, model)
+    elif 'batch_request' in request_json:
+        return _service("batch_service").handle_batch_request(request_json, dispatch_request, error_details, handler_for)
+    elif 'bulk_import_request' in request_json:
+        return _service("bulk_import_service").handle_bulk_import(request_json, models, error_details)
+    elif 'context_upload_request' in request_json:
+        return context_store.handle_context_upload(request_json)
+    elif 'job_status_request' in request_json:
+        return _service("job_service").handle_job_status(request_json)
+    elif 'cache_stats_request' in request_json:
+        return {"result": {**_service("gemini_service").get_cache_stats(), "context_store": context_store.get_stats()}, "error": None}
+    elif 'routing_stats_request' in request_json:
+        return {"result": {**model_router.get_stats(), "resilience": resilience.get_stats(),
+                           "prompt_payload": _service("prompt_payload").get_stats()}, "error": None}
+    elif 'admission_stats_request' in request_json:
+        return {"result": admission.get_stats(), "error": None}
+    else:
+        raise Exception("Invalid request. Could not determine the correct handler.", 400)
+
+def _stream_chat(request_json, model, stream_format, headers, lease):
+    """
+    Returns a chunked response that forwards the chat reply as it is generated.
+    The admission lease is held until the stream ends.
+    """
+    chat_service = _service("chat_service")
+    if stream_format is True:
+        stream_format = "sse"
+    if stream_format not in chat_service.STREAM_FORMATS:
+        raise Exception(f"Unsupported stream format: {stream_format}", 400)
+
+    stream_headers = {
+        **headers,
+        "Cache-Control": "no-cache",
+        # Stops intermediate proxies from buffering the whole stream.
+        "X-Accel-Buffering": "no",
+    }
+    events = lease.hold_until_done(chat_service.stream_chat_request(request_json, model, stream_format))
+    return Response(
+        stream_with_context(events),
+        status=200,
+        headers=stream_headers,
+        mimetype=chat_service.STREAM_FORMATS[stream_format],
+    )
+
+def _stream_bulk_import(request_json, headers):
+    """Returns a chunked NDJSON response with one record per recipe as it finishes, then a summary."""
+    lines = _service("bulk_import_service").stream_ndjson(request_json, models, error_details)
+    stream_headers = {**headers, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(lines), status=200, headers=stream_headers, mimetype="application/x-ndjson")
+
+startup_profile.record("import:main", _import_started)
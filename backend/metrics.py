@@ -0,0 +1,257 @@
+# backend/metrics.py
+import bisect
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# --- Configuration ---
+# Off by default: every helper below then returns after one boolean check.
+ENABLED = os.environ.get("RECETTE_METRICS", "").lower() in ("1", "true", "yes")
+JSON_LOGS = os.environ.get("RECETTE_METRICS_JSON_LOGS", "1").lower() in ("1", "true", "yes")
+
+# Seconds; covers cache hits through slow multimodal generations.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NOOP = nullcontext()
+_current = contextvars.ContextVar("recette_request_metrics", default=None)
+
+
+# --- Registry ---
+
+class Histogram:
+    """A labelled latency histogram with cumulative buckets, as Prometheus expects."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                base = _format_labels(self.label_names, labels)
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float("inf")), series["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.label_names + ('le',), labels + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{base} {series['sum']}")
+                lines.append(f"{self.name}_count{base} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """A labelled value read at scrape time from collect(), which returns {labels: value}."""
+
+    def __init__(self, name, help_text, label_names, collect):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+REQUEST_SECONDS = Histogram("recette_request_duration_seconds", "End-to-end request latency.", ("handler", "status"))
+STAGE_SECONDS = Histogram("recette_stage_duration_seconds", "Time spent in each stage of a request.", ("handler", "stage"))
+MODEL_SECONDS = Histogram("recette_model_call_duration_seconds", "Latency of generate_content calls.", ("model",))
+PROMPT_TOKENS = Counter("recette_prompt_tokens_total", "Estimated prompt tokens sent to each model.", ("model",))
+RESPONSE_CHARS = Counter("recette_response_characters_total", "Response characters received from each model.", ("model",))
+CACHE_HITS = Counter("recette_response_cache_hits_total", "Model calls answered from the response cache.", ("model",))
+ROUTING_ATTEMPTS = Counter("recette_routing_attempts_total", "Cascade steps, by whether the model's output was accepted.", ("policy", "model", "outcome"))
+ADMISSION_REJECTED = Counter("recette_admission_rejected_total", "Requests shed with a 429, by reason and priority class.", ("reason", "priority"))
+ADMISSION_WAIT_SECONDS = Histogram("recette_admission_wait_seconds", "Time admitted requests spent queued for a model slot.", ("model", "priority"))
+PROMPT_PAYLOAD_TOKENS = Counter("recette_prompt_payload_tokens_total", "Estimated tokens of recipe payloads embedded in prompts, verbatim (raw) and as sent.", ("handler", "form"))
+
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, MODEL_SECONDS, PROMPT_TOKENS, RESPONSE_CHARS, CACHE_HITS, ROUTING_ATTEMPTS,
+            ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS, PROMPT_PAYLOAD_TOKENS]
+
+def register(metric):
+    """Adds a metric defined elsewhere (e.g. a Gauge over a module's state) to the registry."""
+    REGISTRY.append(metric)
+
+def render_prometheus():
+    """Returns every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# --- Per-Request Recording ---
+
+class RequestMetrics:
+    """Stage timings and size counts for one request, shared by all its threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.handler = "unknown"
+        self.stages = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            total, calls = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, calls + 1)
+
+    def add_count(self, name, amount):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def server_timing(self):
+        """Formats the stages as a Server-Timing header value."""
+        with self._lock:
+            entries = [f"{name};dur={total * 1000:.1f}" for name, (total, _) in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+
+def start_request():
+    """Begins recording for the current request. Returns a token for finish_request (or None)."""
+    if not ENABLED:
+        return None
+    return _current.set(RequestMetrics())
+
+def set_handler(name):
+    """Labels the current request; the first label wins, so batch items don't relabel their batch."""
+    if ENABLED:
+        request_metrics = _current.get()
+        if request_metrics is not None and request_metrics.handler == "unknown":
+            request_metrics.handler = name
+
+@contextmanager
+def _timed_stage(request_metrics, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.add_stage(name, time.perf_counter() - started)
+
+def stage(name):
+    """Context manager timing a stage of the current request (a shared no-op when disabled)."""
+    if not ENABLED:
+        return _NOOP
+    request_metrics = _current.get()
+    return _NOOP if request_metrics is None else _timed_stage(request_metrics, name)
+
+def count(name, amount=1):
+    if ENABLED:
+        request_metrics = _current.get()
+        if request_metrics is not None:
+            request_metrics.add_count(name, amount)
+
+def observe_model_call(model_name, seconds, prompt_tokens, response_chars):
+    if ENABLED:
+        MODEL_SECONDS.observe(seconds, model_name)
+        PROMPT_TOKENS.inc(prompt_tokens, model_name)
+        RESPONSE_CHARS.inc(response_chars, model_name)
+
+def observe_cache_hit(model_name):
+    if ENABLED:
+        CACHE_HITS.inc(1, model_name)
+
+def observe_routing(policy, model_name, outcome):
+    if ENABLED:
+        ROUTING_ATTEMPTS.inc(1, policy, model_name, outcome)
+
+def observe_admission_rejected(reason, priority):
+    if ENABLED:
+        ADMISSION_REJECTED.inc(1, reason, priority)
+
+def observe_admission_wait(model_name, priority, seconds):
+    if ENABLED:
+        ADMISSION_WAIT_SECONDS.observe(seconds, model_name, priority)
+
+def observe_prompt_payload(handler, raw_tokens, sent_tokens):
+    if ENABLED:
+        PROMPT_PAYLOAD_TOKENS.inc(raw_tokens, handler, "raw")
+        PROMPT_PAYLOAD_TOKENS.inc(sent_tokens, handler, "sent")
+        count("prompt_payload_tokens_saved", raw_tokens - sent_tokens)
+
+def finish_request(token, status_code):
+    """
+    Ends recording: updates the registry, writes one JSON log line and returns
+    the Server-Timing header value (None when disabled).
+    """
+    if token is None:
+        return None
+    request_metrics = _current.get()
+    _current.reset(token)
+    total_seconds = time.perf_counter() - request_metrics.started
+    REQUEST_SECONDS.observe(total_seconds, request_metrics.handler, str(status_code))
+    with request_metrics._lock:
+        stages = dict(request_metrics.stages)
+        counts = dict(request_metrics.counts)
+    for name, (seconds, _) in stages.items():
+        STAGE_SECONDS.observe(seconds, request_metrics.handler, name)
+
+    if JSON_LOGS:
+        # Cloud Logging turns JSON lines on stdout into structured entries.
+        print(json.dumps({
+            "severity": "INFO",
+            "message": "request_metrics",
+            "handler": request_metrics.handler,
+            "status": status_code,
+            "duration_ms": round(total_seconds * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, (seconds, _) in stages.items()},
+            "counts": counts,
+        }), file=sys.stdout, flush=True)
+    return request_metrics.server_timing()
+
+def propagate(fn):
+    """
+    Wraps fn so it runs in a copy of the caller's context. Use it when handing
+    work to a thread pool, so stages recorded there count toward the request
+    (and the request's deadline still applies there).
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -0,0 +1,67 @@
+# backend/model_registry.py
+import threading
+
+from . import startup_profile
+
+# --- Configuration ---
+PROJECT_ID = "recette-fdf64"
+GCP_REGION = "us-central1"
+MODEL_NAMES = {
+    "pro": "gemini-2.5-pro",
+    "flash": "gemini-2.5-flash",
+}
+
+_vertex_lock = threading.Lock()
+_vertex_initialized = False
+
+def _init_vertex():
+    """Imports the Vertex SDK and runs vertexai.init exactly once per process."""
+    global _vertex_initialized
+    if _vertex_initialized:
+        return
+    with _vertex_lock:
+        if _vertex_initialized:
+            return
+        with startup_profile.timed("vertexai.init"):
+            import vertexai
+            vertexai.init(project=PROJECT_ID, location=GCP_REGION)
+        _vertex_initialized = True
+
+
+class LazyModel:
+    """
+    Stands in for a GenerativeModel until it is first used, so cold starts
+    (and requests that never reach the model, such as OPTIONS preflights and
+    developer_mode previews) don't pay for the SDK import and vertexai.init.
+    """
+
+    def __init__(self, model_name):
+        # Same attribute the SDK sets; gemini_service uses it for cache keys.
+        self._model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """Returns the real GenerativeModel, creating it on first call."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    _init_vertex()
+                    with startup_profile.timed(f"model:{self._model_name}"):
+                        from vertexai.generative_models import GenerativeModel
+                        self._model = GenerativeModel(self._model_name)
+        return self._model
+
+    def generate_content(self, *args, **kwargs):
+        return self.resolve().generate_content(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set in __init__.
+        return getattr(self.resolve(), name)
+
+
+models = {key: LazyModel(name) for key, name in MODEL_NAMES.items()}
+
+def get_model(key):
+    """Returns the (lazy) model registered under key, e.g. "pro" or "flash"."""
+    return models[key]
@@ -0,0 +1,244 @@
+# backend/model_router.py
+import json
+import logging
+import os
+import threading
+import time
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# "cascade" routes each handler through its policy below; "client" restores
+# the old behaviour of using the model named by the request's model_choice.
+MODEL_ROUTING = os.environ.get("RECETTE_MODEL_ROUTING", "cascade").lower()
+# Optional per-handler cascade overrides, e.g. '{"healthify_recipe_request": ["pro"]}'.
+MODEL_CASCADES_OVERRIDE = os.environ.get("RECETTE_MODEL_CASCADES", "")
+
+
+# --- Validators ---
+# Each takes a parsed result and returns None when it is acceptable, or a
+# short reason that sends the request on to the next model in the cascade.
+
+def _non_empty_list(value):
+    return isinstance(value, list) and len(value) > 0
+
+def validate_recipe(result):
+    """A full recipe object, as returned by parse, healthify and meal ideas."""
+    if not str(result.get("title") or "").strip():
+        return "empty_title"
+    if not _non_empty_list(result.get("ingredients")):
+        return "no_ingredients"
+    if not _non_empty_list(result.get("instructions")):
+        return "no_instructions"
+    return None
+
+def validate_analysis(result):
+    """Analysis results only hold a recipe when parse was requested; check it if so."""
+    if "title" in result or "ingredients" in result:
+        return validate_recipe(result)
+    return None
+
+def validate_id_list(key):
+    def validate(result):
+        ids = result.get(key) or []
+        if not isinstance(ids, list):
+            return f"malformed_{key}"
+        if not all(isinstance(i, int) or (isinstance(i, str) and i.isdigit()) for i in ids):
+            return f"non_integer_{key}"
+        return None
+    return validate
+
+def validate_duplicate_groups(result):
+    groups = result.get("duplicate_groups") or []
+    if not isinstance(groups, list) or not all(isinstance(group, list) for group in groups):
+        return "malformed_groups"
+    return None
+
+def validate_inventory_items(result):
+    if not all(isinstance(item, dict) and str(item.get("name") or "").strip() for item in result):
+        return "unnamed_item"
+    return None
+
+
+class Policy:
+    """
+    How one handler picks its model.
+
+    cascade: model keys to try in order; the next one is tried when the
+        previous call errors, returns unparseable JSON, misses a required key
+        or fails the validator.
+    result_type: the expected type of the parsed result (dict or list).
+    required_keys: keys a dict result must contain.
+    validator: optional callable(result) returning None or a rejection reason.
+    client_model: model key used in "client" routing mode regardless of
+        model_choice (None means honour model_choice).
+    """
+
+    def __init__(self, cascade, result_type=dict, required_keys=(), validator=None, client_model=None):
+        self.cascade = tuple(cascade)
+        self.result_type = result_type
+        self.required_keys = tuple(required_keys)
+        self.validator = validator
+        self.client_model = client_model
+
+    def rejection_reason(self, response):
+        """Returns why a call_gemini response should be escalated, or None to accept it."""
+        if response.get("error"):
+            return "invalid_json" if "parse AI response as JSON" in response["error"] else "model_error"
+        result = response.get("result")
+        if not isinstance(result, self.result_type):
+            return "wrong_type"
+        missing = [key for key in self.required_keys if key not in result]
+        if missing:
+            return "missing_keys:" + ",".join(missing)
+        return self.validator(result) if self.validator else None
+
+
+POLICIES = {
+    "recipe_analysis_request": Policy(("flash", "pro"), validator=validate_analysis),
+    "healthify_recipe_request": Policy(("flash", "pro"), required_keys=("title", "ingredients", "instructions"), validator=validate_recipe),
+    "find_similar_request": Policy(("flash", "pro"), required_keys=("similar_recipe_ids",), validator=validate_id_list("similar_recipe_ids")),
+    "find_duplicates_request": Policy(("flash", "pro"), required_keys=("duplicate_groups",), validator=validate_duplicate_groups),
+    "meal_suggestion_request": Policy(("flash", "pro"), required_keys=("title", "ingredients", "instructions"),
+                                      validator=validate_recipe, client_model="pro"),
+    "inventory_import_request": Policy(("flash", "pro"), result_type=list, validator=validate_inventory_items),
+    "review_text": Policy(("flash", "pro"), required_keys=("suggested_rules", "suggested_preferences")),
+    # Chat replies are free text with nothing to validate, so there is no point escalating.
+    "chat_request": Policy(("flash",)),
+}
+
+def _apply_overrides():
+    if not MODEL_CASCADES_OVERRIDE:
+        return
+    try:
+        overrides = json.loads(MODEL_CASCADES_OVERRIDE)
+    except json.JSONDecodeError as e:
+        logger.warning("Ignoring invalid RECETTE_MODEL_CASCADES: %s", e)
+        return
+    for handler, cascade in overrides.items():
+        if handler in POLICIES and cascade:
+            POLICIES[handler].cascade = tuple(cascade)
+
+_apply_overrides()
+
+
+# --- Routing Statistics ---
+
+class RoutingStats:
+    """Per-policy routing decisions and per-model latency and acceptance rates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._policies = {}
+        self._models = {}
+
+    def record_attempt(self, policy_name, model_name, seconds, reason):
+        with self._lock:
+            model = self._models.setdefault(model_name, {"calls": 0, "accepted": 0, "total_seconds": 0.0})
+            model["calls"] += 1
+            model["total_seconds"] += seconds
+            policy = self._policies.setdefault(policy_name, {"requests": 0, "served_by": {}, "escalations": {}})
+            if reason is None:
+                model["accepted"] += 1
+            else:
+                key = f"{model_name}:{reason.split(':')[0]}"
+                policy["escalations"][key] = policy["escalations"].get(key, 0) + 1
+
+    def record_outcome(self, policy_name, model_name):
+        with self._lock:
+            policy = self._policies.setdefault(policy_name, {"requests": 0, "served_by": {}, "escalations": {}})
+            policy["requests"] += 1
+            policy["served_by"][model_name] = policy["served_by"].get(model_name, 0) + 1
+
+    def get_stats(self):
+        with self._lock:
+            models = {
+                name: {
+                    "calls": m["calls"],
+                    "acceptance_rate": round(m["accepted"] / m["calls"], 4) if m["calls"] else 0.0,
+                    "mean_latency_ms": round(m["total_seconds"] * 1000 / m["calls"], 1) if m["calls"] else 0.0,
+                }
+                for name, m in self._models.items()
+            }
+            policies = {
+                name: {"requests": p["requests"], "served_by": dict(p["served_by"]), "escalations": dict(p["escalations"])}
+                for name, p in self._policies.items()
+            }
+        return {"mode": MODEL_ROUTING, "policies": policies, "models": models}
+
+
+default_stats = RoutingStats()
+
+def get_stats():
+    return default_stats.get_stats()
+
+
+# --- Cascades ---
+
+class Cascade:
+    """
+    A model stand-in that gemini_service.call_gemini runs step by step.
+    Code that talks to the model directly (chat, summaries) gets the first
+    model in the cascade, since free text can't be validated.
+    """
+
+    def __init__(self, name, policy, steps):
+        self.name = name
+        self.policy = policy
+        self.steps = steps
+        self._model_name = getattr(steps[0][1], "_model_name", steps[0][0])
+
+    def generate_content(self, *args, **kwargs):
+        return self.steps[0][1].generate_content(*args, **kwargs)
+
+    def run(self, call):
+        """
+        Calls call(model) for each step until a response is accepted (or the
+        last step is reached) and returns that response, with a "routing"
+        block describing the attempts.
+        """
+        attempts = []
+        for index, (key, model) in enumerate(self.steps):
+            model_name = getattr(model, "_model_name", key)
+            started = time.perf_counter()
+            response = call(model)
+            elapsed = time.perf_counter() - started
+            reason = self.policy.rejection_reason(response)
+            if response.get("cache_hit"):
+                elapsed = 0.0
+            else:
+                default_stats.record_attempt(self.name, model_name, elapsed, reason)
+            metrics.observe_routing(self.name, model_name, "accepted" if reason is None else "rejected")
+            attempts.append({"model": model_name, "elapsed_ms": round(elapsed * 1000, 1), "rejected": reason})
+            # developer_mode responses carry only the prompt; there is nothing to judge.
+            if reason is None or index == len(self.steps) - 1 or response.get("raw_response_text") is None and not response.get("error"):
+                break
+
+        default_stats.record_outcome(self.name, model_name)
+        response["routing"] = {"policy": self.name, "model": model_name, "attempts": attempts}
+        return response
+
+
+def select_model(handler, request_json, models):
+    """
+    Returns the model (or Cascade) a handler should use for this request.
+    "model_choice": "auto" always cascades; "pin_model": true always uses
+    model_choice; otherwise RECETTE_MODEL_ROUTING decides.
+    """
+    model_choice = request_json.get("model_choice", "gemini-2.5-pro")
+    policy = POLICIES.get(handler)
+    cascade = model_choice == "auto" or (MODEL_ROUTING == "cascade" and not request_json.get("pin_model"))
+    if policy and cascade:
+        steps = [(key, models[key]) for key in policy.cascade if key in models]
+        if len(steps) == 1:
+            return steps[0][1]
+        if steps:
+            return Cascade(handler, policy, steps)
+    if policy and policy.client_model and not request_json.get("pin_model"):
+        return models.get(policy.client_model)
+    return models.get("flash" if "flash" in model_choice else "pro")
+
+def is_cascade(model):
+    return isinstance(model, Cascade)
@@ -0,0 +1,308 @@
+# backend/nutrition_engine.py
+import csv
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from .ingredient_parser import UNIT_ALIASES, load_ingredients, parse_ingredient_line, parse_quantity, parse_unit
+from .similarity import normalize_ingredient
+
+# --- Local Nutrition Engine ---
+# Estimates `nutritional_info` from a bundled per-100 g nutrient table, so
+# most recipes need no model call at all. Every recipe's ingredients are
+# converted to grams once, then the nutrient totals for a whole library are a
+# couple of NumPy operations.
+
+NUTRIENT_TABLE_PATH = os.path.join(os.path.dirname(__file__), "data", "nutrients.csv")
+
+# The keys (and order) of the `nutritional_info` object in JSON_STRUCTURE_PROMPT.
+NUTRIENT_KEYS = (
+    "calories", "protein_grams", "carbohydrates_grams", "sugar_grams", "fat_grams",
+    "saturated_fat_grams", "sodium_milligrams", "fiber_grams", "cholesterol_milligrams",
+)
+_INDEX = {key: i for i, key in enumerate(NUTRIENT_KEYS)}
+
+# Matches the assumption in get_nutritional_estimation_prompt.
+DEFAULT_SERVINGS = 4
+
+# --- Unit Conversion ---
+MASS_GRAMS = {"g": 1.0, "kg": 1000.0, "mg": 0.001, "oz": 28.35, "lb": 453.6}
+VOLUME_ML = {
+    "ml": 1.0, "l": 1000.0, "tsp": 4.93, "tbsp": 14.79, "cup": 236.6, "fl oz": 29.57,
+    "pint": 473.2, "quart": 946.4, "gallon": 3785.4, "pinch": 0.31, "dash": 0.62,
+}
+# Used when a container's size isn't given and the table has no weight for it.
+CONTAINER_GRAMS = {"can": 400.0, "jar": 450.0, "bottle": 500.0, "box": 450.0, "bag": 450.0, "package": 450.0, "carton": 1000.0}
+HANDFUL_GRAMS = 30.0
+
+# --- Modifiers ---
+# Words that change an ingredient's nutrients, as multipliers on the listed
+# nutrients. Calories are then reduced by the energy of whatever fat (9 kcal/g)
+# and sugar (4 kcal/g) was removed.
+MODIFIERS = {
+    "no salt added": {"sodium_milligrams": 0.05},
+    "salt free": {"sodium_milligrams": 0.05},
+    "sodium free": {"sodium_milligrams": 0.05},
+    "unsalted": {"sodium_milligrams": 0.05},
+    "low sodium": {"sodium_milligrams": 0.3},
+    "reduced sodium": {"sodium_milligrams": 0.6},
+    "less sodium": {"sodium_milligrams": 0.6},
+    "sugar free": {"sugar_grams": 0.05},
+    "no sugar added": {"sugar_grams": 0.5},
+    "reduced sugar": {"sugar_grams": 0.7},
+    "fat free": {"fat_grams": 0.03, "saturated_fat_grams": 0.03, "cholesterol_milligrams": 0.2},
+    "nonfat": {"fat_grams": 0.03, "saturated_fat_grams": 0.03, "cholesterol_milligrams": 0.2},
+    "non fat": {"fat_grams": 0.03, "saturated_fat_grams": 0.03, "cholesterol_milligrams": 0.2},
+    "low fat": {"fat_grams": 0.4, "saturated_fat_grams": 0.4, "cholesterol_milligrams": 0.6},
+    "reduced fat": {"fat_grams": 0.7, "saturated_fat_grams": 0.7, "cholesterol_milligrams": 0.8},
+    "light": {"fat_grams": 0.5, "saturated_fat_grams": 0.5},
+    "lite": {"fat_grams": 0.5, "saturated_fat_grams": 0.5},
+}
+# "Light" only means reduced fat on these products (table names); elsewhere it
+# is a colour or style: light soy sauce, light brown sugar, light olive oil.
+LIGHT_MODIFIERS = ("light", "lite")
+LIGHT_FOODS = frozenset({
+    "milk", "sour cream", "cream cheese", "yogurt", "greek yogurt", "cheddar", "mozzarella", "ricotta", "feta",
+    "butter", "mayonnaise", "coconut milk",
+})
+_MODIFIER_RE = re.compile(r"\b(" + "|".join(sorted(MODIFIERS, key=len, reverse=True)) + r")\b")
+
+
+class NutrientTable:
+    """The bundled nutrient table as NumPy arrays, plus an index of every name and alias."""
+
+    def __init__(self, path=NUTRIENT_TABLE_PATH):
+        rows, grams_per_cup, grams_each = [], [], []
+        self.names = []
+        self.unit_weights = []
+        self.aliases = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(line for line in f if not line.startswith("#")):
+                index = len(self.names)
+                self.names.append(record["name"])
+                rows.append([float(record[key]) for key in NUTRIENT_KEYS])
+                grams_per_cup.append(float(record["grams_per_cup"] or "nan"))
+                grams_each.append(float(record["grams_each"] or "nan"))
+                self.unit_weights.append({
+                    unit: float(grams)
+                    for unit, grams in (pair.split("=") for pair in record["unit_weights"].split("|") if pair)
+                })
+                for alias in [record["name"], *filter(None, record["aliases"].split("|"))]:
+                    self.aliases.setdefault(normalize_ingredient(alias), index)
+
+        self.per_100g = np.array(rows, dtype=np.float64)
+        self.grams_per_cup = np.array(grams_per_cup)
+        self.grams_each = np.array(grams_each)
+        self.max_alias_words = max(len(alias.split()) for alias in self.aliases)
+
+    def match(self, name):
+        """
+        Returns the table row for an ingredient name, or None. The longest
+        known phrase wins ("chicken broth" over "chicken"); among equally long
+        ones the rightmost, since the head noun comes last ("garlic salt").
+        """
+        words = normalize_ingredient(name).split()
+        for size in range(min(len(words), self.max_alias_words), 0, -1):
+            for start in range(len(words) - size, -1, -1):
+                index = self.aliases.get(" ".join(words[start:start + size]))
+                if index is not None:
+                    return index
+        return None
+
+    def grams(self, index, quantity, unit, notes=""):
+        """Converts a quantity of one table row to grams, or None if the unit can't be resolved."""
+        if unit in MASS_GRAMS:
+            return quantity * MASS_GRAMS[unit]
+        if unit in VOLUME_ML:
+            grams_per_ml = self.grams_per_cup[index] / VOLUME_ML["cup"]
+            return None if np.isnan(grams_per_ml) else quantity * VOLUME_ML[unit] * grams_per_ml
+        if unit in CONTAINER_GRAMS:
+            # "1 (15 oz) can chickpeas": the size note beats any default.
+            size = self._size_from_notes(index, notes)
+            if size is not None:
+                return quantity * size
+        if unit in self.unit_weights[index]:
+            return quantity * self.unit_weights[index][unit]
+        if unit in CONTAINER_GRAMS:
+            return quantity * CONTAINER_GRAMS[unit]
+        if unit == "handful":
+            return quantity * HANDFUL_GRAMS
+        if unit == "dozen":
+            quantity *= 12
+        each = self.grams_each[index]
+        return None if np.isnan(each) else quantity * each
+
+    def _size_from_notes(self, index, notes):
+        _, size, remainder = parse_quantity(notes or "")
+        if size is None:
+            return None
+        unit, _, _ = parse_unit(remainder.lstrip("- "))
+        if unit in MASS_GRAMS or unit in VOLUME_ML:
+            return self.grams(index, size, unit)
+        return None
+
+
+@lru_cache(maxsize=1)
+def get_table():
+    """Loads the nutrient table on first use."""
+    return NutrientTable()
+
+# Libraries repeat the same few hundred ingredient names, so memoise the lookups.
+@lru_cache(maxsize=65536)
+def match_food(name):
+    return get_table().match(name)
+
+@lru_cache(maxsize=4096)
+def modifier_multipliers(text, food=None):
+    """Returns the per-nutrient multipliers for the modifiers mentioned in text about a food (its table name)."""
+    multipliers = np.ones(len(NUTRIENT_KEYS))
+    for modifier in set(_MODIFIER_RE.findall(text.lower().replace("-", " "))):
+        if modifier in LIGHT_MODIFIERS and food not in LIGHT_FOODS:
+            continue
+        for key, factor in MODIFIERS[modifier].items():
+            multipliers[_INDEX[key]] *= factor
+    return tuple(multipliers)
+
+def _canonical_unit(unit):
+    unit = str(unit or "").strip()
+    if not unit:
+        return ""
+    canonical, remainder, _ = parse_unit(unit)
+    if canonical and not remainder:
+        return canonical
+    lowered = unit.lower().rstrip(".")
+    return UNIT_ALIASES.get(lowered, lowered)
+
+def _to_number(value):
+    """Reads the leading number of a value like 12, "12", "12g" or "N/A" (-> None)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r"\s*(\d+(?:\.\d+)?)", str(value or ""))
+    return float(match.group(1)) if match else None
+
+def _as_parsed(ingredient):
+    """Brings a line, an AI ingredient or a client (toMap) ingredient into one shape."""
+    if not isinstance(ingredient, dict):
+        return parse_ingredient_line(ingredient)
+    display = str(ingredient.get("quantity_display", ingredient.get("quantity", "")) or "")
+    numeric = _to_number(ingredient.get("quantity_numeric", ingredient.get("quantityNumeric")))
+    if numeric is None and display:
+        numeric = parse_quantity(display)[1]
+    return {
+        "quantity_display": display,
+        "quantity_numeric": numeric,
+        "unit": ingredient.get("unit") or "",
+        "name": ingredient.get("name") or "",
+        "notes": ingredient.get("notes") or "",
+    }
+
+def _describe(parsed):
+    line = " ".join(str(parsed[key]) for key in ("quantity_display", "unit", "name") if parsed[key])
+    return f"{line} ({parsed['notes']})" if parsed["notes"] else line
+
+def parse_servings(value):
+    """Reads a servings field such as 4, "4-6 people" or "Serves 8"; ranges are averaged."""
+    text = str(value or "")
+    match = re.search(r"\d", text)
+    if match:
+        servings = parse_quantity(text[match.start():])[1]
+        if servings:
+            return servings
+    return DEFAULT_SERVINGS
+
+def _resolve(parsed):
+    """
+    Resolves one parsed ingredient to (food_index, grams, multipliers).
+    Returns None for unquantified lines ("salt to taste"), which are ignored,
+    or a description string when the table can't match or convert it.
+    """
+    unit = _canonical_unit(parsed["unit"])
+    quantity = parsed["quantity_numeric"]
+    if quantity is None:
+        if unit not in ("pinch", "dash"):
+            return None
+        quantity = 1.0
+    index = match_food(parsed["name"])
+    weight = None if index is None else get_table().grams(index, quantity, unit, parsed["notes"])
+    if weight is None:
+        return _describe(parsed)
+    return index, weight, modifier_multipliers(f"{parsed['name']} {parsed['notes']}", get_table().names[index])
+
+# The same lines recur across a library, so resolve each distinct one once.
+@lru_cache(maxsize=65536)
+def _resolve_line(line):
+    return _resolve(parse_ingredient_line(line))
+
+@lru_cache(maxsize=65536)
+def _resolve_fields(quantity_display, quantity_numeric, unit, name, notes):
+    return _resolve({"quantity_display": quantity_display, "quantity_numeric": quantity_numeric,
+                     "unit": unit, "name": name, "notes": notes})
+
+def _resolve_ingredient(ingredient):
+    if not isinstance(ingredient, dict):
+        return _resolve_line(str(ingredient))
+    parsed = _as_parsed(ingredient)
+    return _resolve_fields(parsed["quantity_display"], parsed["quantity_numeric"],
+                           str(parsed["unit"]), str(parsed["name"]), str(parsed["notes"]))
+
+def estimate_batch(recipes):
+    """
+    Estimates total nutrients for many recipes at once.
+    Returns one dict per recipe: totals (per nutrient, whole recipe), servings,
+    and unresolved_ingredients - lines with a quantity that the table couldn't
+    match or convert. Unquantified lines ("salt to taste") are ignored.
+    """
+    recipe_ids, food_ids, grams, multipliers = [], [], [], []
+    estimates = []
+    for recipe_id, recipe in enumerate(recipes):
+        unresolved = []
+        for ingredient in load_ingredients(recipe):
+            resolved = _resolve_ingredient(ingredient)
+            if resolved is None:
+                continue
+            if isinstance(resolved, str):
+                unresolved.append(resolved)
+                continue
+            recipe_ids.append(recipe_id)
+            food_ids.append(resolved[0])
+            grams.append(resolved[1])
+            multipliers.append(resolved[2])
+        estimates.append({"servings": parse_servings(recipe.get("servings")), "unresolved_ingredients": unresolved})
+
+    totals = _sum_nutrients(get_table(), len(recipes), recipe_ids, food_ids, grams, multipliers)
+    for estimate, row in zip(estimates, totals):
+        estimate["totals"] = dict(zip(NUTRIENT_KEYS, row.tolist()))
+    return estimates
+
+def _sum_nutrients(table, recipe_count, recipe_ids, food_ids, grams, multipliers):
+    """One vectorised pass: grams x nutrients-per-gram x modifiers, summed per recipe."""
+    totals = np.zeros((recipe_count, len(NUTRIENT_KEYS)))
+    if not food_ids:
+        return totals
+    base = table.per_100g[np.array(food_ids)] * (np.array(grams) / 100.0)[:, None]
+    adjusted = base * np.array(multipliers)
+    removed = base - adjusted
+    calories = _INDEX["calories"]
+    adjusted[:, calories] = np.maximum(
+        adjusted[:, calories] - 9 * removed[:, _INDEX["fat_grams"]] - 4 * removed[:, _INDEX["sugar_grams"]], 0
+    )
+    np.add.at(totals, np.array(recipe_ids), adjusted)
+    return totals
+
+def estimate_recipe(recipe):
+    return estimate_batch([recipe])[0]
+
+def per_serving_info(estimate, extra_totals=None):
+    """
+    Formats an estimate as a `nutritional_info` object: per serving, strings
+    rounded to whole numbers. extra_totals (whole-recipe amounts for the
+    unresolved ingredients, e.g. from the model) are added first.
+    """
+    totals = dict(estimate["totals"])
+    for key, value in (extra_totals or {}).items():
+        number = _to_number(value)
+        if key in totals and number is not None:
+            totals[key] += number
+    return {key: str(int(round(totals[key] / estimate["servings"]))) for key in NUTRIENT_KEYS}
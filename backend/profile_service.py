@@ -10,6 +10,7 @@ def handle_profile_review(request_json, model):
     """
     review_text = request_json['review_text']
     developer_mode = request_json.get("developer_mode", False)
+    use_cache = request_json.get("use_cache", True)
 
     # 1. Extract data
 
@@ -17,6 +18,6 @@ def handle_profile_review(request_json, model):
     prompt_parts = prompts.get_profile_review_prompt(review_text)
     
     # 3. Call the central Gemini service
-    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode)
+    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
 
     return response_data
\ No newline at end of file
@@ -0,0 +1,173 @@
+# backend/prompt_payload.py
+import json
+import os
+import threading
+
+from . import metrics
+from .content_pruner import estimate_tokens
+from .ingredient_parser import ingredient_names, load_ingredients
+
+# --- Configuration ---
+# "0" embeds client recipes verbatim, as before, e.g. to compare answer quality.
+PROJECTION_ENABLED = os.environ.get("RECETTE_PROMPT_PROJECTION", "1").lower() in ("1", "true", "yes")
+# Measuring the savings serializes the recipe verbatim as well. With metrics
+# on every payload is measured; otherwise one in this many per handler.
+SAVINGS_SAMPLE_EVERY = max(1, int(os.environ.get("RECETTE_PROMPT_SAVINGS_SAMPLE_EVERY", "20")))
+
+# --- Prompt Payload Projection ---
+# Recipes from the app arrive with database IDs, timestamps, image paths,
+# empty fields and results of earlier analyses, none of which a prompt needs.
+# Each builder embeds a projection instead: only the fields its task reads,
+# ingredients as one line each, serialized without whitespace.
+
+# Fields each task reads, in prompt order. "ingredient_names" is the bare
+# names; "ingredients" is the full lines with quantities and notes.
+TASK_FIELDS = {
+    "generateTags": ("title", "description", "ingredient_names"),
+    "estimateNutrition": ("title", "servings", "ingredients"),
+    "healthCheck": ("title", "servings", "ingredients", "instructions"),
+    "healthify": ("title", "description", "prep_time", "cook_time", "total_time", "servings", "ingredients", "instructions"),
+    "similarity": ("id", "title", "ingredient_names"),
+}
+# Unknown tasks see the whole recipe as a cook would.
+DEFAULT_FIELDS = TASK_FIELDS["healthify"]
+
+
+def compact(value):
+    """JSON without the whitespace json.dumps adds by default."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def fields_for(tasks):
+    """The union of the fields the given tasks read, full ingredient lines winning over bare names."""
+    fields = []
+    for task in tasks:
+        for field in TASK_FIELDS.get(task, ()):
+            if field not in fields:
+                fields.append(field)
+    if not fields:
+        fields = list(DEFAULT_FIELDS)
+    if "ingredients" in fields and "ingredient_names" in fields:
+        fields.remove("ingredient_names")
+    return fields
+
+def _ingredient_line(ingredient):
+    if not isinstance(ingredient, dict):
+        return " ".join(str(ingredient).split())
+    quantity = ingredient.get("quantity_display") or ingredient.get("quantity_numeric") or ingredient.get("quantity") or ""
+    line = " ".join(str(part).strip() for part in (quantity, ingredient.get("unit"), ingredient.get("name")) if part not in (None, ""))
+    notes = str(ingredient.get("notes") or "").strip()
+    return f"{line} ({notes})" if notes else line
+
+def _instructions(recipe):
+    instructions = recipe.get("instructions") or []
+    if isinstance(instructions, str):
+        # Recipes from the app's database carry lists as JSON-encoded strings.
+        try:
+            instructions = json.loads(instructions)
+        except json.JSONDecodeError:
+            return " ".join(instructions.split())
+    if not isinstance(instructions, list):
+        return ""
+    return [" ".join(str(step).split()) for step in instructions if str(step).strip()]
+
+def project(recipe, fields):
+    """Returns only the given fields of a client recipe dict, leaving out empty ones."""
+    if not isinstance(recipe, dict):
+        return recipe
+    projected = {}
+    for field in fields:
+        if field == "ingredients":
+            value = [line for line in (_ingredient_line(i) for i in load_ingredients(recipe)) if line]
+        elif field == "ingredient_names":
+            value = ingredient_names(recipe)
+        elif field == "instructions":
+            value = _instructions(recipe)
+        else:
+            value = recipe.get(field)
+            if isinstance(value, str):
+                value = " ".join(value.split())
+        if value not in (None, "", [], {}):
+            projected["ingredients" if field == "ingredient_names" else field] = value
+    return projected
+
+
+# --- Savings Reporting ---
+
+class PayloadStats:
+    """
+    Tokens each handler's prompts carried, and for the payloads that were
+    measured, what they would have carried verbatim.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers = {}
+
+    def should_measure(self, handler):
+        """True for the first payload of a handler and every SAVINGS_SAMPLE_EVERY-th after it."""
+        with self._lock:
+            entry = self._handlers.get(handler)
+            return entry is None or entry["payloads"] % SAVINGS_SAMPLE_EVERY == 0
+
+    def record(self, handler, sent_tokens, raw_tokens=None):
+        """Counts a payload; raw_tokens is None when its verbatim form wasn't measured."""
+        with self._lock:
+            entry = self._handlers.setdefault(handler, {"payloads": 0, "sent_tokens": 0, "measured_payloads": 0,
+                                                        "measured_raw_tokens": 0, "measured_sent_tokens": 0})
+            entry["payloads"] += 1
+            entry["sent_tokens"] += sent_tokens
+            if raw_tokens is not None:
+                entry["measured_payloads"] += 1
+                entry["measured_raw_tokens"] += raw_tokens
+                entry["measured_sent_tokens"] += sent_tokens
+
+    def get_stats(self):
+        with self._lock:
+            handlers = {name: dict(entry) for name, entry in self._handlers.items()}
+        stats = {}
+        for name, entry in handlers.items():
+            raw_tokens, measured_sent = entry["measured_raw_tokens"], entry["measured_sent_tokens"]
+            stats[name] = {
+                "payloads": entry["payloads"],
+                "sent_tokens": entry["sent_tokens"],
+                # Over the measured payloads only (all of them with metrics on).
+                "measured_payloads": entry["measured_payloads"],
+                "raw_tokens": raw_tokens,
+                "saved_tokens": raw_tokens - measured_sent,
+                "savings_ratio": round(1 - measured_sent / raw_tokens, 4) if raw_tokens else 0.0,
+            }
+        return {"projection": PROJECTION_ENABLED, "handlers": stats}
+
+default_stats = PayloadStats()
+
+
+def _embed(handler, raw, projected):
+    """
+    Serializes the payload a prompt carries and records its size. With
+    projection on, the verbatim form is only serialized to measure the
+    savings: for every payload with metrics on, otherwise for a sample.
+    """
+    if not PROJECTION_ENABLED:
+        sent = json.dumps(raw)
+        raw_tokens = sent_tokens = estimate_tokens(sent)
+    else:
+        sent = compact(projected)
+        sent_tokens = estimate_tokens(sent)
+        measured = metrics.ENABLED or default_stats.should_measure(handler)
+        raw_tokens = estimate_tokens(json.dumps(raw)) if measured else None
+    default_stats.record(handler, sent_tokens, raw_tokens)
+    if raw_tokens is not None:
+        metrics.observe_prompt_payload(handler, raw_tokens, sent_tokens)
+    return sent
+
+def recipe_payload(handler, recipe, tasks):
+    """The recipe as it should appear in a prompt for the given tasks."""
+    return _embed(handler, recipe, project(recipe, fields_for(tasks)))
+
+def recipes_payload(handler, recipes, tasks):
+    """A list of recipes as it should appear in a prompt for the given tasks."""
+    fields = fields_for(tasks)
+    return _embed(handler, recipes, [project(recipe, fields) for recipe in recipes])
+
+def get_stats():
+    return default_stats.get_stats()
@@ -1,7 +1,6 @@
-import json
 import base64
-from vertexai.generative_models import Part
-from .utils import scrape_text_from_url # Assuming utils.py is in the same directory
+from .content_pruner import estimate_tokens
+from . import prompt_payload
 
 # --- Refactored Prompts for DRY Principle ---
 
@@ -75,13 +74,16 @@ def _get_health_check_instructions():
 def _get_nutrition_instructions():
     return """- **Estimate Nutrition**: You MUST provide a detailed nutritional breakdown per serving. Populate the `nutritional_info` object with all the specified fields."""
 
-def build_recipe_analysis_prompt(tasks, recipe_data, dietary_profile=''):
+def build_recipe_analysis_prompt(tasks, recipe_data, dietary_profile='', page_text=None, images=None):
     """
     Builds the complete prompt for all recipe analysis tasks.
     This function now handles all context (URL, text, image) and provides
     unambiguous instructions for the AI's response format.
+    If the caller has already scraped the recipe URL, pass the text as
+    page_text so the page is not fetched twice. Likewise, images already run
+    through image_preprocessor.prepare_image can be passed as images.
     """
-    has_image = 'image' in recipe_data
+    has_image = 'image' in recipe_data or 'images' in recipe_data or bool(images)
     is_parsing_new_recipe = 'parse' in tasks
 
     prompt_parts = []
@@ -89,7 +91,10 @@ def build_recipe_analysis_prompt(tasks, recipe_data, dietary_profile=''):
 
     if is_parsing_new_recipe:
         parse_instruction = "Your primary job is to parse the recipe from the provided "
-        parse_instruction += "image." if has_image else "text or URL content."
+        if has_image and len(images or recipe_data.get('images') or [None]) > 1:
+            parse_instruction += "images, which are the pages of a single recipe in order."
+        else:
+            parse_instruction += "image." if has_image else "text or URL content."
         prompt_parts.extend([
             initial_instruction,
             parse_instruction,
@@ -114,18 +119,26 @@ def build_recipe_analysis_prompt(tasks, recipe_data, dietary_profile=''):
     # --- Centralized Context Handling ---
     if is_parsing_new_recipe:
         if 'url' in recipe_data and recipe_data['url']:
-            scraped_text = scrape_text_from_url(recipe_data['url'])
+            if page_text is None:
+                # Imported here so callers that never scrape skip requests/BeautifulSoup.
+                from .utils import scrape_text_from_url
+                page_text = scrape_text_from_url(recipe_data['url'])
+            scraped_text = page_text
             prompt_parts.extend(["\n--- RECIPE URL CONTENT ---\n", scraped_text])
         elif 'text' in recipe_data and recipe_data['text']:
             pasted_text = recipe_data['text']
             prompt_parts.extend(["\n--- RECIPE TEXT ---\n", pasted_text])
         elif has_image:
-            image_data = recipe_data['image']
-            image_part = Part.from_data(data=base64.b64decode(image_data), mime_type="image/jpeg")
+            from vertexai.generative_models import Part
+            if images is None:
+                from .image_preprocessor import prepare_image
+                encoded = recipe_data.get('images') or ([recipe_data['image']] if recipe_data.get('image') else [])
+                images = [prepare_image(base64.b64decode(image)) for image in encoded]
             # Image must come first for multimodal prompts
-            prompt_parts.insert(0, image_part)
+            prompt_parts[:0] = [Part.from_data(data=image["data"], mime_type=image["mime_type"]) for image in images]
     else:
-        prompt_parts.append(f"\n--- RECIPE JSON TO ANALYZE ---\n{json.dumps(recipe_data)}")
+        recipe_json = prompt_payload.recipe_payload("recipe_analysis", recipe_data, tasks)
+        prompt_parts.append(f"\n--- RECIPE JSON TO ANALYZE ---\n{recipe_json}")
 
     if "healthCheck" in tasks and dietary_profile:
         prompt_parts.extend(["\n--- DIETARY PROFILE FOR HEALTH CHECK ---\n", dietary_profile])
@@ -161,7 +174,7 @@ def build_healthify_recipe_prompt(recipe_data, dietary_profile):
         "\n4.  **Explain Your Changes:** In the new recipe's \"description\" field, you MUST include a brief explanation of the key changes you made and why they are healthier.",
         "\n\n**CONTEXT:**",
         f"\n- **User's Dietary Profile:** {dietary_profile}",
-        f"\n- **Original Recipe to Modify:** {json.dumps(recipe_data)}",
+        f"\n- **Original Recipe to Modify:** {prompt_payload.recipe_payload('healthify_recipe', recipe_data, ['healthify'])}",
         "\n\nYou MUST return a single, clean JSON object that follows the exact structure defined below.",
         "\n---",
         JSON_STRUCTURE_PROMPT,
@@ -222,10 +235,28 @@ def build_find_similar_prompt(primary_recipe, candidate_recipes):
     """
     return [
         prompt_text,
-        "\n--- PRIMARY RECIPE ---\n", json.dumps(primary_recipe),
-        "\n--- CANDIDATE RECIPES ---\n", json.dumps(candidate_recipes)
+        "\n--- PRIMARY RECIPE ---\n", prompt_payload.recipe_payload("find_similar", primary_recipe, ["similarity"]),
+        "\n--- CANDIDATE RECIPES ---\n", prompt_payload.recipes_payload("find_similar", candidate_recipes, ["similarity"])
     ]
 
+def build_confirm_duplicates_prompt(clusters):
+    """
+    Creates the prompt for confirming borderline duplicate clusters.
+    Each cluster is a list of compact recipes (id, title, ingredient names).
+    """
+    prompt_text = """
+        You are an expert recipe analyst. Each numbered GROUP below contains recipes that a fast
+        similarity check flagged as possible duplicates of each other.
+        For each group, decide which recipes are truly the same dish (minor wording, quantity or
+        garnish differences are still duplicates; different dishes that share ingredients are not).
+        Return a single JSON object with ONE key: 'duplicate_groups', containing a list of lists of the
+        integer IDs that are duplicates of each other. Omit recipes that have no duplicate.
+    """
+    prompt_parts = [prompt_text]
+    for number, cluster in enumerate(clusters, start=1):
+        prompt_parts.extend([f"\n--- GROUP {number} ---\n", prompt_payload.compact(cluster)])
+    return prompt_parts
+
 # NEW: A dedicated, separate prompt for the findSimilar tool.
 def get_find_similar_prompt():
     """Creates the specific prompt for the findSimilar task."""
@@ -338,6 +369,45 @@ def get_nutritional_estimation_prompt(recipe_text):
     ---
     """
 
+def build_unresolved_nutrition_prompt(ingredient_lines):
+    """
+    Creates the prompt for the few ingredients the local nutrition engine
+    couldn't resolve. Asks for TOTALS for the listed amounts, not per serving;
+    the engine adds them to its own totals and divides by servings itself.
+    """
+    prompt_text = """
+        You are a meticulous nutritional analyst. Estimate the combined nutritional content of
+        ALL the ingredients listed below, in the amounts given. Do NOT divide by servings.
+        Use your general nutritional knowledge, and respect modifiers such as "low-sodium",
+        "unsalted", "reduced-sugar" or "light".
+        Return a single JSON object with EXACTLY these keys, each a number (no units):
+        "calories", "protein_grams", "carbohydrates_grams", "sugar_grams", "fat_grams",
+        "saturated_fat_grams", "sodium_milligrams", "fiber_grams", "cholesterol_milligrams".
+        Do not include any text or formatting before or after the JSON object.
+    """
+    return [prompt_text, "\n--- INGREDIENTS ---\n", "\n".join(ingredient_lines)]
+
+def build_inventory_lines_prompt(unresolved_lines, locations):
+    """
+    Creates the prompt for the inventory lines the local parser couldn't
+    handle. Each line keeps its number and the heading it appeared under, so
+    the results can be merged back in order.
+    """
+    prompt_text = f"""
+        You are an expert inventory parsing API. Each numbered LINE below comes from a pasted list of food items.
+        The valid locations are: {locations}
+        A line's "under" value is the heading it appeared under. Map it to the matching location from the valid
+        list, or use null if none matches.
+        Return a single, clean JSON array of objects, one per food item (a line may contain several items, or none),
+        with the following structure:
+        {{"line_number": <the LINE number>, "name": "The core name of the ingredient", "quantity": "The quantity, if available", "unit": "The unit of measurement, if available", "location_name": "A location from the valid list, or null"}}
+        Do not include any text or formatting before or after the JSON array.
+    """
+    prompt_parts = [prompt_text]
+    for line in unresolved_lines:
+        prompt_parts.append(f"\nLINE {line['line_number']} (under: {line['heading'] or 'none'}): {line['text']}")
+    return prompt_parts
+
 def get_inventory_parse_prompt(inventory_text, locations):
     """Creates the prompt for parsing a block of inventory text, now with location awareness."""
     return f"""
@@ -418,8 +488,12 @@ def get_meal_ideas_prompt(inventory_list, dietary_profile, user_intent):
     """
 
 # --- RENAMED for consistency ---
-def build_chat_prompt(user_message, profile_text, inventory_text, chat_history):
-    """Creates the prompt for a freeform, context-aware chat."""
+def build_chat_prompt(user_message, profile_text, inventory_text, chat_history, history_summary=''):
+    """
+    Creates the prompt for a freeform, context-aware chat.
+    chat_history should already be trimmed to the recent window; anything
+    older is represented by history_summary.
+    """
     context_parts = ["--- USER CONTEXT ---\n"]
     if profile_text:
         context_parts.append(f"Dietary Profile:\n{profile_text}\n\n")
@@ -431,6 +505,8 @@ def build_chat_prompt(user_message, profile_text, inventory_text, chat_history):
 
     # Format chat history
     history = "\n".join([f"{msg['role']}: {msg['text']}" for msg in chat_history])
+    if history_summary:
+        history = f"(Summary of the earlier conversation: {history_summary})\n{history}"
     
     system_instruction = f"""
     You are Recette, a friendly and knowledgeable kitchen assistant. Your goal is to help the user with their questions about food, recipes, and nutrition based on the context they provide.
@@ -441,4 +517,19 @@ def build_chat_prompt(user_message, profile_text, inventory_text, chat_history):
     user: {user_message}
     model:""" # Prime the model to respond
 
-    return [system_instruction] # Return as a list for consistency
\ No newline at end of file
+    return [system_instruction] # Return as a list for consistency
+
+def build_chat_summary_prompt(previous_summary, chat_turns):
+    """Creates the prompt that folds older chat turns into a rolling summary."""
+    turns = "\n".join([f"{msg['role']}: {msg['text']}" for msg in chat_turns])
+    return [f"""
+    You maintain the running memory of a conversation between a user and Recette, a kitchen assistant.
+    Update the summary below with the new turns. Keep every fact that matters for future answers
+    (dishes discussed, decisions made, ingredients, preferences, constraints) and drop small talk.
+    Reply with the updated summary only, in plain text, in at most 150 words.
+
+    --- CURRENT SUMMARY ---
+    {previous_summary if previous_summary else "(empty)"}
+    --- NEW TURNS ---
+    {turns}
+    """]
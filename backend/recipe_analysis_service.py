@@ -1,26 +1,247 @@
 # backend/recipe_analysis_service.py
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import admission
 from . import prompts
 from . import gemini_service
+from . import metrics
+
+# --- Execution Modes ---
+# "single_shot" packs every task into one prompt (the original behaviour).
+# "fan_out" runs each analysis task as its own small prompt, in parallel,
+# each on its own model, and merges the partial results.
+SINGLE_SHOT = "single_shot"
+FAN_OUT = "fan_out"
+ANALYSIS_TASKS = ("generateTags", "healthCheck", "estimateNutrition")
+# estimateNutrition is computed by nutrition_engine ("local") unless the
+# request sets "nutrition_mode": "model".
+LOCAL_NUTRITION = "local"
+DEFAULT_TASK_MODELS = {
+    "generateTags": "flash",
+    "estimateNutrition": "flash",
+    "healthCheck": "pro",
+}
+
+_task_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis-task")
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
 
-def handle_recipe_analysis(request_json, model):
+def handle_recipe_analysis(request_json, model, models=None, images=None, scraped=None):
     """
     Orchestrates the recipe analysis process:
     1. Extracts data from the request.
-    2. Builds the prompt using the prompts module.
-    3. Calls the Gemini service to get the result.
+    2. For URL imports, tries the schema.org structured-data fast path.
+    3. Builds the prompt(s) for the requested execution mode; photos are
+       preprocessed once first (orientation, downscale, re-encode).
+    4. Calls the Gemini service to get the result.
+    Every response carries a "timings" block so the modes can be compared.
+    images holds uploaded page images as raw bytes (see uploads.py); JSON
+    requests send base64 in recipe_data "image", or "images" for several pages.
+    scraped is a (structured_recipe, page_text) pair from utils.scrape_recipe_from_url,
+    for callers that fetch the URL themselves (see bulk_import_service).
     """
     analysis_request = request_json['recipe_analysis_request']
     developer_mode = request_json.get("developer_mode", False)
+    use_cache = request_json.get("use_cache", True)
 
     # 1. Extract data
     tasks = analysis_request.get('tasks', [])
     recipe_data = analysis_request.get('recipe_data', {})
     dietary_profile = analysis_request.get('dietary_profile', '')
+    execution_mode = analysis_request.get('execution_mode', SINGLE_SHOT)
+    if execution_mode not in (SINGLE_SHOT, FAN_OUT):
+        raise Exception(f"Invalid execution_mode: {execution_mode}", 400)
+
+    local_nutrition = 'estimateNutrition' in tasks and analysis_request.get('nutrition_mode', LOCAL_NUTRITION) == LOCAL_NUTRITION
+    if local_nutrition:
+        tasks = [task for task in tasks if task != 'estimateNutrition']
+
+    task_models = {**DEFAULT_TASK_MODELS, **analysis_request.get('task_models', {})}
+    context = {
+        "model": model,
+        "models": models or {},
+        "task_models": task_models,
+        "dietary_profile": dietary_profile,
+        "developer_mode": developer_mode,
+        "use_cache": use_cache,
+    }
+    started = time.perf_counter()
+    timings = {"mode": execution_mode}
+
+    # 2. Structured-data fast path: skip the model parse entirely when the page
+    # already publishes its recipe as JSON-LD, Microdata or RDFa.
+    page_text = None
+    structured_recipe = None
+    if 'parse' in tasks and scraped is not None:
+        structured_recipe, page_text = scraped
+    elif 'parse' in tasks and recipe_data.get('url'):
+        # Imported here so text/image requests never load requests/BeautifulSoup.
+        from . import utils
+        scrape_started = time.perf_counter()
+        with metrics.stage("scrape"):
+            structured_recipe, page_text = utils.scrape_recipe_from_url(recipe_data['url'])
+        timings["scrape_ms"] = _elapsed_ms(scrape_started)
+
+    # Photos are downscaled and re-encoded once, before any prompt is built.
+    image_reports = None
+    has_images = images or recipe_data.get('images') or recipe_data.get('image')
+    if 'parse' in tasks and has_images and not recipe_data.get('url') and not recipe_data.get('text'):
+        from . import image_preprocessor
+        image_started = time.perf_counter()
+        with metrics.stage("image_preprocess"):
+            context["images"] = [
+                image_preprocessor.prepare_image(raw_image, analysis_request.get('image_options'), admission.current_client())
+                for raw_image in _iter_raw_images(recipe_data, images)
+            ]
+        timings["image_ms"] = _elapsed_ms(image_started)
+        image_reports = [image["report"] for image in context["images"]]
+
+    # 3. and 4. Build the prompt(s) and call the central Gemini service
+    if structured_recipe:
+        extra_tasks = [task for task in tasks if task != 'parse']
+        response_data = _run_analysis_tasks(structured_recipe, extra_tasks, context, timings, parallel=execution_mode == FAN_OUT)
+        response_data["source"] = "structured_data"
+    elif not tasks:
+        # Nutrition was the only task, and it needs no model.
+        response_data = {"prompt_text": "", "raw_response_text": None, "result": {}, "error": None}
+    elif execution_mode == FAN_OUT:
+        response_data = _fan_out(tasks, recipe_data, page_text, context, timings)
+    else:
+        with metrics.stage("build_prompt"):
+            prompt_parts = prompts.build_recipe_analysis_prompt(tasks, recipe_data, dietary_profile, page_text=page_text, images=context.get("images"))
+        response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
+
+    if local_nutrition:
+        _apply_local_nutrition(response_data, response_data.get("result") if 'parse' in tasks else recipe_data, context, timings)
+
+    timings["total_ms"] = _elapsed_ms(started)
+    response_data["timings"] = timings
+    if image_reports:
+        response_data["images"] = image_reports
+    return response_data
+
+def _iter_raw_images(recipe_data, images):
+    """
+    Yields each page image as bytes. Base64 pages are decoded one at a time,
+    so only one decoded original is held alongside the prepared (much
+    smaller) ones. Neither the request nor the uploaded list is modified.
+    """
+    from .uploads import UPLOAD_MAX_IMAGES
+    if images:
+        yield from list(images)
+        return
+    encoded = recipe_data.get('images') or [recipe_data['image']]
+    if len(encoded) > UPLOAD_MAX_IMAGES:
+        raise Exception(f"Too many images. The limit is {UPLOAD_MAX_IMAGES} per request.", 400)
+    for image in encoded:
+        yield base64.b64decode(image)
+
+def _apply_local_nutrition(response_data, recipe, context, timings):
+    """
+    Fills `nutritional_info` from the local nutrition engine. Only the
+    ingredients it can't resolve are sent to the model, and only their totals
+    are asked for; the per-serving arithmetic always happens here.
+    """
+    if context["developer_mode"] or not isinstance(recipe, dict):
+        return
+    # Imported here so requests without estimateNutrition never load NumPy.
+    from . import nutrition_engine
+
+    started = time.perf_counter()
+    with metrics.stage("nutrition"):
+        estimate = nutrition_engine.estimate_recipe(recipe)
+    unresolved = estimate["unresolved_ingredients"]
+    extra_totals = None
+    if unresolved:
+        model = context["models"].get(context["task_models"].get("estimateNutrition"), context["model"])
+        prompt_parts = prompts.build_unresolved_nutrition_prompt(unresolved)
+        fallback = gemini_service.call_gemini(model, prompt_parts, use_cache=context["use_cache"])
+        if isinstance(fallback.get("result"), dict):
+            extra_totals = fallback["result"]
+
+    result = response_data["result"] if isinstance(response_data.get("result"), dict) else {}
+    result["nutritional_info"] = nutrition_engine.per_serving_info(estimate, extra_totals)
+    response_data["result"] = result
+    response_data["nutrition"] = {
+        "source": "local+model" if extra_totals else "local",
+        # Reported so the client can see what the estimate left out.
+        "unresolved_ingredients": [] if extra_totals else unresolved,
+    }
+    timings["nutrition_ms"] = _elapsed_ms(started)
+
+def _fan_out(tasks, recipe_data, page_text, context, timings):
+    """
+    Fan-out execution: parse first (if requested) with the request's model,
+    then run every analysis task in parallel against the parsed recipe.
+    """
+    analysis_tasks = [task for task in tasks if task in ANALYSIS_TASKS]
+    if 'parse' not in tasks:
+        return _run_analysis_tasks(None, analysis_tasks, context, timings, parallel=True, recipe_json=recipe_data)
+
+    parse_started = time.perf_counter()
+    prompt_parts = prompts.build_recipe_analysis_prompt(['parse'], recipe_data, context["dietary_profile"], page_text=page_text, images=context.get("images"))
+    parse_response = gemini_service.call_gemini(context["model"], prompt_parts, context["developer_mode"], use_cache=context["use_cache"])
+    timings["parse_ms"] = _elapsed_ms(parse_started)
+
+    parsed_recipe = parse_response.get("result")
+    if not isinstance(parsed_recipe, dict):
+        # In developer mode there is no parsed recipe to analyse yet; show the parse prompt.
+        return parse_response
+
+    response_data = _run_analysis_tasks(parsed_recipe, analysis_tasks, context, timings, parallel=True)
+    response_data["prompt_text"] = "\n\n".join(p for p in (parse_response["prompt_text"], response_data["prompt_text"]) if p)
+    return response_data
+
+def _run_analysis_tasks(recipe, analysis_tasks, context, timings, parallel, recipe_json=None):
+    """
+    Runs the non-parse tasks against a recipe and merges their partial results
+    into it. With parallel=True each task is its own prompt on its own model;
+    otherwise all tasks share a single prompt on the request's model.
+    recipe may be None when the client only asked for analysis, in which case
+    recipe_json is analysed and only the task keys are returned.
+    """
+    target = recipe if recipe is not None else recipe_json
+    if not analysis_tasks:
+        return {"prompt_text": "", "raw_response_text": None, "result": recipe, "error": None}
+
+    if parallel:
+        futures = {
+            task: _task_executor.submit(metrics.propagate(_run_single_task), task, target, context)
+            for task in analysis_tasks
+        }
+        task_responses = [(task, future.result()) for task, future in futures.items()]
+        timings["tasks"] = {task: response.pop("elapsed_ms") for task, response in task_responses}
+    else:
+        task_started = time.perf_counter()
+        prompt_parts = prompts.build_recipe_analysis_prompt(analysis_tasks, target, context["dietary_profile"])
+        response = gemini_service.call_gemini(context["model"], prompt_parts, context["developer_mode"], use_cache=context["use_cache"])
+        timings["tasks"] = {"+".join(analysis_tasks): _elapsed_ms(task_started)}
+        task_responses = [("+".join(analysis_tasks), response)]
+
+    merged = dict(recipe) if recipe is not None else {}
+    errors = []
+    for task, response in task_responses:
+        if isinstance(response.get("result"), dict):
+            merged.update(response["result"])
+        if response.get("error"):
+            errors.append(f"{task}: {response['error']}")
 
-    # 2. Build the prompt
-    prompt_parts = prompts.build_recipe_analysis_prompt(tasks, recipe_data, dietary_profile)
-    
-    # 3. Call the central Gemini service
-    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode)
+    return {
+        "prompt_text": "\n\n".join(response["prompt_text"] for _, response in task_responses),
+        "raw_response_text": "\n\n".join(response["raw_response_text"] for _, response in task_responses if response.get("raw_response_text")) or None,
+        "result": None if context["developer_mode"] else (merged if (merged or recipe is not None) else None),
+        # The parsed recipe is still good even if some extra tasks failed.
+        "error": "; ".join(errors) or None,
+    }
 
-    return response_data
\ No newline at end of file
+def _run_single_task(task, recipe, context):
+    """Runs one analysis task on its configured model."""
+    started = time.perf_counter()
+    model = context["models"].get(context["task_models"].get(task), context["model"])
+    prompt_parts = prompts.build_recipe_analysis_prompt([task], recipe, context["dietary_profile"])
+    response = gemini_service.call_gemini(model, prompt_parts, context["developer_mode"], use_cache=context["use_cache"])
+    response["elapsed_ms"] = _elapsed_ms(started)
+    return response
@@ -1,26 +1,166 @@
 # backend/recipe_tools_service.py
 from . import prompts
 from . import gemini_service
+from . import metrics
+from . import similarity
+from .ingredient_parser import ingredient_names
+
+# How many locally-ranked candidates are shown to the model by default.
+DEFAULT_TOP_K = 20
+# In "local" mode, candidates scoring at least this much are reported as similar.
+DEFAULT_LOCAL_THRESHOLD = 0.5
+# Duplicate clustering: links below DUPLICATE_THRESHOLD are ignored, clusters
+# whose every link clears STRONG_DUPLICATE_THRESHOLD need no confirmation.
+DUPLICATE_THRESHOLD = 0.5
+STRONG_DUPLICATE_THRESHOLD = 0.8
+# Keeps the confirmation prompt small however messy the library is.
+MAX_CLUSTERS_TO_CONFIRM = 25
 
 def handle_find_similar(request_json, model):
     """
     Orchestrates the recipe similarity comparison process.
     1. Extracts primary and candidate recipes from the request.
-    2. Builds the prompt using the prompts module.
-    3. Calls the Gemini service to get the result.
+    2. Ranks candidates locally and keeps only the top-k.
+    3. Builds the prompt using the prompts module.
+    4. Calls the Gemini service to get the result.
+
+    With "mode": "local" the ranking is returned directly and no model call is made.
     """
     find_similar_request = request_json['find_similar_request']
     developer_mode = request_json.get("developer_mode", False)
+    use_cache = request_json.get("use_cache", True)
 
     # 1. Extract data
     primary_recipe = find_similar_request.get('primary_recipe', {})
     candidate_recipes = find_similar_request.get('candidate_recipes', [])
+    mode = find_similar_request.get('mode', 'model')
+    top_k = find_similar_request.get('top_k', DEFAULT_TOP_K)
+
+    # 2. Local retrieval stage
+    with metrics.stage("local_rank"):
+        ranked = similarity.rank_candidates(primary_recipe, candidate_recipes, top_k=top_k)
+    ranking = [{"id": candidate.get('id'), "score": score} for candidate, score in ranked]
+
+    if mode == 'local':
+        threshold = find_similar_request.get('min_score', DEFAULT_LOCAL_THRESHOLD)
+        return {
+            "prompt_text": "",
+            "raw_response_text": None,
+            "result": {
+                "similar_recipe_ids": [r["id"] for r in ranking if r["score"] >= threshold],
+                "ranked_candidates": ranking,
+            },
+            "error": None
+        }
+
+    if not ranked and not developer_mode:
+        # Nothing shares a single title word or ingredient; the model can't do better.
+        return {"prompt_text": "", "raw_response_text": None, "result": {"similar_recipe_ids": []}, "error": None}
+
+    # 3. Build the prompt
+    prompt_parts = prompts.build_find_similar_prompt(primary_recipe, [candidate for candidate, _ in ranked])
+
+    # 4. Call the central Gemini service
+    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
+    response_data["ranked_candidates"] = ranking
 
-    # 2. Build the prompt
-    prompt_parts = prompts.build_find_similar_prompt(primary_recipe, candidate_recipes)
-    
-    # 3. Call the central Gemini service
-    response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode)
-    
     # The result from Gemini will be in response_data['result']
-    return response_data
\ No newline at end of file
+    return response_data
+
+def handle_find_duplicates(request_json, model):
+    """
+    Orchestrates library-wide duplicate detection.
+    1. Clusters the whole library locally with MinHash/LSH.
+    2. Sends only the borderline clusters to Gemini for confirmation.
+    3. Returns every cluster with the IDs of its recipes and how it was decided.
+    """
+    find_duplicates_request = request_json['find_duplicates_request']
+    developer_mode = request_json.get("developer_mode", False)
+    use_cache = request_json.get("use_cache", True)
+
+    # 1. Extract data and cluster locally
+    recipes = find_duplicates_request.get('recipes', [])
+    threshold = find_duplicates_request.get('threshold', DUPLICATE_THRESHOLD)
+    confirm_with_model = find_duplicates_request.get('confirm_with_model', True)
+
+    ids = [recipe.get('id', index) for index, recipe in enumerate(recipes)]
+    with metrics.stage("cluster"):
+        clusters = similarity.cluster_duplicates(recipes, threshold, STRONG_DUPLICATE_THRESHOLD)
+
+    duplicate_clusters = []
+    borderline = []
+    for cluster in clusters:
+        entry = {
+            "recipe_ids": [ids[i] for i in cluster["members"]],
+            "score": cluster["max_score"],
+            "status": "strong",
+        }
+        if cluster["borderline"]:
+            entry["status"] = "unconfirmed"
+            if confirm_with_model and len(borderline) < MAX_CLUSTERS_TO_CONFIRM:
+                borderline.append((entry, cluster["members"]))
+                continue
+        duplicate_clusters.append(entry)
+
+    response_data = {"prompt_text": "", "raw_response_text": None, "result": None, "error": None}
+
+    # 2. Ask the model about the borderline clusters only
+    if borderline:
+        compact_clusters = [
+            [{"id": ids[i], "title": recipes[i].get('title', ''), "ingredients": ingredient_names(recipes[i])} for i in members]
+            for _, members in borderline
+        ]
+        prompt_parts = prompts.build_confirm_duplicates_prompt(compact_clusters)
+        response_data = gemini_service.call_gemini(model, prompt_parts, developer_mode, use_cache=use_cache)
+        duplicate_clusters.extend(_apply_confirmations(borderline, response_data.get("result")))
+
+    # 3. Return every cluster
+    response_data["result"] = {"duplicate_clusters": duplicate_clusters}
+    return response_data
+
+def _apply_confirmations(borderline, model_result):
+    """
+    Splits borderline clusters into the groups the model confirmed. A cluster
+    the model confirmed nothing in is still reported, flagged unconfirmed.
+    """
+    groups = model_result.get("duplicate_groups") if isinstance(model_result, dict) else None
+    if not isinstance(groups, list):
+        # No usable answer: report the clusters as they are, flagged unconfirmed.
+        return [entry for entry, _ in borderline]
+
+    results = []
+    for entry, _ in borderline:
+        # The model may echo 12 as "12"; answers use the library's own IDs.
+        members = {str(recipe_id): recipe_id for recipe_id in entry["recipe_ids"]}
+        confirmed = []
+        for group in groups:
+            if not isinstance(group, list):
+                continue
+            matched = list(dict.fromkeys(members[str(recipe_id)] for recipe_id in group if str(recipe_id) in members))
+            if len(matched) > 1:
+                confirmed.append({"recipe_ids": matched, "score": entry["score"], "status": "model_confirmed"})
+        results.extend(confirmed or [entry])
+    return results
+
+def handle_nutrition_batch(request_json):
+    """
+    Re-scores nutrition for many recipes at once with the local nutrition
+    engine. No model is called: ingredients the table can't resolve are listed
+    per recipe so the client can decide whether to run estimateNutrition on them.
+    """
+    nutrition_request = request_json['nutrition_request']
+    recipes = nutrition_request.get('recipes', [])
+    if not isinstance(recipes, list):
+        raise Exception("Invalid request. 'recipes' must be a list.", 400)
+    # Imported here so find-similar and find-duplicates requests never import the nutrition engine.
+    from . import nutrition_engine
+
+    estimates = nutrition_engine.estimate_batch(recipes)
+    results = []
+    for recipe, estimate in zip(recipes, estimates):
+        results.append({
+            "id": recipe.get('id'),
+            "nutritional_info": nutrition_engine.per_serving_info(estimate),
+            "unresolved_ingredients": estimate["unresolved_ingredients"],
+        })
+    return {"result": results, "error": None}
@@ -0,0 +1,392 @@
+# backend/resilience.py
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import metrics
+
+# --- Configuration ---
+# Cloud Functions time out at 60s; leave room to send the response.
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("RECETTE_REQUEST_DEADLINE_SECONDS", "55"))
+# Clients may ask for a shorter budget (in milliseconds) with this header.
+DEADLINE_HEADER = "X-Recette-Deadline-Ms"
+# Retries after the first attempt, for retryable errors only.
+MODEL_MAX_RETRIES = int(os.environ.get("RECETTE_MODEL_MAX_RETRIES", "2"))
+MODEL_BACKOFF_BASE_SECONDS = float(os.environ.get("RECETTE_MODEL_BACKOFF_BASE_SECONDS", "0.5"))
+MODEL_BACKOFF_MAX_SECONDS = float(os.environ.get("RECETTE_MODEL_BACKOFF_MAX_SECONDS", "8"))
+# "off", "p95" (hedge after the model's observed p95) or a fixed delay in milliseconds.
+MODEL_HEDGE = os.environ.get("RECETTE_MODEL_HEDGE", "off").lower()
+# p95 hedging waits for this many samples before it starts hedging.
+HEDGE_MIN_SAMPLES = 20
+# Consecutive failures that open a model's breaker, and how long it stays open.
+BREAKER_FAILURES = int(os.environ.get("RECETTE_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("RECETTE_BREAKER_RESET_SECONDS", "30"))
+# Threads that run model calls with a deadline or hedge. Abandoned calls
+# finish in the background, so this bounds how many can pile up.
+MODEL_CALL_THREADS = int(os.environ.get("RECETTE_MODEL_CALL_THREADS", "32"))
+
+# Errors worth retrying, by class name (google.api_core and requests types
+# are matched without importing them) or by HTTP status code.
+_RETRYABLE_NAMES = {
+    "ServiceUnavailable", "ResourceExhausted", "TooManyRequests", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "BadGateway", "ConnectionError",
+    "ConnectTimeout", "ReadTimeout", "TimeoutError", "RetryError",
+}
+_RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before the model answered."""
+
+
+class CircuitOpen(Exception):
+    """The model's breaker is open; the call was not attempted."""
+
+
+# --- Deadlines ---
+# The deadline is an absolute time.monotonic() value in a context variable,
+# so it follows the request into thread pools (see metrics.propagate).
+# It is always checked before a model call and before a retry, but a call
+# only races it on a worker thread when the deadline is enforced: when it
+# is shorter than the default budget (which the platform's own timeout
+# already backs up), or was started with enforce=True.
+
+_deadline = contextvars.ContextVar("recette_deadline", default=None)
+
+def start_deadline(requested_ms=None, budget_seconds=REQUEST_DEADLINE_SECONDS, enforce=None):
+    """
+    Starts the current request's deadline budget: budget_seconds, or the
+    client's requested_ms if that is shorter. enforce defaults to whether the
+    budget was shortened or an enclosing deadline is enforced.
+    Returns a token for end_deadline.
+    """
+    seconds = budget_seconds
+    try:
+        if requested_ms is not None:
+            seconds = min(seconds, max(0.0, float(requested_ms) / 1000))
+    except ValueError:
+        raise Exception(f"Invalid {DEADLINE_HEADER} header. Expected milliseconds.", 400)
+    if enforce is None:
+        enforce = seconds < budget_seconds or is_enforced()
+    return _deadline.set((time.monotonic() + seconds, enforce))
+
+def end_deadline(token):
+    _deadline.reset(token)
+
+def current_deadline():
+    """The current deadline as an absolute time.monotonic() value, or None."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline[0]
+
+def is_enforced():
+    """True when model calls must be cut off at the deadline rather than just checked against it."""
+    deadline = _deadline.get()
+    return deadline is not None and deadline[1]
+
+def remaining():
+    """Seconds left in the current request's budget, or None when there is no deadline."""
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.monotonic()
+
+def wait_timeout(default):
+    """The remaining budget (never negative) capped at default, or default when there is no deadline."""
+    left = remaining()
+    return default if left is None else max(0.0, min(default, left))
+
+
+def is_retryable(error):
+    """True for transient errors: overload, rate limits, server errors, timeouts and dropped connections."""
+    if isinstance(error, (CircuitOpen, DeadlineExceeded)):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if any(cls.__name__ in _RETRYABLE_NAMES for cls in type(error).__mro__):
+        return True
+    try:
+        return int(getattr(error, "code", None)) in _RETRYABLE_CODES
+    except (TypeError, ValueError):
+        return False
+
+def backoff_delay(attempt, rng=random):
+    """Full-jitter exponential backoff: uniform(0, min(max, base * 2**attempt))."""
+    return rng.uniform(0, min(MODEL_BACKOFF_MAX_SECONDS, MODEL_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+# --- Circuit Breakers ---
+
+class CircuitBreaker:
+    """
+    Stops calling a model that keeps failing. After failure_threshold
+    consecutive failures the breaker opens and calls fail fast with
+    CircuitOpen; after reset_seconds one trial call is let through
+    (half-open), and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def before_call(self):
+        """Raises CircuitOpen unless a call may go ahead."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "closed" or (self.state == "half_open" and not self._trial_in_flight):
+                self._trial_in_flight = self.state == "half_open"
+                return
+            self.stats["rejected"] += 1
+        raise CircuitOpen(f"{self.name} is temporarily unavailable after repeated failures.")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self._failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.stats["opened"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "state": self.state, "consecutive_failures": self._failures}
+
+
+class LatencyTracker:
+    """The last few hundred successful call latencies of one model, for hedging."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+_breakers = {}
+_latencies = {}
+_stats = {"attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+_registry_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MODEL_CALL_THREADS, thread_name_prefix="model-call")
+
+def breaker(model_name):
+    with _registry_lock:
+        if model_name not in _breakers:
+            _breakers[model_name] = CircuitBreaker(model_name)
+            _latencies[model_name] = LatencyTracker()
+        return _breakers[model_name]
+
+def _count(name):
+    with _registry_lock:
+        _stats[name] += 1
+    metrics.count(f"model_{name}")
+
+def hedge_delay(model_name):
+    """Seconds to wait before sending a hedged duplicate, or None for no hedging."""
+    if MODEL_HEDGE in ("", "off", "0"):
+        return None
+    if MODEL_HEDGE == "p95":
+        breaker(model_name)
+        return _latencies[model_name].percentile(0.95)
+    return float(MODEL_HEDGE) / 1000
+
+def get_stats():
+    with _registry_lock:
+        stats = dict(_stats)
+        breakers = dict(_breakers)
+    stats["breakers"] = {name: b.get_stats() for name, b in breakers.items()}
+    return stats
+
+
+# --- Calls ---
+
+def _timed(fn):
+    started = time.perf_counter()
+    return fn(), time.perf_counter() - started
+
+def _attempt(fn, model_name):
+    """
+    One attempt, bounded by the request deadline. With hedging on, a
+    duplicate call goes out if the first hasn't answered after the hedge
+    delay, and whichever finishes first wins. Calls that lose (or outlive
+    the deadline) are left to finish in the background. With neither hedging
+    nor an enforced deadline the call runs inline, on the caller's thread.
+    """
+    hedge = hedge_delay(model_name)
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("The request deadline passed before the model was called.")
+    enforced = is_enforced()
+    if hedge is None and not enforced:
+        return _timed(fn)
+
+    started = time.monotonic()
+    # Each call gets its own copy of the context; a context can't be entered twice at once.
+    first = _executor.submit(metrics.propagate(_timed), fn)
+    pending, error = {first}, None
+    while pending:
+        left = remaining() if enforced else None
+        hedge_due = hedge is not None and len(pending) == 1 and error is None and not first.done()
+        timeout = left
+        if hedge_due:
+            until_hedge = max(0.0, started + hedge - time.monotonic())
+            timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    _count("hedge_wins")
+                return future.result()
+            error = future.exception()
+        if done:
+            continue
+        if left is not None and remaining() <= 0:
+            _count("deadline_exceeded")
+            raise DeadlineExceeded(f"{model_name} did not answer within the request deadline.")
+        if hedge_due:
+            _count("hedges")
+            pending.add(_executor.submit(metrics.propagate(_timed), fn))
+            hedge = None
+    raise error
+
+def _record_error(model_breaker, error):
+    """Tells the breaker about a failed call. Returns whether the error may be retried."""
+    retryable = is_retryable(error)
+    if retryable or isinstance(error, DeadlineExceeded):
+        model_breaker.record_failure()
+    else:
+        # The model answered; the request itself was at fault.
+        model_breaker.record_success()
+    return retryable
+
+def _backoff(attempt, left, rng):
+    """Sleeps before another attempt. Returns False when retries or the remaining budget (left) run out."""
+    if attempt >= MODEL_MAX_RETRIES:
+        return False
+    delay = backoff_delay(attempt, rng)
+    if left is not None and delay >= left:
+        return False
+    _count("retries")
+    with metrics.stage("backoff"):
+        time.sleep(delay)
+    return True
+
+def call_model(model_name, fn, rng=random):
+    """
+    Runs fn (one model call) under the request deadline, retrying retryable
+    errors with full-jitter exponential backoff, hedging slow calls when
+    configured, and failing fast while the model's circuit breaker is open.
+    """
+    model_breaker = breaker(model_name)
+    attempt = 0
+    while True:
+        model_breaker.before_call()
+        _count("attempts")
+        try:
+            result, seconds = _attempt(fn, model_name)
+        except Exception as e:
+            if not _record_error(model_breaker, e) or not _backoff(attempt, remaining(), rng):
+                raise
+            attempt += 1
+            continue
+        model_breaker.record_success()
+        _latencies[model_name].add(seconds)
+        return result
+
+
+# --- Streams ---
+# A streamed reply is consumed after the handler has returned, outside the
+# request's context, so stream_model captures the deadline when it is called.
+
+_END = object()
+
+def _before_deadline(model_name, deadline, enforced, fn, *args):
+    """Runs fn(*args) if the deadline hasn't passed; raced against it on a worker thread when enforced."""
+    left = None if deadline is None else deadline - time.monotonic()
+    if left is not None and left <= 0:
+        _count("deadline_exceeded")
+        raise DeadlineExceeded(f"{model_name} did not finish within the request deadline.")
+    if left is None or not enforced:
+        return fn(*args)
+    future = _executor.submit(metrics.propagate(fn), *args)
+    done, _ = wait([future], timeout=left)
+    if not done:
+        # The abandoned read finishes in the background; the stream is never touched again.
+        _count("deadline_exceeded")
+        raise DeadlineExceeded(f"{model_name} did not finish within the request deadline.")
+    return future.result()
+
+def _chunks(model_name, start, deadline, enforced):
+    iterator = _before_deadline(model_name, deadline, enforced, lambda: iter(start()))
+    while True:
+        chunk = _before_deadline(model_name, deadline, enforced, next, iterator, _END)
+        if chunk is _END:
+            return
+        yield chunk
+
+def stream_model(model_name, start, rng=random):
+    """
+    The streaming counterpart of call_model: returns a generator over the
+    chunks of start()'s iterator (one streamed model call). Opening the
+    stream and waiting for its first chunk are retried like a call; once a
+    chunk has been yielded the reply can't be restarted, so later errors are
+    raised as they come. Every chunk must arrive before the deadline that was
+    current when stream_model was called, and the breaker records how the
+    stream ended.
+    """
+    return _stream(model_name, start, current_deadline(), is_enforced(), rng)
+
+def _stream(model_name, start, deadline, enforced, rng):
+    model_breaker = breaker(model_name)
+    attempt = 0
+    while True:
+        model_breaker.before_call()
+        _count("attempts")
+        chunks = _chunks(model_name, start, deadline, enforced)
+        try:
+            first = next(chunks, _END)
+        except Exception as e:
+            left = None if deadline is None else deadline - time.monotonic()
+            if not _record_error(model_breaker, e) or not _backoff(attempt, left, rng):
+                raise
+            attempt += 1
+            continue
+        break
+
+    try:
+        if first is not _END:
+            yield first
+            yield from chunks
+    except GeneratorExit:
+        # The client went away mid-reply; the model itself was answering.
+        model_breaker.record_success()
+        raise
+    except Exception as e:
+        _record_error(model_breaker, e)
+        raise
+    model_breaker.record_success()
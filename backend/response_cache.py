@@ -0,0 +1,179 @@
+# backend/response_cache.py
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+# All limits can be tuned per deployment without a code change.
+CACHE_MAX_ENTRIES = int(os.environ.get("RECETTE_CACHE_MAX_ENTRIES", "512"))
+CACHE_TTL_SECONDS = float(os.environ.get("RECETTE_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+# The on-disk tier is optional. On Cloud Functions /tmp survives for as long
+# as the instance stays warm, which is exactly the window we care about.
+CACHE_DB_PATH = os.environ.get("RECETTE_CACHE_DB_PATH", "")
+
+
+def _part_fingerprint(part):
+    """
+    Returns a stable byte representation of a single prompt part.
+    Strings are hashed by their text, image Parts by their raw bytes and
+    MIME type, so the same photo always produces the same key.
+    """
+    if isinstance(part, str):
+        return b"s:" + part.encode("utf-8")
+    if isinstance(part, (bytes, bytearray)):
+        return b"b:" + bytes(part)
+
+    inline_data = getattr(part, "inline_data", None)
+    if inline_data is not None and getattr(inline_data, "data", None):
+        mime_type = getattr(inline_data, "mime_type", "") or ""
+        return b"p:" + mime_type.encode("utf-8") + b":" + bytes(inline_data.data)
+
+    # Fall back to the SDK's own serialisation for any other Part type.
+    to_dict = getattr(part, "to_dict", None)
+    if callable(to_dict):
+        return b"d:" + json.dumps(to_dict(), sort_keys=True, default=str).encode("utf-8")
+    return b"r:" + repr(part).encode("utf-8")
+
+
+def make_cache_key(model_name, prompt_parts):
+    """Builds a content-addressed key from the model name and every prompt part."""
+    digest = hashlib.sha256()
+    digest.update(str(model_name).encode("utf-8"))
+    for part in prompt_parts:
+        fingerprint = _part_fingerprint(part)
+        # Length-prefix each part so ["ab", "c"] and ["a", "bc"] never collide.
+        digest.update(len(fingerprint).to_bytes(8, "big"))
+        digest.update(fingerprint)
+    return digest.hexdigest()
+
+
+class _SqliteTier:
+    """A small persistent key/value tier shared by every worker in the instance."""
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, expires_at):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, blob, expires_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self, now):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+
+class ResponseCache:
+    """
+    A two-tier cache for model responses:
+    1. An in-process LRU with an entry limit and a TTL.
+    2. An optional SQLite tier that outlives a single request on a warm instance.
+    Hits from the disk tier are promoted back into memory.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, db_path=CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _SqliteTier(db_path) if db_path else None
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._entries[key]
+
+        if self._disk is not None:
+            value = self._disk.get(key, now)
+            if value is not None:
+                with self._lock:
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                self._store_in_memory(key, value, now + self.ttl_seconds)
+                return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl_seconds
+        self._store_in_memory(key, value, expires_at)
+        if self._disk is not None:
+            self._disk.set(key, value, expires_at)
+        with self._lock:
+            self.stats["stores"] += 1
+
+    def _store_in_memory(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for name in self.stats:
+                self.stats[name] = 0
+        if self._disk is not None:
+            self._disk.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# The shared, process-wide cache used by gemini_service.
+default_cache = ResponseCache()
@@ -0,0 +1,435 @@
+# backend/similarity.py
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from . import single_flight
+from .ingredient_parser import ingredient_names
+
+# --- Text Normalisation ---
+
+# Preparation words and sizes that don't change what an ingredient is.
+DESCRIPTORS = {
+    "fresh", "freshly", "chopped", "diced", "minced", "sliced", "grated", "shredded", "ground",
+    "large", "small", "medium", "whole", "boneless", "skinless", "finely", "roughly", "thinly",
+    "peeled", "crushed", "dried", "frozen", "softened", "melted", "cold", "warm", "hot", "room",
+    "temperature", "optional", "to", "taste", "for", "serving", "garnish", "and", "or", "of", "the",
+    "a", "an", "with", "plus", "extra", "about", "divided", "packed", "cut", "into", "pieces",
+}
+TITLE_STOPWORDS = {"the", "a", "an", "and", "with", "of", "in", "on", "for", "my", "best", "easy", "recipe", "homemade", "simple", "quick"}
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+@lru_cache(maxsize=65536)
+def _singular(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("oes", "ches", "shes", "sses")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+# Libraries repeat the same few hundred ingredient names, so memoise the work.
+@lru_cache(maxsize=65536)
+def normalize_ingredient(name):
+    """Reduces an ingredient name to its core words: 'Fresh Roma Tomatoes, diced' -> 'roma tomato'."""
+    words = [_singular(w) for w in _WORD_RE.findall(str(name).lower()) if w not in DESCRIPTORS]
+    return " ".join(words)
+
+
+def title_words(title):
+    return [_singular(w) for w in _WORD_RE.findall(str(title).lower()) if w not in TITLE_STOPWORDS]
+
+
+@lru_cache(maxsize=65536)
+def _ingredient_terms(name):
+    normalized = normalize_ingredient(name)
+    if not normalized:
+        return ()
+    return ("i:" + normalized,) + tuple("w:" + word for word in normalized.split())
+
+
+def recipe_features(recipe):
+    """
+    Returns the weighted feature bag used for similarity: title words, whole
+    normalised ingredient names and the individual words inside them.
+    """
+    features = {}
+    for word in title_words(recipe.get("title", "")):
+        features["t:" + word] = features.get("t:" + word, 0) + 2
+    for name in ingredient_names(recipe):
+        for term in _ingredient_terms(str(name)):
+            features[term] = features.get(term, 0) + 1
+    return features
+
+
+# --- TF-IDF Ranking ---
+# find_similar requests resend the same library again and again. Feature bags
+# are cached per recipe, keyed by its id and a hash of the fields they are
+# built from, and each distinct library gets a CandidateIndex built once: a
+# sparse term-frequency matrix, document frequencies and MinHash/LSH band
+# tables. A request then only extracts the primary recipe's features and
+# scores candidates with array arithmetic.
+
+FEATURE_CACHE_SIZE = 65536
+INDEX_CACHE_SIZE = 8
+# Libraries at least this large are shortlisted through LSH bands before scoring.
+LSH_MIN_CANDIDATES = int(os.environ.get("RECETTE_SIMILARITY_LSH_MIN_CANDIDATES", "5000"))
+# Two rows per band: on the benchmark library the shortlist keeps about 95% of the exact top 20.
+RANKING_PERMUTATIONS = 256
+RANKING_BANDS = 128
+# Buckets this large are generic ("salt, pepper, oil") and don't narrow anything.
+MAX_RANKING_BUCKET_SIZE = 1000
+
+_feature_cache = OrderedDict()
+_signature_cache = OrderedDict()
+_index_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_index_builds = single_flight.group("candidate_index")
+
+
+def _recipe_key(recipe):
+    ingredients = recipe.get("ingredients")
+    if not isinstance(ingredients, str):
+        ingredients = json.dumps(ingredients, sort_keys=True, default=str)
+    text = f"{recipe.get('title', '')}\x00{ingredients}"
+    return f"{recipe.get('id')}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+
+def _cached(cache, key, build, max_size):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+    value = build()
+    with _cache_lock:
+        cache[key] = value
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+    return value
+
+
+def _band_keys(signatures, bands):
+    """Folds each band of a signature into one uint64 (collisions only widen the shortlist)."""
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    multipliers = np.random.default_rng(2).integers(1, 2 ** 63, size=rows, dtype=np.uint64) | np.uint64(1)
+    # uint64 arithmetic wraps, which is all a bucket key needs.
+    return (signatures[:, :bands * rows].reshape(count, bands, rows) * multipliers).sum(axis=2, dtype=np.uint64)
+
+
+class CandidateIndex:
+    """
+    The precomputed ranking data for one candidate library. signatures holds
+    each candidate's MinHash signature over its feature terms; without it
+    there are no band tables and every request is scored exactly.
+    """
+
+    def __init__(self, feature_bags, signatures=None):
+        self.size = len(feature_bags)
+        self.vocabulary = {}
+        columns, counts = [], []
+        lengths = np.fromiter((len(features) for features in feature_bags), dtype=np.int64, count=self.size)
+        for features in feature_bags:
+            for term, count in features.items():
+                columns.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                counts.append(count)
+        # Row-major (CSR) term frequencies.
+        self.row_starts = np.concatenate(([0], np.cumsum(lengths)))
+        self.columns = np.asarray(columns, dtype=np.int64)
+        self.tf = 1 + np.log(np.asarray(counts, dtype=np.float64))
+        self.document_frequency = np.bincount(self.columns, minlength=len(self.vocabulary))
+        # Column-major postings, for finding every candidate that shares a term.
+        rows = np.repeat(np.arange(self.size), lengths)
+        order = np.argsort(self.columns, kind="stable")
+        self.posting_rows = rows[order]
+        self.posting_starts = np.concatenate(([0], np.cumsum(self.document_frequency)))
+
+        self.band_order = self.band_keys = None
+        if signatures is not None:
+            keys = _band_keys(signatures, RANKING_BANDS)
+            self.band_order = np.argsort(keys, axis=0, kind="stable")
+            self.band_keys = np.take_along_axis(keys, self.band_order, axis=0)
+
+    def shortlist(self, primary_terms):
+        """Candidates sharing at least one LSH band with the primary, or None without band tables."""
+        if self.band_keys is None or not primary_terms:
+            return None
+        keys = _band_keys(minhash_signatures([set(primary_terms)], RANKING_PERMUTATIONS), RANKING_BANDS)[0]
+        members = []
+        for band, key in enumerate(keys):
+            column = self.band_keys[:, band]
+            low, high = np.searchsorted(column, key, side="left"), np.searchsorted(column, key, side="right")
+            if 0 < high - low <= MAX_RANKING_BUCKET_SIZE:
+                members.append(self.band_order[low:high, band])
+        return np.unique(np.concatenate(members)) if members else np.empty(0, dtype=np.int64)
+
+    def overlapping(self, columns):
+        """Candidates sharing at least one of the given term columns."""
+        postings = [self.posting_rows[self.posting_starts[c]:self.posting_starts[c + 1]] for c in columns]
+        return np.unique(np.concatenate(postings)) if postings else np.empty(0, dtype=np.int64)
+
+    def score(self, primary_features, rows):
+        """TF-IDF cosine similarity of the given candidate rows to the primary, as if it were in the library."""
+        document_count = self.size + 1
+        known = {self.vocabulary[term]: count for term, count in primary_features.items() if term in self.vocabulary}
+        unknown = [count for term, count in primary_features.items() if term not in self.vocabulary]
+
+        document_frequency = self.document_frequency.astype(np.float64)
+        primary_columns = np.fromiter(known, dtype=np.int64, count=len(known))
+        document_frequency[primary_columns] += 1
+        idf = np.log((1 + document_count) / (1 + document_frequency)) + 1
+
+        primary_weights = np.zeros(len(self.vocabulary))
+        primary_weights[primary_columns] = (1 + np.log(np.fromiter(known.values(), dtype=np.float64, count=len(known)))) * idf[primary_columns]
+        unknown_idf = math.log((1 + document_count) / 2) + 1
+        primary_norm = math.sqrt(float(primary_weights @ primary_weights) + sum(((1 + math.log(c)) * unknown_idf) ** 2 for c in unknown))
+        if not primary_norm or not len(rows):
+            return np.zeros(len(rows))
+
+        # Gather the CSR entries of just these rows.
+        starts, stops = self.row_starts[rows], self.row_starts[rows + 1]
+        lengths = stops - starts
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(int(lengths.sum()))
+        local_rows = np.repeat(np.arange(len(rows)), lengths)
+        weights = self.tf[entries] * idf[self.columns[entries]]
+
+        norms = np.sqrt(np.bincount(local_rows, weights=weights * weights, minlength=len(rows)))
+        dots = np.bincount(local_rows, weights=weights * primary_weights[self.columns[entries]], minlength=len(rows))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(norms > 0, dots / (norms * primary_norm), 0.0)
+
+
+def _candidate_index(candidate_recipes):
+    keys = [_recipe_key(recipe) for recipe in candidate_recipes]
+    corpus_key = hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()
+
+    def build():
+        bags = [_cached(_feature_cache, key, lambda r=recipe: recipe_features(r), FEATURE_CACHE_SIZE)
+                for key, recipe in zip(keys, candidate_recipes)]
+        if len(bags) < LSH_MIN_CANDIDATES:
+            return CandidateIndex(bags)
+        # Only recipes new to this process are MinHashed.
+        with _cache_lock:
+            known = {key: _signature_cache[key] for key in keys if key in _signature_cache}
+        missing = [i for i, key in enumerate(keys) if key not in known]
+        if missing:
+            fresh = minhash_signatures([set(bags[i]) for i in missing], RANKING_PERMUTATIONS)
+            with _cache_lock:
+                for i, signature in zip(missing, fresh):
+                    known[keys[i]] = _signature_cache[keys[i]] = signature
+                while len(_signature_cache) > FEATURE_CACHE_SIZE:
+                    _signature_cache.popitem(last=False)
+        return CandidateIndex(bags, np.stack([known[key] for key in keys]))
+
+    def build_once():
+        # Concurrent requests for a library that isn't indexed yet share one build.
+        if single_flight.SINGLE_FLIGHT_ENABLED:
+            return _index_builds.do(corpus_key, build)[0]
+        return build()
+
+    return _cached(_index_cache, corpus_key, build_once, INDEX_CACHE_SIZE)
+
+
+def rank_candidates(primary_recipe, candidate_recipes, top_k=None, min_score=0.0):
+    """
+    Ranks candidate recipes by TF-IDF cosine similarity to the primary recipe.
+    Large libraries with a top_k are first narrowed to the candidates sharing
+    an LSH band with the primary; when that finds fewer than top_k matches,
+    every candidate sharing at least one feature is scored instead.
+    Returns a list of (candidate, score) pairs, best first.
+    """
+    index = _candidate_index(candidate_recipes)
+    primary_features = recipe_features(primary_recipe)
+
+    def ranked(rows):
+        scores = np.round(index.score(primary_features, rows), 4)
+        keep = scores > min_score
+        rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((rows, -scores))
+        return [(candidate_recipes[i], s) for i, s in zip(rows[order].tolist(), scores[order].tolist())]
+
+    if top_k:
+        shortlist = index.shortlist(primary_features)
+        if shortlist is not None:
+            scored = ranked(shortlist)
+            if len(scored) >= top_k:
+                return scored[:top_k]
+    columns = [index.vocabulary[term] for term in primary_features if term in index.vocabulary]
+    scored = ranked(index.overlapping(columns))
+    return scored[:top_k] if top_k else scored
+
+
+# --- MinHash / LSH Duplicate Clustering ---
+# Library-wide deduplication can't afford N x N comparisons. Each recipe is
+# reduced to a MinHash signature over its title words and normalised
+# ingredient names; locality-sensitive hashing then only pairs up recipes that
+# collide in at least one band, and those pairs are checked exactly.
+
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32
+# A prime just above 2**32, so (a * x + b) % p stays inside uint64 for 32-bit hashes.
+_MINHASH_PRIME = np.uint64(4294967311)
+_EMPTY_SLOT = np.uint64(np.iinfo(np.uint64).max)
+# Buckets this large are generic ("salt, pepper, oil") rather than duplicates.
+MAX_BUCKET_SIZE = 100
+# Slack allowed between the MinHash estimate and the exact Jaccard threshold.
+ESTIMATE_MARGIN = 0.15
+
+
+def duplicate_shingles(recipe):
+    """Returns the shingle set used for duplicate detection."""
+    shingles = {"t:" + word for word in title_words(recipe.get("title", ""))}
+    for name in ingredient_names(recipe):
+        normalized = normalize_ingredient(str(name))
+        if normalized:
+            shingles.add("i:" + normalized)
+    return shingles
+
+
+@lru_cache(maxsize=131072)
+def _shingle_hash(shingle):
+    return zlib.crc32(shingle.encode("utf-8"))
+
+
+def minhash_signatures(shingle_sets, num_perm=MINHASH_PERMUTATIONS, seed=1):
+    """
+    Computes MinHash signatures for many shingle sets at once.
+    Returns a (len(shingle_sets), num_perm) uint64 array. Work is vectorised per
+    permutation over every shingle in the library, so memory stays linear.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 31, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    lengths = np.fromiter((len(s) for s in shingle_sets), dtype=np.int64, count=len(shingle_sets))
+    flat = np.fromiter((_shingle_hash(s) for shingles in shingle_sets for s in shingles), dtype=np.uint64, count=int(lengths.sum()))
+    signatures = np.full((len(shingle_sets), num_perm), _EMPTY_SLOT, dtype=np.uint64)
+
+    non_empty = lengths > 0
+    if not non_empty.any():
+        return signatures
+    offsets = (np.cumsum(lengths) - lengths)[non_empty]
+    # One contiguous row per permutation, with reused buffers, then one transpose.
+    permuted = np.empty_like(flat)
+    minima = np.empty((num_perm, len(offsets)), dtype=np.uint64)
+    for i in range(num_perm):
+        np.multiply(flat, a[i], out=permuted)
+        np.add(permuted, b[i], out=permuted)
+        np.remainder(permuted, _MINHASH_PRIME, out=permuted)
+        np.minimum.reduceat(permuted, offsets, out=minima[i])
+    signatures[non_empty] = minima.T
+    return signatures
+
+
+@lru_cache(maxsize=MAX_BUCKET_SIZE + 1)
+def _upper_triangle(size):
+    return np.triu_indices(size, 1)
+
+
+def lsh_candidate_pairs(signatures, bands=LSH_BANDS, max_bucket_size=MAX_BUCKET_SIZE):
+    """
+    Returns the unique (i, j) index pairs that share at least one LSH band, as
+    two aligned int64 arrays with i < j.
+    """
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    valid = np.flatnonzero(signatures[:, 0] != _EMPTY_SLOT)
+    firsts, seconds = [], []
+    for band in range(bands):
+        chunk = np.ascontiguousarray(signatures[valid, band * rows:(band + 1) * rows])
+        keys = chunk.view(np.dtype((np.void, chunk.dtype.itemsize * rows))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = np.flatnonzero((counts > 1) & (counts <= max_bucket_size))
+        if not len(shared):
+            continue
+        members = np.isin(inverse, shared)
+        order = np.argsort(inverse[members], kind="stable")
+        bucket_ids = inverse[members][order]
+        indices = valid[members][order]
+        for bucket in np.split(indices, np.flatnonzero(np.diff(bucket_ids)) + 1):
+            upper_i, upper_j = _upper_triangle(len(bucket))
+            firsts.append(bucket[upper_i])
+            seconds.append(bucket[upper_j])
+
+    if not firsts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    encoded = np.unique(np.concatenate(firsts).astype(np.int64) * count + np.concatenate(seconds))
+    return encoded // count, encoded % count
+
+
+def estimated_jaccard(signatures, firsts, seconds, batch_size=65536):
+    """Estimates Jaccard similarity for many pairs from MinHash agreement, in batches."""
+    estimates = np.empty(len(firsts), dtype=np.float64)
+    for start in range(0, len(firsts), batch_size):
+        stop = start + batch_size
+        estimates[start:stop] = (signatures[firsts[start:stop]] == signatures[seconds[start:stop]]).mean(axis=1)
+    return estimates
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def cluster_duplicates(recipes, threshold=0.5, strong_threshold=0.8):
+    """
+    Groups likely duplicates across a whole library in one pass.
+    Returns a list of clusters, each a dict with the member indices, the
+    weakest and strongest pairwise Jaccard score that joined them, and whether
+    every link cleared strong_threshold (clusters that don't are "borderline").
+    """
+    shingle_sets = [duplicate_shingles(recipe) for recipe in recipes]
+    signatures = minhash_signatures(shingle_sets)
+
+    parent = list(range(len(recipes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    firsts, seconds = lsh_candidate_pairs(signatures)
+    # Most band collisions are chance; drop pairs whose MinHash estimate is far
+    # below the threshold before paying for an exact set comparison.
+    keep = estimated_jaccard(signatures, firsts, seconds) >= threshold - ESTIMATE_MARGIN
+    edges = []
+    for i, j in zip(firsts[keep].tolist(), seconds[keep].tolist()):
+        score = jaccard(shingle_sets[i], shingle_sets[j])
+        if score >= threshold:
+            edges.append((i, j, score))
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[root_j] = root_i
+
+    clusters = {}
+    for i, j, score in edges:
+        cluster = clusters.setdefault(find(i), {"members": set(), "min_score": 1.0, "max_score": 0.0})
+        cluster["members"].update((i, j))
+        cluster["min_score"] = min(cluster["min_score"], score)
+        cluster["max_score"] = max(cluster["max_score"], score)
+
+    result = []
+    for cluster in clusters.values():
+        result.append({
+            "members": sorted(cluster["members"]),
+            "min_score": round(cluster["min_score"], 4),
+            "max_score": round(cluster["max_score"], 4),
+            "borderline": cluster["min_score"] < strong_threshold,
+        })
+    result.sort(key=lambda c: (-len(c["members"]), -c["max_score"]))
+    return result
@@ -0,0 +1,115 @@
+# backend/single_flight.py
+import os
+import threading
+from concurrent.futures import CancelledError, Future
+
+# --- Configuration ---
+SINGLE_FLIGHT_ENABLED = os.environ.get("RECETTE_SINGLE_FLIGHT", "1").lower() in ("1", "true", "yes")
+# How long a caller waits on someone else's call before giving up on it.
+# The in-flight call itself is never interrupted.
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.environ.get("RECETTE_SINGLE_FLIGHT_WAIT_SECONDS", "120"))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller (the leader)
+    runs the function, later callers wait for it and share its outcome.
+
+    - An exception raised by the function is raised in every waiting caller;
+      the key is then released, so the next call tries again.
+    - Except for private_errors: failures that belong to the leader alone,
+      such as its own deadline passing. Waiting callers then make the call
+      themselves (one of them leading again) under their own limits.
+    - If the leader is interrupted (any BaseException that isn't an
+      Exception), waiting callers aren't failed with it: one of them retries
+      as the new leader.
+    - A waiting caller that times out stops waiting with TimeoutError; the
+      leader and the other callers are unaffected.
+
+    Results are shared as-is, so callers must not mutate them (or must copy).
+    Keys are only held while a call is in flight; this is not a cache.
+    """
+
+    def __init__(self, name, private_errors=()):
+        self.name = name
+        self.private_errors = tuple(private_errors)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "errors": 0, "cancelled": 0, "timeouts": 0, "retried": 0}
+
+    def do(self, key, fn, timeout=SINGLE_FLIGHT_WAIT_SECONDS):
+        """
+        Returns (result, shared): fn()'s result, and whether it came from a
+        call that another caller was already running.
+        """
+        while True:
+            with self._lock:
+                future = self._in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._in_flight[key] = Future()
+                    self.stats["leaders"] += 1
+                else:
+                    self.stats["coalesced"] += 1
+
+            if leader:
+                return self._lead(key, future, fn), False
+            try:
+                return future.result(timeout=timeout), True
+            except CancelledError:
+                # The leader was interrupted, not failed; take over its call.
+                continue
+            except self.private_errors:
+                # The leader's failure, not the call's (e.g. its shorter deadline); try under our own.
+                with self._lock:
+                    self.stats["retried"] += 1
+                continue
+            except TimeoutError:
+                if future.done():
+                    # The leader's own error (a TimeoutError), shared like any other.
+                    raise
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                raise TimeoutError(f"Timed out after {timeout}s waiting for an identical in-flight {self.name} call")
+
+    def _lead(self, key, future, fn):
+        try:
+            result = fn()
+        except Exception as e:
+            self._release(key, "errors")
+            future.set_exception(e)
+            raise
+        except BaseException:
+            self._release(key, "cancelled")
+            future.cancel()
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
+
+    def _release(self, key, outcome=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if outcome:
+                self.stats[outcome] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._in_flight)}
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+def group(name, private_errors=()):
+    """Returns the process-wide SingleFlight registered under name, creating it on first use."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name, private_errors)
+        return _groups[name]
+
+def get_stats():
+    """Returns the counters of every group, e.g. {"model_calls": {...}, "scrapes": {...}}."""
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: flight.get_stats() for name, flight in groups.items()}
@@ -0,0 +1,37 @@
+# backend/startup_profile.py
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# --- Cold-Start Profiling ---
+# Set RECETTE_STARTUP_PROFILE=1 to log how long the entry point import, each
+# lazily loaded service and the Vertex SDK setup take, one JSON line each.
+# For a per-module breakdown, also run with `python -X importtime`.
+ENABLED = os.environ.get("RECETTE_STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+
+_timings = {}
+
+@contextmanager
+def timed(label):
+    """Records how long the block took under label (a no-op unless enabled)."""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(label, started)
+
+def record(label, started):
+    if not ENABLED:
+        return
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    _timings[label] = elapsed_ms
+    print(json.dumps({"startup_profile": label, "ms": elapsed_ms}), file=sys.stderr)
+
+def report():
+    """Returns every timing recorded so far, in the order they happened."""
+    return dict(_timings)
@@ -0,0 +1,223 @@
+# backend/structured_data.py
+import html
+import json
+import re
+
+from .ingredient_parser import parse_ingredient_line
+
+# --- schema.org Recipe Extraction ---
+# Most large recipe sites already publish their recipe as structured data.
+# When we can find it, we map it straight into the JSON_STRUCTURE_PROMPT shape
+# and the model never has to re-derive it from flattened page text.
+
+_DURATION_RE = re.compile(
+    r"^P(?:(?P<days>\d+(?:\.\d+)?)D)?(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?(?:(?P<minutes>\d+(?:\.\d+)?)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$",
+    re.IGNORECASE,
+)
+
+
+def _is_recipe_type(value):
+    types = value if isinstance(value, list) else [value]
+    return any(isinstance(t, str) and t.rsplit("/", 1)[-1].rsplit(":", 1)[-1] == "Recipe" for t in types)
+
+
+def _clean_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, dict):
+        return _clean_text(value.get("text") or value.get("name") or "")
+    if isinstance(value, list):
+        return _clean_text(value[0]) if value else ""
+    # JSON-LD values often carry escaped HTML; strip tags and collapse whitespace.
+    return " ".join(html.unescape(re.sub(r"<[^>]+>", " ", str(value))).split())
+
+
+def format_duration(value):
+    """Turns an ISO 8601 duration ('PT1H30M') into the '1 hour 30 minutes' style the app shows."""
+    text = _clean_text(value)
+    match = _DURATION_RE.match(text)
+    if not text or not match:
+        return text
+
+    total_minutes = 0.0
+    for unit, factor in (("days", 1440), ("hours", 60), ("minutes", 1), ("seconds", 1 / 60)):
+        if match.group(unit):
+            total_minutes += float(match.group(unit)) * factor
+    total_minutes = int(round(total_minutes))
+    if total_minutes == 0:
+        return ""
+
+    hours, minutes = divmod(total_minutes, 60)
+    pieces = []
+    if hours:
+        pieces.append(f"{hours} hour{'s' if hours != 1 else ''}")
+    if minutes:
+        pieces.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
+    return " ".join(pieces)
+
+
+def _format_servings(value):
+    values = value if isinstance(value, list) else [value]
+    texts = [_clean_text(v) for v in values if _clean_text(v)]
+    if not texts:
+        return ""
+    # Sites often publish ["4", "4 servings"]; the descriptive one reads better.
+    return max(texts, key=len)
+
+
+def _flatten_instructions(value):
+    """Flattens HowToStep/HowToSection trees (or a plain string) into a list of steps."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        lines = [line.strip() for line in re.split(r"\n+|<br\s*/?>|</p>|</li>", value) if line.strip()]
+        return [_clean_text(line) for line in lines if _clean_text(line)]
+    if isinstance(value, list):
+        steps = []
+        for item in value:
+            steps.extend(_flatten_instructions(item))
+        return steps
+    if isinstance(value, dict):
+        if "itemListElement" in value:
+            return _flatten_instructions(value["itemListElement"])
+        text = _clean_text(value.get("text") or value.get("name"))
+        return [text] if text else []
+    return []
+
+
+def _as_list(value, separator=","):
+    """
+    A property that may be a list or a single string. Keywords come as one
+    comma-separated string; ingredients split only on line breaks, since
+    "1 lemon, zested" is one ingredient.
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str) and separator in value:
+        return [v.strip() for v in value.split(separator)]
+    return [value]
+
+
+def normalize_recipe(node):
+    """
+    Maps a schema.org Recipe (as a plain dict of property -> value) into the
+    JSON_STRUCTURE_PROMPT shape. Returns None if the node is too sparse to
+    stand in for a model parse.
+    """
+    ingredients = [
+        parse_ingredient_line(_clean_text(line))
+        for line in _as_list(node.get("recipeIngredient") or node.get("ingredients"), separator="\n")
+        if _clean_text(line)
+    ]
+    instructions = _flatten_instructions(node.get("recipeInstructions"))
+    title = _clean_text(node.get("name") or node.get("headline"))
+
+    if not title or not ingredients or not instructions:
+        return None
+
+    tags = []
+    for key in ("recipeCuisine", "recipeCategory", "keywords"):
+        for tag in _as_list(node.get(key)):
+            tag = _clean_text(tag)
+            if tag and tag.lower() not in {t.lower() for t in tags}:
+                tags.append(tag)
+
+    return {
+        "title": title,
+        "description": _clean_text(node.get("description")),
+        "prep_time": format_duration(node.get("prepTime")),
+        "cook_time": format_duration(node.get("cookTime")),
+        "total_time": format_duration(node.get("totalTime")),
+        "servings": _format_servings(node.get("recipeYield")),
+        "ingredients": ingredients,
+        "instructions": instructions,
+        "other_timings": [],
+        "tags": tags[:7],
+    }
+
+
+# --- JSON-LD ---
+
+def _walk_json_ld(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from _walk_json_ld(item)
+    elif isinstance(data, dict):
+        if _is_recipe_type(data.get("@type")):
+            yield data
+        for key in ("@graph", "mainEntity", "mainEntityOfPage", "itemListElement", "item"):
+            if key in data:
+                yield from _walk_json_ld(data[key])
+
+
+def _find_json_ld(soup):
+    for script in soup.find_all("script", attrs={"type": re.compile(r"ld\+json", re.IGNORECASE)}):
+        raw = script.string or script.get_text() or ""
+        try:
+            data = json.loads(raw, strict=False)
+        except (json.JSONDecodeError, ValueError):
+            continue
+        for node in _walk_json_ld(data):
+            yield node
+
+
+# --- Microdata & RDFa ---
+
+def _property_value(element, value_attrs):
+    for attr in value_attrs:
+        if element.has_attr(attr):
+            return element[attr]
+    return element.get_text(" ", strip=True)
+
+
+def _collect_properties(root, scope_attr, property_attr, value_attrs):
+    """
+    Collects property values under a Microdata/RDFa scope, skipping properties
+    that belong to a nested item (e.g. a Review or a NutritionInformation block).
+    """
+    properties = {}
+    for element in root.find_all(attrs={property_attr: True}):
+        owner = element.find_parent(attrs={scope_attr: True})
+        if owner is not root:
+            continue
+        value = _property_value(element, value_attrs)
+        if element.has_attr(scope_attr):
+            # A nested item, such as a HowToStep, contributes its text.
+            value = {"text": element.get_text(" ", strip=True)}
+        for name in element[property_attr].split():
+            name = name.rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+            properties.setdefault(name, []).append(value)
+
+    # Single-valued properties are stored as scalars, like in JSON-LD.
+    multi_valued = {"recipeIngredient", "ingredients", "recipeInstructions", "keywords"}
+    return {k: (v if k in multi_valued or len(v) > 1 else v[0]) for k, v in properties.items()}
+
+
+def _find_microdata(soup):
+    for root in soup.find_all(attrs={"itemtype": True}):
+        if _is_recipe_type(root["itemtype"].split()):
+            yield _collect_properties(root, "itemscope", "itemprop", ("content", "datetime", "value"))
+
+
+def _find_rdfa(soup):
+    for root in soup.find_all(attrs={"typeof": True}):
+        if _is_recipe_type(root["typeof"].split()):
+            yield _collect_properties(root, "typeof", "property", ("content", "datetime"))
+
+
+def extract_recipe(soup):
+    """
+    Returns the first usable schema.org Recipe on a parsed page, already mapped
+    into the JSON_STRUCTURE_PROMPT shape, or None if the page has none.
+    JSON-LD is tried first, then Microdata, then RDFa.
+    """
+    for finder in (_find_json_ld, _find_microdata, _find_rdfa):
+        for node in finder(soup):
+            recipe = normalize_recipe(node)
+            if recipe:
+                return recipe
+    return None
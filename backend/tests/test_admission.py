@@ -0,0 +1,181 @@
+# backend/tests/test_admission.py
+import threading
+import time
+
+import pytest
+
+from backend import admission, batch_service
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    governor = admission.Governor(admission.MemoryBackend(), limits={"pro": 1}, max_queue=2, queue_seconds=0.5)
+    monkeypatch.setattr(admission, "_default_governor", governor)
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(admission, "CLIENT_RATE_PER_MINUTE", 600.0)
+    monkeypatch.setattr(admission, "CLIENT_BURST", 3.0)
+    return governor
+
+
+# --- Token buckets ---
+
+def test_bucket_allows_the_burst_then_rejects_with_retry_after(governor):
+    for _ in range(3):
+        admission.check_rate("ip:1")
+    with pytest.raises(admission.Rejected) as rejected:
+        admission.check_rate("ip:1")
+    assert rejected.value.args[1] == 429
+    assert rejected.value.retry_after == 1
+    # Other clients have their own bucket.
+    admission.check_rate("ip:2")
+
+
+def test_a_cost_above_the_burst_is_rejected_outright(governor):
+    with pytest.raises(admission.Rejected):
+        admission.check_rate("ip:1", cost=4)
+
+
+def test_envelopes_cost_one_token_whatever_their_size():
+    items = [{"url": f"https://example.com/{i}"} for i in range(500)]
+    assert admission.request_cost({"bulk_import_request": {"items": items}}) == 1
+    assert admission.request_cost({"batch_request": [{}] * 25}) == 1
+    assert admission.request_cost({"job_status_request": {"job_id": "x"}}) == 0
+
+
+def test_meter_item_waits_for_the_refill(governor):
+    for _ in range(3):
+        admission.meter_item("ip:1", 0)
+    started = time.monotonic()
+    admission.meter_item("ip:1", 1.0)
+    # 10 tokens a second.
+    assert 0.05 < time.monotonic() - started < 0.5
+    with pytest.raises(admission.Rejected):
+        admission.meter_item("ip:1", 0)
+
+
+def test_batch_items_each_take_a_token(governor, monkeypatch):
+    monkeypatch.setattr(batch_service, "BATCH_ADMISSION_WAIT_SECONDS", 0.0)
+    token = admission.start_client("ip:1", "ip:1")
+    try:
+        response = batch_service.handle_batch_request(
+            {"batch_request": {"requests": [{"nutrition_request": {}}] * 5, "max_concurrency": 1}},
+            dispatch=lambda payload, images, model: {"ok": True},
+            error_details=lambda e: (e.args[0], e.args[1] if len(e.args) > 1 else 500),
+            handler_for=lambda payload: "nutrition_request",
+        )
+    finally:
+        admission.end_client(token)
+    statuses = [item["status_code"] for item in response["result"]]
+    assert statuses == [200, 200, 200, 429, 429]
+
+
+# --- Governor ---
+
+def _acquire_in_thread(governor, model, priority, results, wait_seconds=None):
+    def run():
+        try:
+            results[priority] = governor.acquire(model, priority, wait_seconds)
+        except admission.Rejected as e:
+            results[priority] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_for_queue(governor, model, depth):
+    give_up_at = time.monotonic() + 2
+    while governor.queue_depths().get(model, 0) < depth:
+        assert time.monotonic() < give_up_at
+        time.sleep(0.005)
+
+
+def test_a_saturated_model_sheds_at_once_without_a_wait(governor):
+    governor.acquire("gemini-pro", "standard")
+    with pytest.raises(admission.Rejected) as rejected:
+        governor.acquire("gemini-pro", "standard", wait_seconds=0)
+    assert rejected.value.reason == "capacity"
+
+
+def test_queued_waiters_are_admitted_by_priority(governor):
+    first = governor.acquire("gemini-pro", "standard")
+    results = {}
+    bulk = _acquire_in_thread(governor, "gemini-pro", "bulk", results)
+    _wait_for_queue(governor, "gemini-pro", 1)
+    interactive = _acquire_in_thread(governor, "gemini-pro", "interactive", results)
+    _wait_for_queue(governor, "gemini-pro", 2)
+
+    governor.release("gemini-pro", first, time.monotonic())
+    interactive.join(1)
+    assert isinstance(results["interactive"], str)
+    assert "bulk" not in results
+    governor.release("gemini-pro", results["interactive"], time.monotonic())
+    bulk.join(1)
+    assert isinstance(results["bulk"], str)
+
+
+def test_a_full_queue_displaces_lower_priority_and_sheds_the_rest(governor):
+    governor.acquire("gemini-pro", "standard")
+    results = {}
+    threads = [_acquire_in_thread(governor, "gemini-pro", "bulk", results)]
+    _wait_for_queue(governor, "gemini-pro", 1)
+    threads.append(_acquire_in_thread(governor, "gemini-pro", "standard", results))
+    _wait_for_queue(governor, "gemini-pro", 2)
+
+    # The queue holds two: a newcomer that outranks no one is shed...
+    with pytest.raises(admission.Rejected) as rejected:
+        governor.acquire("gemini-pro", "bulk")
+    assert rejected.value.reason == "queue_full"
+    # ...while a higher-priority one takes the bulk waiter's place.
+    threads.append(_acquire_in_thread(governor, "gemini-pro", "interactive", results))
+    threads[0].join(1)
+    assert results["bulk"].reason == "displaced"
+    for thread in threads[1:]:
+        thread.join(1)
+    assert results["standard"].reason == "queue_timeout"
+    assert results["interactive"].reason == "queue_timeout"
+    assert governor.get_stats()["rejected"] == {"queue_full": 1, "displaced": 1, "queue_timeout": 2}
+
+
+class SlowBackend(admission.MemoryBackend):
+    def try_acquire(self, model, limit, lease_id, now):
+        time.sleep(0.3)
+        return super().try_acquire(model, limit, lease_id, now)
+
+
+def test_a_slow_backend_does_not_block_other_callers(governor):
+    governor.backend = SlowBackend()
+    results = {}
+    thread = _acquire_in_thread(governor, "gemini-flash", "standard", results)
+    time.sleep(0.05)
+    started = time.monotonic()
+    governor.queue_depths()
+    governor.release("gemini-other", "unknown", time.monotonic())
+    assert time.monotonic() - started < 0.1
+    thread.join(1)
+    assert isinstance(results["standard"], str)
+
+
+# --- Leases ---
+
+def test_release_clears_the_current_lease(governor):
+    model = FakeModel("gemini-pro")
+    lease = admission.admit("recipe_analysis_request", {}, model)
+    assert admission._current_lease.get() is lease
+    lease.release()
+    assert admission._current_lease.get() is admission.NO_LEASE
+    assert governor.backend.in_flight()["gemini-pro"] == 0
+    # The slot is free again for the next request on this thread.
+    admission.admit("recipe_analysis_request", {}, model).release()
+
+
+def test_hold_slot_adds_other_models_to_the_current_lease(governor):
+    lease = admission.admit("recipe_analysis_request", {}, FakeModel("gemini-flash"))
+    admission.hold_slot("gemini-pro")
+    assert governor.backend.in_flight() == {"gemini-flash": 1, "gemini-pro": 1}
+    lease.release()
+    assert governor.backend.in_flight() == {"gemini-flash": 0, "gemini-pro": 0}
+
+
+class FakeModel:
+    def __init__(self, name):
+        self._model_name = name
@@ -0,0 +1,106 @@
+# backend/tests/test_bulk_import.py
+import threading
+import time
+
+import pytest
+
+from backend import bulk_import_service, utils
+from backend.fake_model import FakeGenerativeModel
+
+RECIPE = '{"title": "Soup", "ingredients": [{"name": "carrot", "quantity": "2"}], "instructions": ["Simmer."], "tags": ["vegan"]}'
+
+
+def _error_details(e):
+    return e.args[0], e.args[1] if len(e.args) > 1 and isinstance(e.args[1], int) else 500
+
+
+@pytest.fixture
+def models(request):
+    model = FakeGenerativeModel(RECIPE, model_name=f"test-{request.node.name}")
+    return {"pro": model, "flash": model}
+
+
+def _run(models, items, **options):
+    request_json = {"use_cache": False, "bulk_import_request": {"items": items, "tasks": ["parse", "generateTags"], **options}}
+    return list(bulk_import_service.stream_bulk_import(request_json, models, _error_details))
+
+
+# --- Validation ---
+
+@pytest.mark.parametrize("item", [
+    {"url": 5},
+    "http://[::1",
+    {"url": "ftp://example.com/recipe"},
+    {"url": "https:///no-host"},
+    {"url": "https://example.com:99999/recipe"},
+    {"text": ["not", "a", "string"]},
+    {"id": "no-content"},
+])
+def test_bad_items_are_a_400_before_anything_runs(models, item):
+    with pytest.raises(Exception) as error:
+        _run(models, ["Carrot soup: simmer carrots.", item])
+    assert error.value.args[1] == 400
+    assert "Item 1" in error.value.args[0]
+
+
+@pytest.mark.parametrize("value", ["four", None, [4]])
+def test_non_integer_concurrency_is_a_400(models, value):
+    with pytest.raises(Exception) as error:
+        _run(models, ["Carrot soup."], fetch_concurrency=value)
+    assert error.value.args[1] == 400
+
+
+# --- Pipeline ---
+
+def test_every_item_gets_a_record_then_a_summary(models, monkeypatch):
+    def scrape(url):
+        if "broken" in url:
+            raise Exception("Could not fetch the page.", 404)
+        return None, f"Page text for {url}: carrot soup, simmer."
+    monkeypatch.setattr(utils, "scrape_recipe_from_url", scrape)
+
+    records = _run(models, ["https://a.example/1", "Carrot soup: simmer carrots.", {"id": "x", "url": "https://broken.example/2"}])
+    items, summary = records[:-1], records[-1]
+    assert sorted(r["index"] for r in items) == [0, 1, 2]
+    by_index = {r["index"]: r for r in items}
+    assert by_index[0]["status"] == "ok" and by_index[0]["response"]["result"]["title"] == "Soup"
+    assert by_index[1]["status"] == "ok"
+    assert by_index[2]["stage"] == "fetch" and by_index[2]["status_code"] == 404 and by_index[2]["id"] == "x"
+    assert summary == {**summary, "type": "summary", "total": 3, "ok": 2, "failed": 1, "failed_fetch": 1, "domains": 2}
+
+
+def test_urls_are_interleaved_round_robin_by_domain():
+    items = [{"index": i, "url": url} for i, url in enumerate([
+        "https://a.example/1", "https://a.example/2", "https://a.example/3", "https://b.example/1", "https://c.example/1", "https://b.example/2",
+    ])]
+    order = [item["url"] for item in bulk_import_service._interleave_by_domain(items)]
+    assert order == [
+        "https://a.example/1", "https://b.example/1", "https://c.example/1",
+        "https://a.example/2", "https://b.example/2", "https://a.example/3",
+    ]
+
+
+def test_domain_limiter_caps_concurrency_and_spaces_starts():
+    limiter = bulk_import_service.DomainLimiter(max_concurrent=2, interval=0.05)
+    lock = threading.Lock()
+    active, peak, starts = [0], [0], []
+
+    def fetch():
+        limiter.acquire("a.example")
+        with lock:
+            starts.append(time.monotonic())
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.1)
+        with lock:
+            active[0] -= 1
+        limiter.release("a.example")
+
+    threads = [threading.Thread(target=fetch) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    starts.sort()
+    assert all(later - earlier >= 0.045 for earlier, later in zip(starts, starts[1:]))
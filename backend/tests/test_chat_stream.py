@@ -0,0 +1,71 @@
+# backend/tests/test_chat_stream.py
+import json
+import time
+
+import pytest
+
+from backend import chat_service, resilience
+from backend.fake_model import FakeGenerativeModel, FakeServiceUnavailable
+
+REPLY = "Try a lentil soup with the carrots you have."
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "MODEL_BACKOFF_BASE_SECONDS", 0.0)
+
+
+@pytest.fixture
+def model(request):
+    # Breakers are per model name and live for the whole process.
+    return FakeGenerativeModel(REPLY, model_name=f"test-{request.node.name}", chunk_size=8)
+
+
+def _events(model, deadline_ms=None):
+    request_json = {"chat_request": {"user_message": "What can I cook?", "profile_text": "", "inventory_text": ""}}
+    token = resilience.start_deadline(deadline_ms)
+    try:
+        events = chat_service.stream_chat_request(request_json, model, "ndjson")
+    finally:
+        # The handler returns before the stream is consumed.
+        resilience.end_deadline(token)
+    return [json.loads(line) for line in events]
+
+
+def test_stream_yields_chunks_then_done(model):
+    events = _events(model)
+    chunks = [e["text"] for e in events if e["type"] == "chunk"]
+    assert "".join(chunks) == REPLY
+    assert len(chunks) == -(-len(REPLY) // 8)
+    assert events[-1]["type"] == "done"
+    assert events[-1]["result"] == REPLY
+
+
+def test_failure_before_the_first_chunk_is_retried(model):
+    model.faults = [FakeServiceUnavailable]
+    events = _events(model)
+    assert events[-1]["type"] == "done"
+    assert events[-1]["result"] == REPLY
+    assert len(model.calls) == 2
+
+
+def test_deadline_cuts_off_a_slow_stream_after_the_handler_returned(model):
+    model.chunk_delay = 1.0
+    started = time.monotonic()
+    events = _events(model, deadline_ms=100)
+    assert time.monotonic() - started < 0.8
+    assert [e["type"] for e in events] == ["chunk", "error"]
+    assert "deadline" in events[-1]["error"]
+
+
+def test_failing_streams_open_the_breaker(model, monkeypatch):
+    monkeypatch.setattr(resilience, "MODEL_MAX_RETRIES", 0)
+    model.error_rate = 1.0
+    for _ in range(resilience.BREAKER_FAILURES):
+        assert _events(model)[-1]["type"] == "error"
+    calls = len(model.calls)
+
+    events = _events(model)
+    assert events[-1]["type"] == "error"
+    assert "temporarily unavailable" in events[-1]["error"]
+    assert len(model.calls) == calls
@@ -0,0 +1,63 @@
+# backend/tests/test_chat_summary.py
+import pytest
+
+from backend import admission, chat_service, chat_session_store, resilience
+from backend.fake_model import FakeGenerativeModel, FakeServiceUnavailable
+
+TURNS = [{"role": "user", "text": "I have carrots."}, {"role": "model", "text": "Make soup."}]
+
+
+class RecordingStore:
+    def __init__(self):
+        self.summaries = []
+
+    def save_summary(self, session_id, summary, summarized_turns):
+        self.summaries.append((session_id, summary, summarized_turns))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = RecordingStore()
+    monkeypatch.setattr(chat_session_store, "get_default_store", lambda: store)
+    monkeypatch.setattr(resilience, "MODEL_BACKOFF_BASE_SECONDS", 0.0)
+    return store
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    governor = admission.Governor(admission.MemoryBackend(), limits={})
+    monkeypatch.setattr(admission, "_default_governor", governor)
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", True)
+    return governor
+
+
+@pytest.fixture
+def model(request):
+    return FakeGenerativeModel("The user has carrots; soup was suggested.", model_name=f"test-{request.node.name}")
+
+
+def test_refresh_retries_transient_errors_under_a_slot(store, governor, model):
+    model.faults = [FakeServiceUnavailable]
+    chat_service._refresh_summary("s1", "", TURNS, 2, model)
+    assert store.summaries == [("s1", "The user has carrots; soup was suggested.", 2)]
+    assert len(model.calls) == 2
+    assert governor.get_stats()["admitted"] == 1
+    # The slot is given back when the refresh ends.
+    assert governor.backend.in_flight()[model._model_name] == 0
+
+
+def test_refresh_does_not_call_a_model_whose_breaker_is_open(store, model):
+    model_breaker = resilience.breaker(model._model_name)
+    for _ in range(model_breaker.failure_threshold):
+        model_breaker.record_failure()
+    chat_service._refresh_summary("s1", "", TURNS, 2, model)
+    assert model.calls == []
+    assert store.summaries == []
+
+
+def test_refresh_runs_under_its_own_enforced_deadline(store, model, monkeypatch):
+    monkeypatch.setattr(chat_service, "SUMMARY_DEADLINE_SECONDS", 0.05)
+    model.first_token_delay = 1.0
+    chat_service._refresh_summary("s1", "", TURNS, 2, model)
+    assert store.summaries == []
+    assert resilience.current_deadline() is None
@@ -0,0 +1,49 @@
+# backend/tests/test_content_pruner.py
+import pytest
+
+bs4 = pytest.importorskip("bs4")
+from bs4 import BeautifulSoup
+
+from backend import content_pruner
+
+PAGE = """<html><head><title>Lemon Cake</title></head><body>
+<nav><a href="/">Home</a><a href="/cakes">Cakes</a></nav>
+<div class="content">
+  <p>My grandmother baked this every summer, and the story goes on for a while.</p>
+  <div class="recipe-card">
+    <h2>Ingredients</h2>
+    <ul><li>2 cups flour</li><li>1 tsp baking powder</li><li>3 eggs</li><li>1 lemon, zested</li></ul>
+    <h2>Instructions</h2>
+    <ol><li>Whisk the eggs.</li><li>Fold in the flour.<ol><li>Gently.</li></ol></li><li>Bake for 40 minutes.</li></ol>
+  </div>
+  <div class="comments"><p>2 cups of praise!</p></div>
+</div>
+<footer>Copyright</footer>
+</body></html>"""
+
+
+def test_measure_blocks_matches_get_text():
+    soup = BeautifulSoup(PAGE, "html.parser")
+    stats = content_pruner.measure_blocks(soup)
+    for element in soup.find_all(True):
+        assert stats[id(element)]["text_length"] == len(element.get_text("\n", strip=True))
+    card = soup.find(class_="recipe-card")
+    assert stats[id(card)]["ingredient_lines"] == 4
+    assert stats[id(card)]["headings"] == 2
+    # Direct steps of every ordered list inside, nested ones included.
+    assert stats[id(card)]["ordered_steps"] == 4
+
+
+def test_extract_recipe_text_keeps_the_recipe_block():
+    text = content_pruner.extract_recipe_text(BeautifulSoup(PAGE, "html.parser"))
+    assert text.startswith("Lemon Cake\nIngredients\n2 cups flour")
+    assert "Bake for 40 minutes." in text
+    assert "grandmother" not in text
+    assert "praise" not in text
+    assert "Home" not in text
+
+
+def test_deeply_nested_pages_are_scored():
+    html = "<html><body>" + "<div>" * 300 + "".join(f"<p>{i} cups flour</p>" for i in range(1, 50)) + "</div>" * 300 + "</body></html>"
+    text = content_pruner.extract_recipe_text(BeautifulSoup(html, "html.parser"))
+    assert text.startswith("1 cups flour")
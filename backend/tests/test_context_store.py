@@ -0,0 +1,109 @@
+# backend/tests/test_context_store.py
+import time
+
+import pytest
+
+from backend import context_store
+from backend.context_store import ContextMissing, ContextStore, MemoryBackend, SqliteBackend
+
+PROFILE = {"diet": "vegetarian", "allergies": ["peanut"], "notes": "Très peu de sel"}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    backend = MemoryBackend() if request.param == "memory" else SqliteBackend(path=str(tmp_path / "context.db"))
+    return ContextStore(backend)
+
+
+def test_hashes_ignore_key_order_and_match_the_documented_scheme():
+    import hashlib
+    import json
+    reordered = {"notes": "Très peu de sel", "allergies": ["peanut"], "diet": "vegetarian"}
+    assert context_store.content_hash(PROFILE) == context_store.content_hash(reordered)
+    expected = hashlib.sha256(json.dumps(PROFILE, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")).hexdigest()
+    assert context_store.content_hash(PROFILE) == expected
+    assert context_store.content_hash(PROFILE) != context_store.content_hash({**PROFILE, "diet": "vegan"})
+
+
+def test_refs_resolve_to_the_stored_value(store):
+    ref = store.put(PROFILE)
+    request_json = {"recipe_analysis_request": {"dietary_profile_ref": ref, "tasks": ["parse"]}}
+    store.resolve_refs(request_json)
+    assert request_json == {"recipe_analysis_request": {"dietary_profile": PROFILE, "tasks": ["parse"]}}
+
+
+def test_unknown_refs_are_a_409_listing_every_missing_field(store):
+    request_json = {"meal_suggestion_request": {"dietary_profile_ref": "a" * 64, "inventory_ref": "b" * 64}}
+    with pytest.raises(ContextMissing) as missing:
+        store.resolve_refs(request_json)
+    assert missing.value.args[1] == 409
+    assert sorted(entry["field"] for entry in missing.value.missing) == ["dietary_profile", "inventory"]
+    assert store.get_stats()["misses"] == 2
+
+
+def test_refs_inside_batch_items_are_resolved(store):
+    ref = store.put("no pork")
+    request_json = {"batch_request": {"requests": [
+        {"healthify_recipe_request": {"dietary_profile_ref": ref}},
+        {"nutrition_request": {"recipes": []}},
+    ]}}
+    store.resolve_refs(request_json)
+    assert request_json["batch_request"]["requests"][0] == {"healthify_recipe_request": {"dietary_profile": "no pork"}}
+
+
+def test_an_inline_value_wins_and_is_stored(store):
+    request_json = {"chat_request": {"profile_text": "likes soup", "profile_text_ref": "stale"}}
+    store.resolve_refs(request_json)
+    assert request_json == {"chat_request": {"profile_text": "likes soup"}}
+    assert store.get(context_store.content_hash("likes soup")) == "likes soup"
+
+
+def test_an_oversized_inline_value_is_used_but_not_stored(store, monkeypatch):
+    monkeypatch.setattr(context_store, "CONTEXT_MAX_VALUE_BYTES", 16)
+    request_json = {"chat_request": {"inventory_text": "x" * 100, "inventory_text_ref": "stale"}}
+    store.resolve_refs(request_json)
+    assert request_json == {"chat_request": {"inventory_text": "x" * 100}}
+    assert store.get_stats()["stores"] == 0
+    with pytest.raises(Exception) as error:
+        store.put("x" * 100)
+    assert error.value.args[1] == 413
+
+
+@pytest.mark.parametrize("make_backend", [
+    lambda tmp_path: MemoryBackend(max_entries=2),
+    lambda tmp_path: SqliteBackend(path=str(tmp_path / "context.db"), max_entries=2),
+])
+def test_the_least_recently_used_context_is_evicted(tmp_path, make_backend):
+    store = ContextStore(make_backend(tmp_path))
+    first, second = store.put("first"), store.put("second")
+    time.sleep(0.01)
+    assert store.get(first) == "first"
+    time.sleep(0.01)
+    third = store.put("third")
+    assert store.get(second) is None
+    assert (store.get(first), store.get(third)) == ("first", "third")
+    assert store.get_stats()["evictions"] == 1
+
+
+@pytest.mark.parametrize("make_backend", [
+    lambda tmp_path: MemoryBackend(ttl_seconds=0.05),
+    lambda tmp_path: SqliteBackend(path=str(tmp_path / "context.db"), ttl_seconds=0.05),
+])
+def test_contexts_expire_a_ttl_after_their_last_use(tmp_path, make_backend):
+    store = ContextStore(make_backend(tmp_path))
+    ref = store.put(PROFILE)
+    for _ in range(3):
+        time.sleep(0.03)
+        assert store.get(ref) == PROFILE
+    time.sleep(0.08)
+    assert store.get(ref) is None
+    assert store.backend.size() == 0
+
+
+def test_uploads_return_refs_and_reject_unknown_fields(monkeypatch):
+    monkeypatch.setattr(context_store, "_default_store", ContextStore(MemoryBackend()))
+    result = context_store.handle_context_upload({"context_upload_request": {"dietary_profile": PROFILE}})["result"]
+    assert result == {"dietary_profile_ref": context_store.content_hash(PROFILE)}
+    with pytest.raises(Exception) as error:
+        context_store.handle_context_upload({"context_upload_request": {"recipe": "soup"}})
+    assert error.value.args[1] == 400
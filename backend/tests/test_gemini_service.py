@@ -0,0 +1,30 @@
+# backend/tests/test_gemini_service.py
+import pytest
+
+from backend import gemini_service, response_cache
+from backend.fake_model import FakeGenerativeModel
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "default_cache", response_cache.ResponseCache(db_path=None))
+
+
+def test_mutating_a_miss_result_leaves_the_cached_entry_intact(request):
+    model = FakeGenerativeModel('{"title": "Soup", "tags": ["vegan"]}', model_name=f"test-{request.node.name}")
+    first = gemini_service.call_gemini(model, ["Tag this recipe."])
+    assert first["cache_hit"] is False
+    first["result"]["nutritional_info"] = {"calories": 1}
+    first["result"]["tags"].append("mutated")
+
+    second = gemini_service.call_gemini(model, ["Tag this recipe."])
+    assert second["cache_hit"] is True
+    assert second["result"] == {"title": "Soup", "tags": ["vegan"]}
+    assert len(model.calls) == 1
+
+
+def test_mutating_a_hit_result_leaves_the_cached_entry_intact(request):
+    model = FakeGenerativeModel('{"tags": ["vegan"]}', model_name=f"test-{request.node.name}")
+    gemini_service.call_gemini(model, ["Tag this recipe."])
+    gemini_service.call_gemini(model, ["Tag this recipe."])["result"]["tags"].clear()
+    assert gemini_service.call_gemini(model, ["Tag this recipe."])["result"] == {"tags": ["vegan"]}
@@ -0,0 +1,114 @@
+# backend/tests/test_http_fetcher.py
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.http_fetcher import HttpFetcher
+
+PAGE = b"<html><body><h1>Soup</h1></body></html>"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # path -> (extra headers, body); every request is recorded on the server.
+    routes = {
+        "/fresh": ({"Cache-Control": "max-age=3600"}, PAGE),
+        "/etag": ({"Cache-Control": "no-cache", "ETag": '"v1"'}, PAGE),
+        "/large": ({"Cache-Control": "max-age=3600"}, b"x" * 4096),
+        "/uncacheable": ({}, PAGE),
+        "/lowercase": ({"cache-control": "max-age=3600", "etag": '"v2"'}, PAGE),
+    }
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        headers, body = self.routes[self.path]
+        etag = next((value for name, value in headers.items() if name.lower() == "etag"), None)
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server, path):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_fresh_response_is_served_from_disk(server, tmp_path):
+    fetcher = HttpFetcher(cache_dir=str(tmp_path / "cache"))
+    assert fetcher.fetch(_url(server, "/fresh")) == PAGE
+    assert fetcher.fetch(_url(server, "/fresh")) == PAGE
+    assert len(server.requests) == 1
+    assert fetcher.stats["cache_hits"] == 1
+
+
+def test_stale_response_is_revalidated_with_its_etag(server, tmp_path):
+    fetcher = HttpFetcher(cache_dir=str(tmp_path / "cache"))
+    assert fetcher.fetch(_url(server, "/etag")) == PAGE
+    assert fetcher.fetch(_url(server, "/etag")) == PAGE
+    assert server.requests == [("/etag", None), ("/etag", '"v1"')]
+    assert fetcher.stats["revalidated"] == 1
+
+
+def test_truncated_body_is_capped_and_not_cached(server, tmp_path):
+    cache_dir = tmp_path / "cache"
+    fetcher = HttpFetcher(cache_dir=str(cache_dir), max_bytes=1000)
+    assert fetcher.fetch(_url(server, "/large")) == b"x" * 1000
+    assert fetcher.fetch(_url(server, "/large")) == b"x" * 1000
+    assert len(server.requests) == 2
+    assert fetcher.stats["truncated"] == 2
+    assert not cache_dir.exists()
+
+
+def test_body_exactly_at_the_cap_is_not_truncated(server, tmp_path):
+    fetcher = HttpFetcher(cache_dir=str(tmp_path / "cache"), max_bytes=4096)
+    assert fetcher.fetch(_url(server, "/large")) == b"x" * 4096
+    assert fetcher.fetch(_url(server, "/large")) == b"x" * 4096
+    assert len(server.requests) == 1
+    assert fetcher.stats["truncated"] == 0
+
+
+def test_cache_directory_is_created_on_first_store(server, tmp_path):
+    cache_dir = tmp_path / "cache"
+    fetcher = HttpFetcher(cache_dir=str(cache_dir))
+    assert not cache_dir.exists()
+    fetcher.fetch(_url(server, "/uncacheable"))
+    assert not cache_dir.exists()
+    fetcher.fetch(_url(server, "/fresh"))
+    assert cache_dir.is_dir()
+
+
+def test_lowercase_freshness_headers_survive_revalidation(server, tmp_path):
+    fetcher = HttpFetcher(cache_dir=str(tmp_path / "cache"))
+    url = _url(server, "/lowercase")
+    assert fetcher.fetch(url) == PAGE
+    # Age the entry past its max-age so the next fetch revalidates.
+    meta, body = fetcher.cache.load(url)
+    fetcher.cache.store(url, {**meta, "expires_at": 0})
+
+    assert fetcher.fetch(url) == PAGE
+    # The 304 carried only the ETag; the stored max-age keeps the entry fresh.
+    assert fetcher.fetch(url) == PAGE
+    assert server.requests == [("/lowercase", None), ("/lowercase", '"v2"')]
+    assert fetcher.stats["revalidated"] == 1
+    assert fetcher.stats["cache_hits"] == 1
@@ -0,0 +1,75 @@
+# backend/tests/test_image_preprocessor.py
+import io
+import random
+
+import pytest
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image, ImageDraw
+
+from backend import image_preprocessor
+
+
+def _page(seed, size=(1200, 1600)):
+    """A white page with rows of black word-sized blocks, like a cookbook page."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    y = 80
+    while y < size[1] - 80:
+        x = 80
+        while x < size[0] - 120:
+            width = rng.randint(30, 120)
+            draw.rectangle((x, y, x + width, y + 18), fill="black")
+            x += width + 20
+        y += rng.choice((40, 40, 40, 90))
+    return image
+
+
+def _jpeg(image, quality=90):
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def hash_cache(monkeypatch):
+    cache = image_preprocessor.PerceptualHashCache()
+    monkeypatch.setattr(image_preprocessor, "default_hash_cache", cache)
+    return cache
+
+
+def test_same_client_reuses_a_recompressed_copy():
+    page = _page(1)
+    first = image_preprocessor.prepare_image(_jpeg(page), scope="client-a")
+    again = image_preprocessor.prepare_image(_jpeg(page, quality=40), scope="client-a")
+    assert not first["report"]["reused"]
+    assert again["report"]["reused"]
+    assert again["data"] == first["data"]
+
+
+def test_identical_bytes_are_not_shared_across_clients():
+    data = _jpeg(_page(1))
+    first = image_preprocessor.prepare_image(data, scope="client-a")
+    other = image_preprocessor.prepare_image(data, scope="client-b")
+    assert not other["report"]["reused"]
+    assert other["data"] == first["data"]
+
+
+def test_a_near_match_from_another_client_is_never_served():
+    image_preprocessor.prepare_image(_jpeg(_page(1)), scope="client-a")
+    other = image_preprocessor.prepare_image(_jpeg(_page(1), quality=40), scope="client-b")
+    assert not other["report"]["reused"]
+
+
+def test_different_pages_are_not_matched():
+    first = image_preprocessor.prepare_image(_jpeg(_page(1)), scope="client-a")
+    second = image_preprocessor.prepare_image(_jpeg(_page(2)), scope="client-a")
+    assert not second["report"]["reused"]
+    assert second["data"] != first["data"]
+
+
+def test_unsupported_bytes_are_rejected():
+    with pytest.raises(Exception) as error:
+        image_preprocessor.prepare_image(b"%PDF-1.7 not an image")
+    assert error.value.args[1] == 400
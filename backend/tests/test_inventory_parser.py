@@ -0,0 +1,64 @@
+# backend/tests/test_inventory_parser.py
+import pytest
+
+from backend.inventory_parser import parse_inventory_text, parse_item
+
+LOCATIONS = ["Fridge", "Freezer", "Pantry", "Spice Rack"]
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("2 cans tomatoes", {"name": "tomatoes", "quantity": "2", "unit": "can"}),
+    ("2 cans of tomatoes", {"name": "tomatoes", "quantity": "2", "unit": "can"}),
+    ("1 1/2 cups flour", {"name": "flour", "quantity": "1 1/2", "unit": "cup"}),
+    ("- 500 g ground beef", {"name": "ground beef", "quantity": "500", "unit": "g"}),
+    ("three lemons", {"name": "lemons", "quantity": "3", "unit": ""}),
+    ("half an onion", {"name": "onion", "quantity": "1/2", "unit": ""}),
+    ("half a lemon", {"name": "lemon", "quantity": "1/2", "unit": ""}),
+    ("a bag of rice", {"name": "rice", "quantity": "1", "unit": "bag"}),
+    ("Milk x2", {"name": "Milk", "quantity": "2", "unit": ""}),
+    ("Eggs (12)", {"name": "Eggs", "quantity": "12", "unit": ""}),
+    ("Butter - 2 sticks", {"name": "Butter", "quantity": "2", "unit": "stick"}),
+    ("Milk: 1 gallon", {"name": "Milk", "quantity": "1", "unit": "gallon"}),
+])
+def test_parse_item(line, expected):
+    assert parse_item(line) == expected
+
+
+@pytest.mark.parametrize("line", [
+    "Salt and pepper",
+    "some leftover chili",
+    "2 onions, 3 carrots",
+    "the rest of the birthday cake from last weekend",
+])
+def test_parse_item_leaves_uncertain_lines_to_the_model(line):
+    assert parse_item(line) is None
+
+
+def test_parse_inventory_text_assigns_locations_from_headings():
+    text = "\n".join([
+        "--- FRIDGE ---",
+        "2 cans tomatoes",
+        "half an onion",
+        "",
+        "In the Refrigerator:",
+        "Milk x2",
+        "Cupboard",
+        "* 1 bag of rice",
+        "== GARAGE ==",
+        "3 bottles water",
+        "Pantry:",
+        "Salt and pepper",
+    ])
+    items, unresolved = parse_inventory_text(text, LOCATIONS)
+
+    assert [(item["name"], item["location_name"], item["line_number"]) for item in items] == [
+        ("tomatoes", "Fridge", 1),
+        ("onion", "Fridge", 2),
+        ("Milk", "Fridge", 5),
+        ("rice", "Pantry", 7),
+    ]
+    # Items under an unknown heading and uncertain lines go to the model with their context.
+    assert unresolved == [
+        {"line_number": 9, "text": "3 bottles water", "heading": "GARAGE"},
+        {"line_number": 11, "text": "Salt and pepper", "heading": "Pantry"},
+    ]
@@ -0,0 +1,204 @@
+# backend/tests/test_job_service.py
+import socket
+import time
+
+import pytest
+import urllib3
+
+from backend import admission, job_service, job_store
+
+PUBLIC = "93.184.216.34"
+
+
+def _error_details(e):
+    return e.args[0], e.args[1] if len(e.args) > 1 and isinstance(e.args[1], int) else 500
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = job_store.JobStore(path=str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_store, "_default_store", store)
+    return store
+
+
+@pytest.fixture
+def resolve(monkeypatch):
+    """Answers DNS lookups from a dict of host -> list of addresses, each lookup taking the next answer."""
+    answers = {}
+    lookups = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        lookups.append(host)
+        addresses = answers[host].pop(0) if len(answers[host]) > 1 else answers[host][0]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port)) for address in addresses]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    answers["lookups"] = lookups
+    return answers
+
+
+def _poll(job_id, timeout=2.0):
+    give_up_at = time.monotonic() + timeout
+    while True:
+        job = job_service.handle_job_status({"job_status_request": {"job_id": job_id}})["result"]
+        if job["status"] in (job_store.COMPLETE, job_store.FAILED) or time.monotonic() > give_up_at:
+            return job
+        time.sleep(0.01)
+
+
+# --- Submission and polling ---
+
+def test_a_job_runs_in_the_background_and_can_be_polled(store):
+    def dispatch(request_json, images, model):
+        assert "async" not in request_json
+        return {"result": {"total": 3}, "error": None}
+
+    accepted = job_service.submit({"async": True, "nutrition_request": {"recipes": []}}, None, "nutrition_request", dispatch, _error_details)
+    assert accepted["status"] == job_store.QUEUED
+    assert accepted["poll"] == {"job_status_request": {"job_id": accepted["job_id"]}}
+    job = _poll(accepted["job_id"])
+    assert job["status"] == job_store.COMPLETE
+    assert job["progress"] == 1
+    assert job["response"] == {"result": {"total": 3}, "error": None}
+
+
+def test_a_failing_job_keeps_its_error_and_status_code(store):
+    def dispatch(request_json, images, model):
+        raise Exception("Invalid request. 'recipes' must be a list.", 400)
+
+    accepted = job_service.submit({"nutrition_request": {}}, None, "nutrition_request", dispatch, _error_details)
+    job = _poll(accepted["job_id"])
+    assert job["status"] == job_store.FAILED
+    assert (job["error"], job["status_code"]) == ("Invalid request. 'recipes' must be a list.", 400)
+
+
+def test_jobs_carry_the_submitters_client(store):
+    seen = []
+
+    def dispatch(request_json, images, model):
+        seen.append((admission.current_client(), admission.current_rate_key()))
+        return {}
+
+    token = admission.start_client("ip:1/client:app", "ip:1")
+    try:
+        accepted = job_service.submit({}, None, "nutrition_request", dispatch, _error_details)
+    finally:
+        admission.end_client(token)
+    _poll(accepted["job_id"])
+    assert seen == [("ip:1/client:app", "ip:1")]
+
+
+def test_sync_only_handlers_and_unknown_jobs_are_refused(store):
+    with pytest.raises(Exception) as error:
+        job_service.submit({}, None, "job_status_request", None, _error_details)
+    assert error.value.args[1] == 400
+    with pytest.raises(Exception) as error:
+        job_service.handle_job_status({"job_status_request": {"job_id": "missing"}})
+    assert error.value.args[1] == 404
+    with pytest.raises(Exception) as error:
+        job_service.handle_job_status({"job_status_request": {}})
+    assert error.value.args[1] == 400
+
+
+def test_submissions_beyond_the_pending_limit_get_a_429(store, monkeypatch):
+    monkeypatch.setattr(job_service, "JOB_MAX_PENDING", 0)
+    with pytest.raises(admission.Rejected) as rejected:
+        job_service.submit({}, None, "nutrition_request", None, _error_details)
+    assert rejected.value.reason == "jobs_full"
+
+
+# --- Store ---
+
+def test_fail_stale_fails_only_old_unfinished_jobs(store):
+    for job_id in ("old-queued", "old-running", "old-done"):
+        store.create(job_id, "nutrition_request")
+    store.mark_started("old-running")
+    store.finish("old-done", response={})
+    time.sleep(0.02)
+    store.create("new", "nutrition_request")
+
+    store.fail_stale(0.01, "The job was interrupted.")
+    assert [store.get(job_id)["status"] for job_id in ("old-queued", "old-running", "old-done", "new")] == [
+        job_store.FAILED, job_store.FAILED, job_store.COMPLETE, job_store.QUEUED]
+    assert store.get("old-queued")["error"] == "The job was interrupted."
+
+
+def test_expired_jobs_are_hidden_then_purged(tmp_path):
+    store = job_store.JobStore(path=str(tmp_path / "jobs.db"), ttl_seconds=0.05)
+    store.create("job", "nutrition_request")
+    assert store.get("job") is not None
+    time.sleep(0.1)
+    assert store.get("job") is None
+    store.purge_expired()
+    assert store._conn.execute("SELECT COUNT(*) FROM jobs").fetchone() == (0,)
+
+
+# --- Callbacks ---
+
+@pytest.mark.parametrize("url", ["http://hooks.example.com/done", "https:///done", "ftp://hooks.example.com"])
+def test_callbacks_must_be_https_urls(url):
+    with pytest.raises(Exception) as error:
+        job_service.check_callback_url(url)
+    assert error.value.args[1] == 400
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.0.0.5", "169.254.169.254", "::1", "fd00::1"])
+def test_callbacks_to_internal_addresses_are_refused(resolve, address):
+    resolve["hooks.example.com"] = [[PUBLIC, address]]
+    with pytest.raises(Exception) as error:
+        job_service.check_callback_url("https://hooks.example.com/done")
+    assert "public host" in error.value.args[0]
+
+
+def test_the_allowlist_admits_hosts_and_their_subdomains(resolve, monkeypatch):
+    monkeypatch.setattr(job_service, "JOB_CALLBACK_HOSTS", ["example.com"])
+    resolve["api.example.com"] = [[PUBLIC]]
+    assert job_service.check_callback_url("https://api.example.com/done") == [PUBLIC]
+    with pytest.raises(Exception):
+        job_service.check_callback_url("https://example.org/done")
+    with pytest.raises(Exception):
+        job_service.check_callback_url("https://badexample.com/done")
+
+
+class RecordingPool:
+    posts = []
+
+    def __init__(self, host, port=None, **kwargs):
+        self.host, self.port, self.kwargs = host, port, kwargs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def urlopen(self, method, url, body=None, headers=None, redirect=True):
+        RecordingPool.posts.append({"host": self.host, "port": self.port, "kwargs": self.kwargs, "method": method,
+                                    "url": url, "body": body, "headers": headers, "redirect": redirect})
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    RecordingPool.posts = []
+    monkeypatch.setattr(urllib3, "HTTPSConnectionPool", RecordingPool)
+    return RecordingPool.posts
+
+
+def test_the_callback_connects_to_the_vetted_address(resolve, pool):
+    # A rebinding server answers a public address once, then loopback.
+    resolve["hooks.example.com"] = [[PUBLIC], ["127.0.0.1"]]
+    job_service._notify("https://hooks.example.com:8443/done?job=1", {"job_id": "1"})
+    (post,) = pool
+    assert (post["host"], post["port"]) == (PUBLIC, 8443)
+    assert post["kwargs"]["server_hostname"] == post["kwargs"]["assert_hostname"] == "hooks.example.com"
+    assert post["kwargs"]["cert_reqs"] == "CERT_REQUIRED"
+    assert (post["method"], post["url"], post["redirect"]) == ("POST", "/done?job=1", False)
+    assert post["headers"]["Host"] == "hooks.example.com:8443"
+    assert post["body"] == b'{"job_id": "1"}'
+    assert resolve["lookups"] == ["hooks.example.com"]
+
+
+def test_no_callback_is_sent_once_the_host_turns_internal(resolve, pool):
+    resolve["hooks.example.com"] = [["10.0.0.5"]]
+    job_service._notify("https://hooks.example.com/done", {"job_id": "1"})
+    assert pool == []
@@ -0,0 +1,77 @@
+# backend/tests/test_nutrition_engine.py
+import pytest
+
+from backend import nutrition_engine
+
+
+def _totals(*lines):
+    return nutrition_engine.estimate_recipe({"ingredients": list(lines), "servings": 1})["totals"]
+
+
+def test_volume_is_converted_with_the_foods_density():
+    table = nutrition_engine.get_table()
+    flour = nutrition_engine.match_food("all-purpose flour")
+    assert table.grams(flour, 2, "cup") == pytest.approx(2 * table.grams_per_cup[flour])
+    assert table.grams(flour, 100, "g") == 100
+    assert _totals("2 cups flour")["calories"] == pytest.approx(2 * _totals("1 cup flour")["calories"])
+
+
+def test_the_longest_matching_name_wins():
+    table = nutrition_engine.get_table()
+    assert table.names[nutrition_engine.match_food("low sodium chicken broth")] == "chicken stock"
+    assert table.names[nutrition_engine.match_food("garlic salt")] == "salt"
+
+
+def test_a_container_size_in_the_notes_beats_the_default():
+    assert _totals("1 (15 oz) can chickpeas")["calories"] == pytest.approx(
+        _totals("425.25 g chickpeas")["calories"])
+
+
+@pytest.mark.parametrize("plain, light", [
+    ("2 tbsp soy sauce", "2 tbsp light soy sauce"),
+    ("1 cup brown sugar", "1 cup light brown sugar"),
+    ("2 tbsp olive oil", "2 tbsp light olive oil"),
+    ("1 cup half and half", "1 cup light cream"),
+])
+def test_light_is_not_a_fat_reduction_outside_dairy_and_mayo(plain, light):
+    assert _totals(light) == _totals(plain)
+
+
+@pytest.mark.parametrize("food", ["sour cream", "cream cheese", "mayonnaise"])
+def test_light_dairy_and_mayo_have_half_the_fat(food):
+    plain, light = _totals(f"1 cup {food}"), _totals(f"1 cup light {food}")
+    assert light["fat_grams"] == pytest.approx(plain["fat_grams"] / 2)
+    # The removed fat's energy comes off the calories.
+    assert light["calories"] == pytest.approx(plain["calories"] - 9 * (plain["fat_grams"] - light["fat_grams"]))
+    assert _totals(f"1 cup lite {food}") == light
+
+
+def test_sodium_modifiers_apply_to_any_food():
+    assert _totals("1 tbsp unsalted butter")["sodium_milligrams"] == pytest.approx(
+        _totals("1 tbsp butter")["sodium_milligrams"] * 0.05)
+    assert _totals("2 tbsp low-sodium soy sauce")["sodium_milligrams"] == pytest.approx(
+        _totals("2 tbsp soy sauce")["sodium_milligrams"] * 0.3)
+
+
+def test_unquantified_lines_are_ignored_and_unknown_ones_listed():
+    estimate = nutrition_engine.estimate_recipe({"ingredients": ["salt to taste", "2 cups unobtainium", "1 egg"]})
+    assert estimate["unresolved_ingredients"] == ["2 cup unobtainium"]
+    assert estimate["totals"] == _totals("1 egg")
+
+
+def test_a_batch_matches_recipes_estimated_one_by_one():
+    recipes = [{"ingredients": ["1 cup milk", "2 eggs"], "servings": 2}, {"ingredients": []}, {"ingredients": ["100 g rice"]}]
+    assert nutrition_engine.estimate_batch(recipes) == [nutrition_engine.estimate_recipe(recipe) for recipe in recipes]
+
+
+@pytest.mark.parametrize("value, servings", [(4, 4), ("Serves 8", 8), ("4-6 people", 5), (None, nutrition_engine.DEFAULT_SERVINGS)])
+def test_servings_are_read_from_free_text(value, servings):
+    assert nutrition_engine.parse_servings(value) == servings
+
+
+def test_per_serving_info_adds_extra_totals_and_rounds():
+    estimate = {"totals": dict.fromkeys(nutrition_engine.NUTRIENT_KEYS, 10.0), "servings": 4}
+    info = nutrition_engine.per_serving_info(estimate, {"calories": "30 kcal", "unknown": 5})
+    assert list(info) == list(nutrition_engine.NUTRIENT_KEYS)
+    assert info["calories"] == "10"
+    assert info["fat_grams"] == "2"
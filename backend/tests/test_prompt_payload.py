@@ -0,0 +1,55 @@
+# backend/tests/test_prompt_payload.py
+import json
+
+from backend import metrics
+from backend import prompt_payload
+from backend.content_pruner import estimate_tokens
+
+RECIPE = {
+    "id": 7,
+    "title": "  Lemon   Cake ",
+    "description": "",
+    "created_at": "2024-05-01T10:00:00Z",
+    "image_path": "/images/7.jpg",
+    "servings": 4,
+    "ingredients": json.dumps([{"quantity": 2, "unit": "cups", "name": "flour"}, {"name": "lemon", "notes": "zested"}]),
+}
+
+
+def test_projection_keeps_only_the_task_fields():
+    sent = prompt_payload.recipe_payload("test", RECIPE, ["estimateNutrition"])
+    assert json.loads(sent) == {"title": "Lemon Cake", "servings": 4, "ingredients": ["2 cups flour", "lemon (zested)"]}
+    assert " " not in sent.replace("Lemon Cake", "").replace("2 cups flour", "").replace("lemon (zested)", "")
+
+
+def test_sent_tokens_are_always_recorded_and_savings_sampled_without_metrics(monkeypatch):
+    stats = prompt_payload.PayloadStats()
+    monkeypatch.setattr(prompt_payload, "default_stats", stats)
+    monkeypatch.setattr(prompt_payload, "SAVINGS_SAMPLE_EVERY", 3)
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    dumps = []
+    real_dumps = json.dumps
+    monkeypatch.setattr(prompt_payload.json, "dumps", lambda value, **kwargs: dumps.append(value) or real_dumps(value, **kwargs))
+
+    sent = [prompt_payload.recipe_payload("test", RECIPE, ["similarity"]) for _ in range(4)]
+    entry = stats.get_stats()["handlers"]["test"]
+    assert entry["payloads"] == 4
+    assert entry["sent_tokens"] == sum(estimate_tokens(s) for s in sent)
+    # The first and the fourth were measured; only they were serialized verbatim.
+    assert entry["measured_payloads"] == 2
+    assert dumps.count(RECIPE) == 2
+    assert entry["raw_tokens"] == 2 * estimate_tokens(real_dumps(RECIPE))
+    assert entry["saved_tokens"] == entry["raw_tokens"] - 2 * estimate_tokens(sent[0])
+    assert entry["savings_ratio"] > 0
+
+
+def test_every_payload_is_measured_with_metrics(monkeypatch):
+    stats = prompt_payload.PayloadStats()
+    monkeypatch.setattr(prompt_payload, "default_stats", stats)
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    for _ in range(3):
+        sent = prompt_payload.recipe_payload("test", RECIPE, ["similarity"])
+    entry = stats.get_stats()["handlers"]["test"]
+    assert entry["payloads"] == entry["measured_payloads"] == 3
+    assert entry["sent_tokens"] == 3 * estimate_tokens(sent)
+    assert entry["raw_tokens"] == 3 * estimate_tokens(json.dumps(RECIPE))
@@ -0,0 +1,39 @@
+# backend/tests/test_recipe_tools_service.py
+import json
+
+from backend import recipe_tools_service
+from backend.fake_model import FakeGenerativeModel
+
+SOUP = {"id": 1, "title": "Classic Tomato Basil Soup", "ingredients": ["tomatoes", "basil", "garlic", "onion", "olive oil", "salt", "pepper", "vegetable stock"]}
+SOUP_WITH_CREAM = {"id": 2, "title": "Tomato Basil Soup", "ingredients": ["tomatoes", "basil", "garlic", "onion", "olive oil", "salt", "pepper", "cream"]}
+ROASTED_SOUP = {"id": 3, "title": "Roasted Tomato Soup", "ingredients": ["tomatoes", "garlic", "onion", "olive oil", "salt", "thyme"]}
+COOKIES = {"id": 4, "title": "Chocolate Chip Cookies", "ingredients": ["flour", "butter", "sugar", "eggs", "chocolate chips"]}
+OAT_COOKIES = {"id": 5, "title": "Chocolate Oat Cookies", "ingredients": ["flour", "butter", "sugar", "oats", "chocolate chips"]}
+EXACT_COPY = {**COOKIES, "id": 6}
+
+
+def _find_duplicates(request, recipes, reply):
+    model = FakeGenerativeModel(json.dumps(reply), model_name=f"test-{request.node.name}")
+    request_json = {"use_cache": False, "find_duplicates_request": {"recipes": recipes}}
+    clusters = recipe_tools_service.handle_find_duplicates(request_json, model)["result"]["duplicate_clusters"]
+    return sorted(clusters, key=lambda c: c["recipe_ids"])
+
+
+def test_confirmations_match_ids_whatever_their_json_type(request):
+    clusters = _find_duplicates(request, [SOUP, SOUP_WITH_CREAM, ROASTED_SOUP], {"duplicate_groups": [["1", "2"]]})
+    assert clusters == [{"recipe_ids": [1, 2], "score": 0.7692, "status": "model_confirmed"}]
+
+
+def test_clusters_the_model_confirms_nothing_in_stay_unconfirmed(request):
+    clusters = _find_duplicates(request, [SOUP, SOUP_WITH_CREAM, ROASTED_SOUP, COOKIES, OAT_COOKIES], {"duplicate_groups": [[1, 2]]})
+    assert [(c["recipe_ids"], c["status"]) for c in clusters] == [([1, 2], "model_confirmed"), ([4, 5], "unconfirmed")]
+
+
+def test_strong_clusters_skip_the_model(request):
+    clusters = _find_duplicates(request, [COOKIES, EXACT_COPY, SOUP], {"duplicate_groups": []})
+    assert clusters == [{"recipe_ids": [4, 6], "score": 1.0, "status": "strong"}]
+
+
+def test_an_unusable_answer_reports_clusters_unconfirmed(request):
+    clusters = _find_duplicates(request, [SOUP, SOUP_WITH_CREAM, ROASTED_SOUP], {"groups": "?"})
+    assert clusters == [{"recipe_ids": [1, 2, 3], "score": 0.7692, "status": "unconfirmed"}]
@@ -0,0 +1,116 @@
+# backend/tests/test_resilience.py
+import threading
+import time
+
+import pytest
+
+from backend import resilience
+from backend.fake_model import FakeGenerativeModel, FakeServiceUnavailable
+
+
+class _NoJitter:
+    """An rng whose backoff is always zero, so retries don't sleep."""
+
+    @staticmethod
+    def uniform(low, high):
+        return 0.0
+
+
+@pytest.fixture
+def model_name(request):
+    # Breakers live for the whole process; each test gets its own model.
+    return f"test-{request.node.name}"
+
+
+@pytest.fixture
+def deadline():
+    tokens = []
+
+    def start(requested_ms=None, **kwargs):
+        tokens.append(resilience.start_deadline(requested_ms, **kwargs))
+
+    yield start
+    for token in reversed(tokens):
+        resilience.end_deadline(token)
+
+
+def test_retryable_errors_are_retried(model_name):
+    model = FakeGenerativeModel("ok", faults=[FakeServiceUnavailable, FakeServiceUnavailable])
+    response = resilience.call_model(model_name, lambda: model.generate_content("hi"), rng=_NoJitter)
+    assert response.text == "ok"
+    assert len(model.calls) == 3
+    assert resilience.breaker(model_name).state == "closed"
+
+
+def test_retries_stop_after_max_retries(model_name):
+    model = FakeGenerativeModel("ok", error_rate=1.0)
+    with pytest.raises(FakeServiceUnavailable):
+        resilience.call_model(model_name, lambda: model.generate_content("hi"), rng=_NoJitter)
+    assert len(model.calls) == resilience.MODEL_MAX_RETRIES + 1
+
+
+def test_non_retryable_errors_are_raised_at_once(model_name):
+    model = FakeGenerativeModel("ok", faults=[ValueError("bad prompt")])
+    with pytest.raises(ValueError):
+        resilience.call_model(model_name, lambda: model.generate_content("hi"), rng=_NoJitter)
+    assert len(model.calls) == 1
+    assert resilience.breaker(model_name).state == "closed"
+
+
+def test_calls_run_inline_without_hedging_or_an_enforced_deadline(model_name, deadline):
+    deadline()
+    assert not resilience.is_enforced()
+    threads = []
+    resilience.call_model(model_name, lambda: threads.append(threading.current_thread()))
+    assert threads == [threading.current_thread()]
+
+
+def test_a_shortened_deadline_cuts_off_a_slow_call(model_name, deadline):
+    deadline(50)
+    assert resilience.is_enforced()
+    model = FakeGenerativeModel("ok", first_token_delay=1.0)
+    started = time.monotonic()
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.call_model(model_name, lambda: model.generate_content("hi"), rng=_NoJitter)
+    assert time.monotonic() - started < 0.5
+
+
+def test_an_expired_deadline_skips_the_call(model_name, deadline):
+    deadline(0)
+    model = FakeGenerativeModel("ok")
+    with pytest.raises(resilience.DeadlineExceeded):
+        resilience.call_model(model_name, lambda: model.generate_content("hi"))
+    assert model.calls == []
+
+
+def test_nested_deadlines_inherit_enforcement(deadline):
+    deadline(100)
+    deadline(budget_seconds=60)
+    assert resilience.is_enforced()
+
+
+def test_breaker_opens_after_consecutive_failures(model_name, monkeypatch):
+    monkeypatch.setattr(resilience, "MODEL_MAX_RETRIES", 0)
+    model = FakeGenerativeModel("ok", error_rate=1.0)
+    for _ in range(resilience.BREAKER_FAILURES):
+        with pytest.raises(FakeServiceUnavailable):
+            resilience.call_model(model_name, lambda: model.generate_content("hi"))
+    assert resilience.breaker(model_name).state == "open"
+
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.call_model(model_name, lambda: model.generate_content("hi"))
+    assert len(model.calls) == resilience.BREAKER_FAILURES
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = resilience.CircuitBreaker("trial", failure_threshold=1, reset_seconds=0.01)
+    breaker.record_failure()
+    with pytest.raises(resilience.CircuitOpen):
+        breaker.before_call()
+    time.sleep(0.02)
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(resilience.CircuitOpen):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
@@ -0,0 +1,65 @@
+# backend/tests/test_similarity.py
+import random
+
+import numpy as np
+
+from backend import similarity
+
+SOUP = {"title": "Classic Tomato Basil Soup", "ingredients": ["tomatoes", "basil", "garlic", "onion", "olive oil", "salt", "pepper", "vegetable stock"]}
+SOUP_WITH_CREAM = {"title": "Tomato Basil Soup", "ingredients": ["tomatoes", "basil", "garlic", "onion", "olive oil", "salt", "pepper", "cream"]}
+ROASTED_SOUP = {"title": "Roasted Tomato Soup", "ingredients": ["tomatoes", "garlic", "onion", "olive oil", "salt", "thyme"]}
+COOKIES = {"title": "Chocolate Chip Cookies", "ingredients": ["flour", "butter", "sugar", "eggs", "chocolate chips"]}
+
+
+def test_identical_shingle_sets_get_identical_signatures():
+    sets = [similarity.duplicate_shingles(SOUP), similarity.duplicate_shingles(dict(SOUP)), set()]
+    signatures = similarity.minhash_signatures(sets)
+    assert signatures.shape == (3, similarity.MINHASH_PERMUTATIONS)
+    assert (signatures[0] == signatures[1]).all()
+    # Empty recipes have no signature and are never paired.
+    assert (signatures[2] == np.iinfo(np.uint64).max).all()
+    firsts, seconds = similarity.lsh_candidate_pairs(signatures)
+    assert list(zip(firsts.tolist(), seconds.tolist())) == [(0, 1)]
+
+
+def test_minhash_estimate_tracks_exact_jaccard():
+    first = {f"i:{n}" for n in range(200)}
+    second = {f"i:{n}" for n in range(100, 300)}
+    signatures = similarity.minhash_signatures([first, second])
+    estimate = similarity.estimated_jaccard(signatures, np.array([0]), np.array([1]))[0]
+    assert abs(estimate - similarity.jaccard(first, second)) < 0.1
+
+
+def test_oversized_buckets_are_skipped():
+    signatures = similarity.minhash_signatures([similarity.duplicate_shingles(SOUP)] * 5)
+    firsts, _ = similarity.lsh_candidate_pairs(signatures, max_bucket_size=4)
+    assert len(firsts) == 0
+    firsts, _ = similarity.lsh_candidate_pairs(signatures, max_bucket_size=5)
+    assert len(firsts) == 10
+
+
+def test_clusters_report_members_scores_and_borderline():
+    clusters = similarity.cluster_duplicates([SOUP, COOKIES, dict(SOUP), dict(COOKIES)])
+    assert sorted(c["members"] for c in clusters) == [[0, 2], [1, 3]]
+    assert all(c["min_score"] == c["max_score"] == 1.0 and not c["borderline"] for c in clusters)
+
+    (cluster,) = similarity.cluster_duplicates([SOUP, SOUP_WITH_CREAM, ROASTED_SOUP, COOKIES])
+    assert cluster["members"] == [0, 1, 2]
+    assert cluster["min_score"] == 0.5
+    assert cluster["borderline"]
+
+
+def test_links_below_the_threshold_are_ignored():
+    assert similarity.cluster_duplicates([SOUP, ROASTED_SOUP], threshold=0.6) == []
+    assert similarity.cluster_duplicates([SOUP, COOKIES]) == []
+
+
+def test_planted_duplicates_are_found_in_a_large_library():
+    rng = random.Random(7)
+    letters = "bcdfghjklmnpqrstvwxz"
+    pantry = sorted({"".join(rng.choice(letters) for _ in range(6)) for _ in range(400)})
+    library = [{"title": "", "ingredients": rng.sample(pantry, 8)} for _ in range(2000)]
+    planted = {(n, 2000 + k) for k, n in enumerate(range(0, 2000, 100))}
+    library += [dict(library[n]) for n, _ in sorted(planted)]
+    found = {tuple(c["members"]) for c in similarity.cluster_duplicates(library)}
+    assert planted <= found
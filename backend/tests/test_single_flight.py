@@ -0,0 +1,149 @@
+# backend/tests/test_single_flight.py
+import threading
+import time
+
+import pytest
+
+from backend import gemini_service, resilience, response_cache, single_flight
+from backend.fake_model import FakeGenerativeModel
+
+
+def _followers(flight, key, fn, count):
+    """Starts count callers of key that should all join the call already in flight."""
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = flight.do(key, fn, timeout=2)
+        except BaseException as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def _lead(flight, key, fn):
+    """Runs fn as the leader on a thread; returns the thread, its outcome and an event set once fn is running."""
+    started = threading.Event()
+    outcome = {}
+
+    def wrapped():
+        started.set()
+        return fn()
+
+    def run():
+        try:
+            outcome["result"] = flight.do(key, wrapped)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait(1)
+    return thread, outcome
+
+
+def _wait_for_followers(flight, count):
+    give_up_at = time.monotonic() + 2
+    while flight.stats["coalesced"] < count:
+        assert time.monotonic() < give_up_at
+        time.sleep(0.005)
+
+
+def test_followers_share_the_leaders_result():
+    flight = single_flight.SingleFlight("test")
+    release = threading.Event()
+    leader, outcome = _lead(flight, "k", lambda: release.wait(1) and "answer")
+    threads, results = _followers(flight, "k", lambda: "own call", 3)
+    _wait_for_followers(flight, 3)
+    release.set()
+    for thread in threads + [leader]:
+        thread.join(1)
+    assert outcome["result"] == ("answer", False)
+    assert results == [("answer", True)] * 3
+
+
+def test_an_error_reaches_every_waiter_and_frees_the_key():
+    flight = single_flight.SingleFlight("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(1)
+        raise ValueError("model said no")
+
+    leader, outcome = _lead(flight, "k", fail)
+    threads, results = _followers(flight, "k", lambda: "own call", 2)
+    _wait_for_followers(flight, 2)
+    release.set()
+    for thread in threads + [leader]:
+        thread.join(1)
+    assert isinstance(outcome["error"], ValueError)
+    assert all(isinstance(result, ValueError) and str(result) == "model said no" for result in results)
+    assert flight.get_stats()["errors"] == 1
+    assert flight.do("k", lambda: "fresh") == ("fresh", False)
+
+
+def test_a_leaders_private_error_makes_followers_call_themselves():
+    flight = single_flight.SingleFlight("test", private_errors=(resilience.DeadlineExceeded,))
+    release = threading.Event()
+
+    def leader_times_out():
+        release.wait(1)
+        raise resilience.DeadlineExceeded("leader's deadline")
+
+    calls = []
+
+    def own_call():
+        calls.append(1)
+        time.sleep(0.05)
+        return "answer"
+
+    leader, outcome = _lead(flight, "k", leader_times_out)
+    threads, results = _followers(flight, "k", own_call, 2)
+    _wait_for_followers(flight, 2)
+    release.set()
+    for thread in threads + [leader]:
+        thread.join(1)
+    assert isinstance(outcome["error"], resilience.DeadlineExceeded)
+    # One follower leads the retry and the other joins it.
+    assert sorted(results) == [("answer", False), ("answer", True)]
+    assert len(calls) == 1
+    assert flight.get_stats()["retried"] == 2
+
+
+def test_a_waiter_times_out_on_its_own_without_touching_the_call():
+    flight = single_flight.SingleFlight("test")
+    release = threading.Event()
+    leader, outcome = _lead(flight, "k", lambda: release.wait(1) and "answer")
+    with pytest.raises(TimeoutError, match="waiting for an identical"):
+        flight.do("k", lambda: "own call", timeout=0.05)
+    release.set()
+    leader.join(1)
+    assert outcome["result"] == ("answer", False)
+    assert flight.get_stats()["timeouts"] == 1
+
+
+def test_a_coalesced_model_call_outlives_the_leaders_deadline(request, monkeypatch):
+    monkeypatch.setattr(response_cache, "default_cache", response_cache.ResponseCache(db_path=None))
+    model = FakeGenerativeModel('{"tags": ["soup"]}', model_name=f"test-{request.node.name}", first_token_delay=0.3)
+    outcomes = {}
+
+    def call(name, deadline_ms):
+        token = resilience.start_deadline(deadline_ms)
+        try:
+            outcomes[name] = gemini_service.call_gemini(model, ["Tag this soup."])
+        finally:
+            resilience.end_deadline(token)
+
+    leader = threading.Thread(target=call, args=("leader", 100))
+    leader.start()
+    time.sleep(0.05)
+    follower = threading.Thread(target=call, args=("follower", 5000))
+    follower.start()
+    leader.join(2)
+    follower.join(2)
+    assert "deadline" in outcomes["leader"]["error"]
+    assert outcomes["follower"]["error"] is None
+    assert outcomes["follower"]["result"] == {"tags": ["soup"]}
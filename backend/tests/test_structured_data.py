@@ -0,0 +1,27 @@
+# backend/tests/test_structured_data.py
+from backend.structured_data import normalize_recipe
+
+NODE = {
+    "@type": "Recipe",
+    "name": "Lemon Cake",
+    "recipeInstructions": [{"@type": "HowToStep", "text": "Mix."}, {"@type": "HowToStep", "text": "Bake."}],
+    "keywords": "cake, citrus, Cake",
+}
+
+
+def _ingredient_count(recipe_ingredient):
+    return len(normalize_recipe({**NODE, "recipeIngredient": recipe_ingredient})["ingredients"])
+
+
+def test_a_single_ingredient_string_is_one_ingredient_even_with_commas():
+    assert _ingredient_count("1 lemon, zested") == 1
+
+
+def test_an_ingredient_string_splits_on_line_breaks():
+    assert _ingredient_count("2 cups flour, sifted\n1 lemon, zested\r\n\n3 eggs") == 3
+    assert _ingredient_count(["2 cups flour, sifted", "1 lemon, zested"]) == 2
+
+
+def test_keywords_still_split_on_commas():
+    recipe = normalize_recipe({**NODE, "recipeIngredient": ["3 eggs"]})
+    assert recipe["tags"] == ["cake", "citrus"]
@@ -0,0 +1,107 @@
+# backend/uploads.py
+import json
+import os
+
+# --- Configuration ---
+# Cloud Functions instances have 1Gi; a few full-resolution photos fit comfortably.
+UPLOAD_MAX_BYTES = int(os.environ.get("RECETTE_UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_MAX_IMAGES = int(os.environ.get("RECETTE_UPLOAD_MAX_IMAGES", "10"))
+# Raw uploads carry the JSON request in this header (or a ?request= query parameter).
+REQUEST_HEADER = "X-Recette-Request"
+# Multipart uploads carry it in this form field.
+REQUEST_FIELD = "request"
+
+# --- Binary Image Uploads ---
+# Besides JSON with base64 images, recipe_analyzer_api accepts:
+#   multipart/form-data: a "request" field holding the usual JSON, plus one
+#       file part per page image, in page order.
+#   a raw image body (image/* or application/octet-stream), with the JSON
+#       in the X-Recette-Request header.
+# Both skip base64 (a third larger) and the JSON/str copies of the image.
+
+
+def is_upload(request):
+    """Returns True for request bodies handled here rather than as JSON."""
+    mimetype = request.mimetype or ""
+    return mimetype == "multipart/form-data" or mimetype.startswith("image/") or mimetype == "application/octet-stream"
+
+def _too_large():
+    return Exception(f"Upload is too large. The limit is {UPLOAD_MAX_BYTES / (1024 * 1024):.1f} MB.", 413)
+
+def _check_declared_length(request):
+    if request.content_length is not None and request.content_length > UPLOAD_MAX_BYTES:
+        raise _too_large()
+
+def _read_body(request):
+    """
+    Reads a raw request body. With a declared length it is read in a single
+    allocation of exactly that size (read(n) on the WSGI stream allocates n
+    bytes up front, so never over-ask); chunked bodies are read incrementally
+    up to the cap.
+    """
+    if request.content_length is not None:
+        return request.stream.read(request.content_length)
+    buffer = bytearray()
+    while chunk := request.stream.read(256 * 1024):
+        buffer += chunk
+        if len(buffer) > UPLOAD_MAX_BYTES:
+            raise _too_large()
+    return bytes(buffer)
+
+def _read_part(part, remaining):
+    """Reads one spooled multipart file, sized first so it takes a single exact allocation."""
+    stream = part.stream
+    size = stream.seek(0, 2)
+    stream.seek(0)
+    if size > remaining:
+        raise _too_large()
+    return stream.read(size)
+
+def _parse_request_json(text, source):
+    try:
+        request_json = json.loads(text) if text else None
+    except json.JSONDecodeError as e:
+        raise Exception(f"Invalid JSON. {source} could not be parsed: {e}", 400)
+    if not isinstance(request_json, dict):
+        raise Exception(f"Invalid request. {source} must hold the JSON request.", 400)
+    return request_json
+
+def read_upload(request):
+    """
+    Reads a multipart or raw image upload.
+    Returns (request_json, images), where images is a list of raw image
+    bytes in page order. Uploads are capped at UPLOAD_MAX_BYTES in total and
+    UPLOAD_MAX_IMAGES images.
+    """
+    _check_declared_length(request)
+
+    if request.mimetype != "multipart/form-data":
+        text = request.headers.get(REQUEST_HEADER) or request.args.get(REQUEST_FIELD)
+        request_json = _parse_request_json(text, f"The {REQUEST_HEADER} header")
+        image = _read_body(request)
+        if not image:
+            raise Exception("Invalid request. The upload has no image data.", 400)
+        return request_json, [image]
+
+    if request.content_length is None:
+        # The form parser can't enforce the cap on a body of unknown length.
+        raise Exception("Multipart uploads must declare a Content-Length.", 411)
+    files = request.files
+    request_file = files.get(REQUEST_FIELD)
+    text = request_file.read().decode("utf-8") if request_file else request.form.get(REQUEST_FIELD)
+    request_json = _parse_request_json(text, f"The '{REQUEST_FIELD}' form field")
+
+    parts = [part for name, part in files.items(multi=True) if name != REQUEST_FIELD]
+    if len(parts) > UPLOAD_MAX_IMAGES:
+        raise Exception(f"Too many images. The limit is {UPLOAD_MAX_IMAGES} per request.", 413)
+    images, remaining = [], UPLOAD_MAX_BYTES
+    for part in parts:
+        image = _read_part(part, remaining)
+        # Release the spooled copy now rather than when the request ends.
+        part.close()
+        if image:
+            images.append(image)
+            remaining -= len(image)
+    if not images:
+        raise Exception("Invalid request. The upload has no image files.", 400)
+    return request_json, images
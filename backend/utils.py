@@ -1,14 +1,72 @@
+import copy
+import importlib.util
+
 import requests
 from bs4 import BeautifulSoup
 
-# --- Helper Function for Scraping ---
-def scrape_text_from_url(url):
-    """Scrapes all text from a URL and returns it as a string."""
+from . import content_pruner
+from . import http_fetcher
+from . import metrics
+from . import single_flight
+from . import structured_data
+
+# lxml is several times faster than the pure-Python parser on large pages.
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+# Concurrent imports of the same URL (a shared link going viral) fetch and
+# parse the page once.
+_scrapes = single_flight.group("scrapes")
+
+def _coalesced(key, fn):
+    if not single_flight.SINGLE_FLIGHT_ENABLED:
+        return fn()
+    result, shared = _scrapes.do(key, fn)
+    if shared:
+        metrics.count("coalesced_scrapes")
+    return result
+
+# --- Helper Functions for Scraping ---
+def fetch_html(url):
+    """
+    Downloads a URL and returns the raw page content as bytes.
+    Goes through the shared pooled, cached fetcher so repeat imports of the
+    same page (or host) skip the network where HTTP caching allows it.
+    """
     try:
-        http_headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'}
-        page = requests.get(url, headers=http_headers, timeout=10)
-        page.raise_for_status() # Raises an exception for bad status codes
-        soup = BeautifulSoup(page.content, 'html.parser')
-        return soup.get_text(separator=' ', strip=True)
+        with metrics.stage("fetch"):
+            return http_fetcher.default_fetcher.fetch(url)
     except requests.exceptions.RequestException as e:
         raise Exception(f'Failed to fetch or scrape URL: {e}')
+
+def parse_html(content):
+    """Parses raw page content into a BeautifulSoup tree."""
+    return BeautifulSoup(content, HTML_PARSER)
+
+def html_to_text(soup, max_chars=content_pruner.SCRAPE_MAX_CHARS):
+    """
+    Reduces a parsed page to its main recipe content, capped at max_chars.
+    Navigation, comments and other boilerplate never reach the model.
+    """
+    return content_pruner.extract_recipe_text(soup, max_chars)
+
+def scrape_text_from_url(url, max_chars=content_pruner.SCRAPE_MAX_CHARS):
+    """Scrapes the recipe text from a URL and returns it as a string."""
+    return _coalesced(("text", url, max_chars), lambda: html_to_text(parse_html(fetch_html(url)), max_chars))
+
+def scrape_recipe_from_url(url):
+    """
+    Fetches a URL once and returns (structured_recipe, page_text).
+    If the page publishes a schema.org Recipe, structured_recipe is already in
+    the JSON_STRUCTURE_PROMPT shape and page_text is None. Otherwise
+    structured_recipe is None and page_text holds the text for the model.
+    """
+    recipe, page_text = _coalesced(("recipe", url), lambda: _scrape_recipe(url))
+    # Callers fill the recipe in with their own analysis results.
+    return copy.deepcopy(recipe), page_text
+
+def _scrape_recipe(url):
+    soup = parse_html(fetch_html(url))
+    recipe = structured_data.extract_recipe(soup)
+    if recipe:
+        return recipe, None
+    return None, html_to_text(soup)